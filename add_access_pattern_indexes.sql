@@ -0,0 +1,78 @@
+-- 迁移 002：按实际访问模式补充复合索引
+-- 对应查询：
+--   get_goods_list       WHERE [category=?] [AND status=?] ORDER BY create_time DESC, goods_id DESC（含游标分页）
+--   get_orders           WHERE buyer_id=? [AND status=?] ORDER BY created_at DESC
+--   stat_* 统计          WHERE status='completed' AND completed_at >= ?；WHERE created_at >= ?
+-- 脚本可重复执行：索引已存在时跳过，执行完成后在 schema_migrations 中登记版本
+-- 执行后可运行 python explain_check.py 检查各查询的执行计划
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists$$
+CREATE PROCEDURE add_index_if_not_exists(
+    IN table_name VARCHAR(64),
+    IN index_name VARCHAR(64),
+    IN index_columns TEXT
+)
+BEGIN
+    DECLARE index_exists INT DEFAULT 0;
+    
+    -- 检查索引是否存在
+    SELECT COUNT(*) INTO index_exists
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = table_name
+      AND INDEX_NAME = index_name;
+    
+    -- 如果索引不存在，则添加
+    IF index_exists = 0 THEN
+        SET @sql = CONCAT('ALTER TABLE `', table_name, '` ADD INDEX `', index_name, '` (', index_columns, ')');
+        PREPARE stmt FROM @sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SELECT CONCAT('索引 ', index_name, ' 已添加到表 ', table_name) AS result;
+    ELSE
+        SELECT CONCAT('索引 ', index_name, ' 已存在于表 ', table_name, '，跳过') AS result;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- 1. goods：按状态筛选 + 按发布时间倒序（在售列表、待审核列表）
+CALL add_index_if_not_exists('goods', 'idx_status_create', '`status`, `create_time`, `goods_id`');
+
+-- 2. goods：按分类 + 状态筛选 + 按发布时间倒序（分类页）；仅按分类筛选时同样使用该索引前缀
+CALL add_index_if_not_exists('goods', 'idx_category_status_create', '`category`, `status`, `create_time`, `goods_id`');
+
+-- 3. goods：不带筛选条件的全量列表，按发布时间倒序
+CALL add_index_if_not_exists('goods', 'idx_create', '`create_time`, `goods_id`');
+
+-- 4. order：我的订单按状态筛选 + 按下单时间倒序
+CALL add_index_if_not_exists('order', 'idx_buyer_status_created', '`buyer_id`, `status`, `created_at`');
+
+-- 5. order：我的订单（全部状态）按下单时间倒序
+CALL add_index_if_not_exists('order', 'idx_buyer_created', '`buyer_id`, `created_at`');
+
+-- 6. order：已完成订单按完成时间范围统计
+CALL add_index_if_not_exists('order', 'idx_status_completed', '`status`, `completed_at`');
+
+-- 7. order：近 N 天下单量统计
+CALL add_index_if_not_exists('order', 'idx_created', '`created_at`');
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('002', '按访问模式添加商品、订单复合索引');
+
+-- 验证索引
+SHOW INDEX FROM `goods`;
+SHOW INDEX FROM `order`;
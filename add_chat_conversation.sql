@@ -0,0 +1,49 @@
+-- 迁移 004：会话列表汇总表
+-- chat_conversation 为每个用户的每个会话保存一行（双方各一行）：最后一条消息、最后时间、未读数，
+-- 由 DBManager.send_chat_message 在写入消息的同一事务中维护，CHAT_CONVERSATIONS 一次索引查询即可返回会话列表
+-- 脚本可重复执行：表已存在时跳过建表，回填只补齐缺失的会话
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+CREATE TABLE IF NOT EXISTS `chat_conversation` (
+  `user_id` INT NOT NULL COMMENT '会话所属用户ID',
+  `peer_id` INT NOT NULL COMMENT '对方用户ID',
+  `last_message_id` INT NOT NULL COMMENT '最后一条消息ID',
+  `last_content` VARCHAR(255) NOT NULL DEFAULT '' COMMENT '最后一条消息内容摘要',
+  `last_sender_id` INT NOT NULL COMMENT '最后一条消息的发送者',
+  `last_time` TIMESTAMP NULL DEFAULT NULL COMMENT '最后一条消息时间',
+  `unread_count` INT NOT NULL DEFAULT 0 COMMENT '该用户在此会话中的未读消息数',
+  PRIMARY KEY (`user_id`, `peer_id`),
+  -- 会话列表按最后消息倒序
+  INDEX `idx_user_last_message` (`user_id`, `last_message_id`),
+  FOREIGN KEY (`user_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE,
+  FOREIGN KEY (`peer_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='聊天会话汇总表';
+
+-- 回填：每个 (用户, 对方) 取最后一条消息；历史消息没有已读记录，未读数从 0 开始
+INSERT IGNORE INTO `chat_conversation`
+  (`user_id`, `peer_id`, `last_message_id`, `last_content`, `last_sender_id`, `last_time`, `unread_count`)
+SELECT l.user_id, l.peer_id, c.message_id, LEFT(c.content, 255), c.sender_id, c.sent_at, 0
+FROM (
+    SELECT user_id, peer_id, MAX(message_id) AS message_id
+    FROM (
+        SELECT sender_id AS user_id, receiver_id AS peer_id, message_id FROM `chat`
+        UNION ALL
+        SELECT receiver_id AS user_id, sender_id AS peer_id, message_id FROM `chat`
+    ) AS sides
+    GROUP BY user_id, peer_id
+) AS l
+JOIN `chat` c ON c.message_id = l.message_id;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('004', '新增聊天会话汇总表 chat_conversation');
+
+-- 验证
+SELECT COUNT(*) AS conversations FROM `chat_conversation`;
@@ -0,0 +1,113 @@
+-- 迁移 003：聊天记录按会话键分页
+-- 为 chat 表增加会话键 pair_key = (较小用户ID << 32) | 较大用户ID，两人之间的所有消息共享同一个值，
+-- 并建立 (pair_key, message_id) 索引，CHAT_GET 按 message_id 游标定位，任意翻页都是一次索引范围扫描
+-- 说明：chat 的 sender_id/receiver_id 外键为 ON DELETE CASCADE，MySQL 不允许以其为基列的 STORED 生成列，
+--       因此 pair_key 为普通列，由 DBManager 写入消息时计算，本脚本回填历史数据
+-- 脚本可重复执行
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS add_column_if_not_exists$$
+CREATE PROCEDURE add_column_if_not_exists(
+    IN table_name VARCHAR(64),
+    IN column_name VARCHAR(64),
+    IN column_definition TEXT
+)
+BEGIN
+    DECLARE column_exists INT DEFAULT 0;
+    
+    SELECT COUNT(*) INTO column_exists
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = table_name
+      AND COLUMN_NAME = column_name;
+    
+    IF column_exists = 0 THEN
+        SET @sql = CONCAT('ALTER TABLE `', table_name, '` ADD COLUMN `', column_name, '` ', column_definition);
+        PREPARE stmt FROM @sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SELECT CONCAT('字段 ', column_name, ' 已添加到表 ', table_name) AS result;
+    ELSE
+        SELECT CONCAT('字段 ', column_name, ' 已存在于表 ', table_name, '，跳过') AS result;
+    END IF;
+END$$
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists$$
+CREATE PROCEDURE add_index_if_not_exists(
+    IN table_name VARCHAR(64),
+    IN index_name VARCHAR(64),
+    IN index_columns TEXT
+)
+BEGIN
+    DECLARE index_exists INT DEFAULT 0;
+    
+    SELECT COUNT(*) INTO index_exists
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = table_name
+      AND INDEX_NAME = index_name;
+    
+    IF index_exists = 0 THEN
+        SET @sql = CONCAT('ALTER TABLE `', table_name, '` ADD INDEX `', index_name, '` (', index_columns, ')');
+        PREPARE stmt FROM @sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SELECT CONCAT('索引 ', index_name, ' 已添加到表 ', table_name) AS result;
+    ELSE
+        SELECT CONCAT('索引 ', index_name, ' 已存在于表 ', table_name, '，跳过') AS result;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- 1. 增加会话键字段
+CALL add_column_if_not_exists(
+    'chat',
+    'pair_key',
+    'BIGINT NOT NULL DEFAULT 0 COMMENT ''会话键：(较小用户ID << 32) | 较大用户ID'' AFTER `receiver_id`'
+);
+
+-- 2. 回填历史消息（按主键 message_id 区间分批，每批只扫描 5000 个ID，避免长事务和重复扫描已回填的行）
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS backfill_chat_pair_key$$
+CREATE PROCEDURE backfill_chat_pair_key()
+BEGIN
+    DECLARE last_id BIGINT DEFAULT 0;
+    DECLARE max_id BIGINT DEFAULT 0;
+    SELECT IFNULL(MAX(`message_id`), 0) INTO max_id FROM `chat`;
+    WHILE last_id < max_id DO
+        UPDATE `chat`
+        SET `pair_key` = (LEAST(`sender_id`, `receiver_id`) << 32) | GREATEST(`sender_id`, `receiver_id`)
+        WHERE `message_id` > last_id AND `message_id` <= last_id + 5000
+          AND `pair_key` = 0;
+        SET last_id = last_id + 5000;
+    END WHILE;
+END$$
+
+DELIMITER ;
+
+CALL backfill_chat_pair_key();
+
+-- 3. 会话内按消息ID定位的索引
+CALL add_index_if_not_exists('chat', 'idx_pair_message', '`pair_key`, `message_id`');
+
+DROP PROCEDURE IF EXISTS backfill_chat_pair_key;
+DROP PROCEDURE IF EXISTS add_column_if_not_exists;
+DROP PROCEDURE IF EXISTS add_index_if_not_exists;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('003', '聊天记录增加会话键 pair_key 及 (pair_key, message_id) 索引');
+
+-- 验证
+SHOW INDEX FROM `chat`;
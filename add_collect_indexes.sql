@@ -0,0 +1,55 @@
+-- 迁移 008：收藏列表游标分页
+-- 对应查询：
+--   get_collects(cursor)  WHERE user_id=? ORDER BY collected_at DESC, collect_id DESC（含游标分页）
+-- InnoDB 二级索引末尾隐含主键 collect_id，(user_id, collected_at) 即可支持 (collected_at, collect_id) 游标定位
+-- 收藏状态批量查询（COLLECT_CHECK）加载的 SELECT goods_id ... WHERE user_id=? 由已有的 uk_user_goods 覆盖
+-- 脚本可重复执行：索引已存在时跳过，执行完成后在 schema_migrations 中登记版本
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists$$
+CREATE PROCEDURE add_index_if_not_exists(
+    IN table_name VARCHAR(64),
+    IN index_name VARCHAR(64),
+    IN index_columns TEXT
+)
+BEGIN
+    DECLARE index_exists INT DEFAULT 0;
+    
+    -- 检查索引是否存在
+    SELECT COUNT(*) INTO index_exists
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = table_name
+      AND INDEX_NAME = index_name;
+    
+    -- 如果索引不存在，则添加
+    IF index_exists = 0 THEN
+        SET @sql = CONCAT('ALTER TABLE `', table_name, '` ADD INDEX `', index_name, '` (', index_columns, ')');
+        PREPARE stmt FROM @sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SELECT CONCAT('索引 ', index_name, ' 已添加到表 ', table_name) AS result;
+    ELSE
+        SELECT CONCAT('索引 ', index_name, ' 已存在于表 ', table_name, '，跳过') AS result;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- 1. collect：用户收藏按收藏时间倒序
+CALL add_index_if_not_exists('collect', 'idx_user_collected', '`user_id`, `collected_at`');
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('008', '收藏表增加 (user_id, collected_at) 索引');
@@ -0,0 +1,25 @@
+-- 迁移 010：订单号节点租约表
+-- 订单号（雪花算法）的节点号不再由进程号派生：每个服务进程从本表租用一个节点号（主键保证唯一），
+-- 每隔几秒续约，超过有效期未续约的节点可被其它进程接手；
+-- reserved_ms 登记该节点已使用时间戳的上界，重启或接手后从上界之后继续生成，避免时钟回拨导致重复
+-- 脚本可重复执行，执行完成后在 schema_migrations 中登记版本
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+CREATE TABLE IF NOT EXISTS `id_node_lease` (
+  `node_id` SMALLINT UNSIGNED NOT NULL COMMENT '订单号节点号（0~1023）',
+  `owner` VARCHAR(100) NOT NULL COMMENT '持有者（主机名:进程号:随机串）',
+  `reserved_ms` BIGINT NOT NULL DEFAULT 0 COMMENT '该节点已登记可使用的时间戳上界（Unix 毫秒）',
+  `heartbeat_at` DATETIME(3) NOT NULL COMMENT '最近一次续约时间',
+  PRIMARY KEY (`node_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='订单号节点租约表';
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('010', '新增订单号节点租约表 id_node_lease');
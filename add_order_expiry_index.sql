@@ -0,0 +1,55 @@
+-- 迁移 006：待付款订单超时取消
+-- 后台超时取消任务按下单时间扫描待付款订单：
+--   SELECT ... FROM `order` WHERE status='pending_payment' AND created_at < ? ORDER BY created_at LIMIT ? FOR UPDATE SKIP LOCKED
+-- (status, created_at, order_id) 索引使该查询为一次索引范围扫描，且只锁定本批订单；
+-- 多台服务器同时执行时 SKIP LOCKED 跳过其它实例正在处理的订单（需要 MySQL 8.0+）
+-- 脚本可重复执行：索引已存在时跳过，执行完成后在 schema_migrations 中登记版本
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists$$
+CREATE PROCEDURE add_index_if_not_exists(
+    IN table_name VARCHAR(64),
+    IN index_name VARCHAR(64),
+    IN index_columns TEXT
+)
+BEGIN
+    DECLARE index_exists INT DEFAULT 0;
+    
+    -- 检查索引是否存在
+    SELECT COUNT(*) INTO index_exists
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = table_name
+      AND INDEX_NAME = index_name;
+    
+    -- 如果索引不存在，则添加
+    IF index_exists = 0 THEN
+        SET @sql = CONCAT('ALTER TABLE `', table_name, '` ADD INDEX `', index_name, '` (', index_columns, ')');
+        PREPARE stmt FROM @sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SELECT CONCAT('索引 ', index_name, ' 已添加到表 ', table_name) AS result;
+    ELSE
+        SELECT CONCAT('索引 ', index_name, ' 已存在于表 ', table_name, '，跳过') AS result;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- order：待付款订单按下单时间扫描（超时取消）
+CALL add_index_if_not_exists('order', 'idx_status_created', '`status`, `created_at`, `order_id`');
+
+DROP PROCEDURE IF EXISTS add_index_if_not_exists;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('006', '订单增加 (status, created_at) 索引，用于待付款订单超时取消');
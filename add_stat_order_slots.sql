@@ -0,0 +1,50 @@
+-- 迁移 009：每日订单汇总表分片
+-- 下单、成交都会在业务事务中累加 stat_daily_orders 当天的那一行，行锁持有到提交，
+-- 多台服务器的订单事务在这一行上串行；改为每天多个分片行 (stat_date, slot)，
+-- 写入时随机选择分片，读取时按天求和（分片数见 DBManager.STAT_ORDER_SLOTS）
+-- 已有数据保留在 slot 0，无需回填
+-- 脚本可重复执行：已存在 slot 字段时跳过，执行完成后在 schema_migrations 中登记版本
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS add_stat_order_slot$$
+CREATE PROCEDURE add_stat_order_slot()
+BEGIN
+    DECLARE column_exists INT DEFAULT 0;
+    
+    -- 检查 slot 字段是否存在
+    SELECT COUNT(*) INTO column_exists
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'stat_daily_orders'
+      AND COLUMN_NAME = 'slot';
+    
+    -- 加字段和替换主键在同一条 ALTER 中完成
+    IF column_exists = 0 THEN
+        ALTER TABLE `stat_daily_orders`
+          ADD COLUMN `slot` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '分片号（按天求和）' AFTER `stat_date`,
+          DROP PRIMARY KEY,
+          ADD PRIMARY KEY (`stat_date`, `slot`);
+        SELECT 'stat_daily_orders 已按 (stat_date, slot) 分片' AS result;
+    ELSE
+        SELECT 'stat_daily_orders 已存在 slot 字段，跳过' AS result;
+    END IF;
+END$$
+
+DELIMITER ;
+
+CALL add_stat_order_slot();
+
+DROP PROCEDURE IF EXISTS add_stat_order_slot;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('009', '每日订单汇总表按 (stat_date, slot) 分片');
@@ -0,0 +1,82 @@
+-- 迁移 005：DATA_STAT 统计汇总表
+-- 订单写路径（下单、完成、取消）在同一事务中增量维护以下汇总表，stat_* 统计方法只读这些小表，
+-- 看板查询耗时不再随订单历史增长
+--   stat_daily_orders              每天下单数（按 created_at）与成交数（按 completed_at）
+--   stat_daily_category_completed  每天每分类成交数（热门分类）
+--   stat_user_category             每个买家每分类成交数（偏好分类）
+-- 本脚本建表并根据现有订单回填；之后如需重建可运行 python backfill_stat_rollups.py
+-- 脚本可重复执行（回填前会清空汇总表）
+
+USE `used_goods_platform`;
+
+CREATE TABLE IF NOT EXISTS `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+CREATE TABLE IF NOT EXISTS `stat_daily_orders` (
+  `stat_date` DATE NOT NULL COMMENT '统计日期',
+  `orders` INT NOT NULL DEFAULT 0 COMMENT '当天下单数',
+  `completed` INT NOT NULL DEFAULT 0 COMMENT '当天成交数（按完成时间）',
+  PRIMARY KEY (`stat_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日订单汇总表';
+
+CREATE TABLE IF NOT EXISTS `stat_daily_category_completed` (
+  `stat_date` DATE NOT NULL COMMENT '统计日期（完成时间）',
+  `category` VARCHAR(50) NOT NULL COMMENT '商品分类',
+  `completed` INT NOT NULL DEFAULT 0 COMMENT '当天该分类成交数',
+  PRIMARY KEY (`stat_date`, `category`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日分类成交汇总表';
+
+CREATE TABLE IF NOT EXISTS `stat_user_category` (
+  `buyer_id` INT NOT NULL COMMENT '买家用户ID',
+  `category` VARCHAR(50) NOT NULL COMMENT '商品分类',
+  `completed_count` INT NOT NULL DEFAULT 0 COMMENT '该买家在该分类的成交订单数',
+  PRIMARY KEY (`buyer_id`, `category`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='用户分类成交汇总表';
+
+-- 回填（与 DBManager.rebuild_stat_rollups 相同的口径）
+START TRANSACTION;
+
+DELETE FROM `stat_daily_orders`;
+DELETE FROM `stat_daily_category_completed`;
+DELETE FROM `stat_user_category`;
+
+INSERT INTO `stat_daily_orders` (`stat_date`, `orders`, `completed`)
+SELECT dt, SUM(orders), SUM(completed)
+FROM (
+    SELECT DATE(created_at) AS dt, COUNT(*) AS orders, 0 AS completed
+    FROM `order`
+    WHERE created_at IS NOT NULL
+    GROUP BY DATE(created_at)
+    UNION ALL
+    SELECT DATE(completed_at) AS dt, 0 AS orders, COUNT(*) AS completed
+    FROM `order`
+    WHERE status = 'completed' AND completed_at IS NOT NULL
+    GROUP BY DATE(completed_at)
+) AS t
+GROUP BY dt;
+
+INSERT INTO `stat_daily_category_completed` (`stat_date`, `category`, `completed`)
+SELECT DATE(o.completed_at), g.category, COUNT(*)
+FROM `order` o
+JOIN goods g ON o.goods_id = g.goods_id
+WHERE o.status = 'completed' AND o.completed_at IS NOT NULL
+GROUP BY DATE(o.completed_at), g.category;
+
+INSERT INTO `stat_user_category` (`buyer_id`, `category`, `completed_count`)
+SELECT o.buyer_id, g.category, COUNT(*)
+FROM `order` o
+JOIN goods g ON o.goods_id = g.goods_id
+WHERE o.status = 'completed'
+GROUP BY o.buyer_id, g.category;
+
+COMMIT;
+
+INSERT IGNORE INTO `schema_migrations` (`version`, `description`)
+VALUES ('005', '新增 DATA_STAT 统计汇总表');
+
+-- 验证
+SELECT * FROM `stat_daily_orders` ORDER BY `stat_date` DESC LIMIT 7;
@@ -0,0 +1,34 @@
+"""
+统计汇总表回填工具
+根据订单表全量重建 DATA_STAT 使用的汇总表（stat_daily_orders、stat_daily_category_completed、
+stat_user_category）。首次上线在执行 add_stat_rollups.sql 之后可跳过；
+修复历史数据或调整统计口径后运行本脚本即可
+
+用法：
+    python backfill_stat_rollups.py --password 123456
+"""
+
+import argparse
+import sys
+
+from db_utils import DBManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建 DATA_STAT 统计汇总表")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--database", default="used_goods_platform")
+    args = parser.parse_args()
+
+    db = DBManager(args.host, args.port, args.user, args.password, args.database)
+    success, msg = db.rebuild_stat_rollups()
+    print(msg)
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
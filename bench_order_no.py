@@ -0,0 +1,80 @@
+"""
+订单号生成器压测工具
+多个工作进程（各自一个节点号）× 多个线程并发生成订单号，统计总吞吐，
+并检查全部订单号无重复、每个线程内严格递增
+
+用法：
+    python bench_order_no.py                      # 默认 4 进程 × 4 线程，共 400000 个
+    python bench_order_no.py --processes 8 --per-thread 50000
+"""
+
+import argparse
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+from id_generator import SnowflakeGenerator
+
+TARGET_RATE = 100000  # 目标：每秒 10 万单
+
+
+def generate(args):
+    """工作进程：按给定节点号生成订单号，返回 (订单号列表, 耗时, 是否各线程内递增)"""
+    node_id, threads, per_thread = args
+    generator = SnowflakeGenerator(node_id)
+    results = [None] * threads
+
+    def worker(index):
+        results[index] = [generator.next_order_no() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    # 订单号定长，字符串顺序即数值顺序
+    monotonic = all(all(a < b for a, b in zip(nos, nos[1:])) for nos in results)
+    return [no for nos in results for no in nos], elapsed, monotonic
+
+
+def main():
+    parser = argparse.ArgumentParser(description="订单号生成器压测（唯一性 + 吞吐）")
+    parser.add_argument("--processes", type=int, default=4, help="工作进程数（每个进程一个节点号）")
+    parser.add_argument("--threads", type=int, default=4, help="每个进程的线程数")
+    parser.add_argument("--per-thread", type=int, default=25000, help="每个线程生成的订单号数量")
+    args = parser.parse_args()
+
+    tasks = [(node_id, args.threads, args.per_thread) for node_id in range(args.processes)]
+    with Pool(args.processes) as pool:
+        start = time.perf_counter()
+        outputs = pool.map(generate, tasks)
+        wall = time.perf_counter() - start
+
+    all_nos = [no for nos, _, _ in outputs for no in nos]
+    total = len(all_nos)
+    duplicates = total - len(set(all_nos))
+    monotonic = all(ok for _, _, ok in outputs)
+    # 进程内生成耗时取最慢的进程（不含进程启动开销），作为并发生成的吞吐
+    slowest = max(elapsed for _, elapsed, _ in outputs)
+    rate = total / slowest if slowest else float("inf")
+
+    print(f"进程数: {args.processes}，每进程线程数: {args.threads}，总数: {total}")
+    print(f"生成耗时: {slowest:.3f}s（含进程启动 {wall:.3f}s），吞吐: {rate:,.0f} 个/秒")
+    print(f"重复订单号: {duplicates}，线程内严格递增: {'是' if monotonic else '否'}")
+    print(f"示例: {all_nos[0]}  {all_nos[-1]}")
+
+    if duplicates or not monotonic:
+        print("[FAIL] 订单号存在重复或非递增")
+        sys.exit(1)
+    if rate < TARGET_RATE:
+        print(f"[FAIL] 吞吐低于目标 {TARGET_RATE:,} 个/秒")
+        sys.exit(1)
+    print("[ OK ] 无重复，吞吐达标")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,772 @@
+"""
+进程内缓存工具模块
+提供按字节预算淘汰的 LRU 缓存、计数缓存、列表页缓存、单飞结果缓存、收藏集合缓存、布隆过滤器、登录会话缓存等实现，用于热点数据的内存缓存
+所有缓存均为线程安全，可在多个客户端处理线程之间共享
+"""
+
+import hashlib
+import math
+import secrets
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+class ImageCache:
+    """
+    热点图片 LRU 缓存（按字节预算淘汰）
+    图片内容按 (img_path, variant) 只缓存一份；按商品取主图时经“商品 -> 主图路径”指针命中同一条目，
+    不会按商品和按路径重复缓存、重复占用预算。条目按商品ID建立索引，商品图片变更时整体失效
+    上传图片按内容哈希命名，同一路径的内容不会改变，仅按路径读取、未关联商品的条目无需随商品失效
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_item_bytes: int = 4 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 缓存总字节预算，超出后按最近最少使用淘汰
+            max_item_bytes: 单个图片允许缓存的最大字节数，超大图片直接读盘不入缓存
+        """
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        # (img_path, variant) -> (data, 关联的商品ID集合)，OrderedDict 末尾为最近使用
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[bytes, Set[Any]]]" = OrderedDict()
+        # goods_id -> 该商品关联的缓存 key 集合
+        self._goods_index: Dict[Any, Set[Tuple[str, str]]] = {}
+        # goods_id -> 主图路径
+        self._primary: Dict[Any, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, img_path: str, variant: str) -> Optional[bytes]:
+        """按图片路径取缓存内容，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get((img_path, variant))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((img_path, variant))
+            self.hits += 1
+            return entry[0]
+
+    def get_primary(self, goods_id: Any, variant: str) -> Optional[Tuple[str, bytes]]:
+        """按商品取主图，命中时返回 (img_path, data)，未命中返回 None"""
+        with self._lock:
+            img_path = self._primary.get(goods_id)
+            entry = self._entries.get((img_path, variant)) if img_path else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((img_path, variant))
+            self.hits += 1
+            return img_path, entry[0]
+
+    def put(self, img_path: str, variant: str, data: bytes, goods_id: Any = None, primary: bool = False) -> bool:
+        """
+        写入缓存；图片超过单项上限时不缓存并返回 False
+        Args:
+            goods_id: 图片所属商品（可选），商品失效时一并删除
+            primary: 是否为该商品的主图（记录主图指针，供 get_primary 命中）
+        """
+        size = len(data)
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return False
+
+        key = (img_path, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = (data, set())
+                self._entries[key] = entry
+                self._bytes += size
+            else:
+                self._entries.move_to_end(key)
+            if goods_id is not None:
+                entry[1].add(goods_id)
+                self._goods_index.setdefault(goods_id, set()).add(key)
+                if primary:
+                    self._primary[goods_id] = img_path
+
+            # 超出字节预算时从最久未使用的一端淘汰
+            while self._bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return True
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """删除单个条目（调用方需持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[0])
+        for goods_id in entry[1]:
+            keys = self._goods_index.get(goods_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._goods_index[goods_id]
+                    self._primary.pop(goods_id, None)
+
+    def invalidate_goods(self, goods_id: Any) -> int:
+        """商品图片发生变化时，删除主图指针和该商品关联的全部缓存条目，返回删除数量"""
+        with self._lock:
+            self._primary.pop(goods_id, None)
+            keys = list(self._goods_index.get(goods_id, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._goods_index.clear()
+            self._primary.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等指标"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "items": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class GoodsCountCache:
+    """
+    商品计数缓存：维护 (category, status) -> 商品数 的计数矩阵
+    任意筛选组合（分类、状态均可为空）的总数由矩阵求和得到，列表请求无需再执行 COUNT(*)；
+    写路径增量维护矩阵，超过对账周期后用一条 GROUP BY 查询与数据库重新对账
+    （爬虫等绕过 DBManager 直接写库造成的偏差也会在对账时修正）
+    """
+
+    def __init__(self, reconcile_interval: float = 300.0, retry_interval: float = 5.0):
+        """
+        Args:
+            reconcile_interval: 对账周期（秒）
+            retry_interval: 对账期间有并发写入时，提前重新对账的间隔（秒）
+        """
+        self.reconcile_interval = reconcile_interval
+        self.retry_interval = retry_interval
+        self._matrix: Dict[Tuple[str, str], int] = {}
+        self._loaded_at: Optional[float] = None
+        self._seq = 0  # 增量写入序号，用于检测对账期间的并发写入
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.reconciles = 0
+
+    def is_stale(self) -> bool:
+        with self._lock:
+            return self._loaded_at is None or time.time() - self._loaded_at >= self.reconcile_interval
+
+    def begin_reconcile(self) -> int:
+        """对账开始前调用，返回当前写入序号，传给 load"""
+        with self._lock:
+            return self._seq
+
+    def load(self, rows: Iterable[Tuple[str, str, int]], seq: int) -> None:
+        """用数据库 GROUP BY category, status 的结果重建计数矩阵"""
+        matrix = {(category, status): int(cnt) for category, status, cnt in rows}
+        with self._lock:
+            self._matrix = matrix
+            self.reconciles += 1
+            now = time.time()
+            if self._seq == seq:
+                self._loaded_at = now
+            else:
+                # 查询期间有写入，无法确定是否已包含在快照中，稍后再对账一次
+                self._loaded_at = now - self.reconcile_interval + self.retry_interval
+
+    def total(self, category: Optional[str] = None, status: Optional[str] = None) -> Optional[int]:
+        """按筛选组合求总数；缓存未加载时返回 None"""
+        with self._lock:
+            if self._loaded_at is None:
+                return None
+            self.hits += 1
+            return sum(
+                cnt for (cat, st), cnt in self._matrix.items()
+                if (category is None or cat == category) and (status is None or st == status)
+            )
+
+    def counts_by_category(self) -> Dict[str, Dict[str, int]]:
+        """返回 {category: {status: count}}，供分类统计复用"""
+        with self._lock:
+            result: Dict[str, Dict[str, int]] = {}
+            for (cat, st), cnt in self._matrix.items():
+                result.setdefault(cat, {})[st] = cnt
+            return result
+
+    def apply_delta(self, category: str, status: str, delta: int) -> None:
+        """写路径增量维护：某分类某状态的商品数变化 delta"""
+        with self._lock:
+            self._seq += 1
+            if self._loaded_at is None:
+                return
+            key = (category, status)
+            self._matrix[key] = max(0, self._matrix.get(key, 0) + delta)
+
+    def move(self, category: str, old_status: str, new_status: str, count: int = 1) -> None:
+        """商品状态变更：从 old_status 计数移到 new_status"""
+        if old_status == new_status:
+            return
+        self.apply_delta(category, old_status, -count)
+        self.apply_delta(category, new_status, count)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+            self._matrix = {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "reconciles": self.reconciles,
+                "cells": len(self._matrix),
+                "age_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            }
+
+
+class GoodsListCache:
+    """
+    商品列表页读穿缓存（TTL + LRU）
+    key 为 (category, status, page, cursor, page_size, with_total)，
+    同时按商品ID与筛选条件 (category, status) 建立索引，写路径据此精确失效
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 30.0):
+        """
+        Args:
+            max_entries: 最多缓存的列表页数量，超出后按最近最少使用淘汰
+            ttl: 单页缓存有效期（秒），兜底覆盖绕过 DBManager 的写入
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, goods_list, total, goods_ids)
+        self._entries: "OrderedDict[Tuple, Tuple[float, list, Optional[int], Tuple[int, ...]]]" = OrderedDict()
+        # goods_id -> 含该商品的页 key 集合
+        self._goods_index: Dict[Any, Set[Tuple]] = {}
+        # 失效代数：读库期间发生过失效时，查询结果不再写入缓存，避免把旧数据放回去
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(category: Optional[str], status: Optional[str], page: int, cursor: Optional[str],
+                 page_size: int, with_total: bool) -> Tuple:
+        # 游标分页与页码无关，统一 page 以提高命中率；页码/页大小转为整数，"2" 与 2 命中同一页
+        return (category or None, status or None, int(page) if cursor is None else None,
+                cursor, int(page_size), bool(with_total))
+
+    def generation(self) -> int:
+        """读库前调用，返回当前失效代数，传给 put"""
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Tuple) -> Optional[Tuple[list, Optional[int]]]:
+        """命中时返回 (goods_list, total)，未命中或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 返回列表和每行的副本，调用方增删元素、修改字段都不影响缓存
+            return [dict(row) for row in entry[1]], entry[2]
+
+    def put(self, key: Tuple, goods_list: list, total: Optional[int], generation: int) -> bool:
+        with self._lock:
+            if generation != self._generation:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            goods_ids = tuple(g.get("goods_id") for g in goods_list)
+            self._entries[key] = (time.time() + self.ttl, [dict(row) for row in goods_list], total, goods_ids)
+            for goods_id in goods_ids:
+                self._goods_index.setdefault(goods_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def _remove(self, key: Tuple) -> None:
+        """删除单页（调用方需持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for goods_id in entry[3]:
+            keys = self._goods_index.get(goods_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._goods_index[goods_id]
+
+    def invalidate_goods(self, goods_id: Any) -> int:
+        """商品内容（库存、图片等）变化：删除包含该商品的页"""
+        with self._lock:
+            self._generation += 1
+            keys = list(self._goods_index.get(goods_id, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_filter(self, category: Optional[str], status: Optional[str]) -> int:
+        """某分类某状态的商品集合变化（新增、状态变更）：删除筛选条件覆盖该组合的所有页"""
+        with self._lock:
+            self._generation += 1
+            keys = [
+                key for key in self._entries
+                if (key[0] is None or key[0] == category) and (key[1] is None or key[1] == status)
+            ]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._goods_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "items": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+class SingleFlightCache:
+    """
+    TTL + LRU 结果缓存，带单飞（single-flight）保护
+    同一 key 过期后只有一个线程执行加载，其余线程等待并直接复用其结果，避免缓存击穿时的并发重复计算
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024, lock_stripes: int = 64):
+        """
+        Args:
+            ttl: 结果有效期（秒）
+            max_entries: 最多缓存的 key 数量，超出后按最近最少使用淘汰
+            lock_stripes: 单飞锁分段数（不同 key 映射到固定数量的锁上，避免锁对象无限增长）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flight_locks = [threading.Lock() for _ in range(lock_stripes)]
+        # 正在加载的 key -> 加载期间该 key 是否被失效过（被失效时加载结果不写入缓存）
+        self._loading: Dict[Hashable, bool] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """查找未过期的条目（调用方需持有锁）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[1]
+
+    def get_or_load(self, key: Hashable, loader, cacheable=None) -> Tuple[Any, bool]:
+        """
+        命中时直接返回缓存值，否则执行 loader() 加载
+        Args:
+            loader: 无参加载函数
+            cacheable: 可选，判断加载结果是否可以缓存（如部分结果不缓存）
+        Returns:
+            (value, hit)
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value, True
+            self.misses += 1
+
+        with self._flight_locks[hash(key) % len(self._flight_locks)]:
+            # 等锁期间其它线程可能已经加载完成
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.coalesced += 1
+                    return value, True
+                self._loading[key] = False
+                self.loads += 1
+
+            try:
+                value = loader()
+                store = cacheable is None or cacheable(value)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+
+            with self._lock:
+                dirty = self._loading.pop(key, True)
+                if store and not dirty:
+                    self._entries[key] = (time.time() + self.ttl, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return value, False
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._loading:
+                self._loading[key] = True
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._loading:
+                self._loading[key] = True
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "loads": self.loads,
+                "items": len(self._entries),
+                "ttl": self.ttl,
+            }
+
+
+class CollectedSetCache:
+    """
+    用户收藏集合缓存：user_id -> 已收藏的商品ID集合（TTL + LRU）
+    用于列表页批量判断“是否已收藏”；收藏/取消收藏时直接增删已缓存的集合，
+    同一用户的加载经分段锁单飞，加载期间发生的增删会使本次加载结果作废，避免写入过期集合
+    """
+
+    def __init__(self, ttl: float = 600, max_users: int = 10000, lock_stripes: int = 64):
+        """
+        Args:
+            ttl: 集合有效期（秒），兜底数据库侧的级联删除等非本进程写入
+            max_users: 最多缓存的用户数，超出后按最近最少使用淘汰
+        """
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, Tuple[float, Set[int]]]" = OrderedDict()
+        self._flight_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._loading: Dict[int, bool] = {}  # 正在加载的用户 -> 加载期间是否发生过增删
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _lookup(self, user_id: int) -> Optional[Set[int]]:
+        """查找未过期的集合（调用方需持有锁）"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def check(self, user_id: int, goods_ids: Iterable[int], loader) -> Dict[int, bool]:
+        """
+        批量判断商品是否已被该用户收藏
+        Args:
+            loader: 无参函数，返回该用户全部已收藏商品ID（缓存未命中时调用）
+        """
+        with self._lock:
+            collected = self._lookup(user_id)
+            if collected is not None:
+                self.hits += 1
+                return {goods_id: goods_id in collected for goods_id in goods_ids}
+            self.misses += 1
+
+        with self._flight_locks[user_id % len(self._flight_locks)]:
+            with self._lock:
+                collected = self._lookup(user_id)
+                if collected is None:
+                    self._loading[user_id] = False
+                    self.loads += 1
+            if collected is None:
+                try:
+                    collected = set(loader())
+                except BaseException:
+                    with self._lock:
+                        self._loading.pop(user_id, None)
+                    raise
+                with self._lock:
+                    if not self._loading.pop(user_id, True):
+                        self._entries[user_id] = (time.time() + self.ttl, collected)
+                        self._entries.move_to_end(user_id)
+                        while len(self._entries) > self.max_users:
+                            self._entries.popitem(last=False)
+            # 作废的加载结果仍可用于回答本次请求（只是不写入缓存）
+            return {goods_id: goods_id in collected for goods_id in goods_ids}
+
+    def _update(self, user_id: int, goods_id: int, collected: bool) -> None:
+        """用户ID和商品ID统一转为整数，与 check 使用的键一致"""
+        user_id, goods_id = int(user_id), int(goods_id)
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id] = True
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if collected:
+                entry[1].add(goods_id)
+            else:
+                entry[1].discard(goods_id)
+
+    def add(self, user_id: int, goods_id: int) -> None:
+        self._update(user_id, goods_id, True)
+
+    def remove(self, user_id: int, goods_id: int) -> None:
+        self._update(user_id, goods_id, False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "loads": self.loads,
+                "users": len(self._entries),
+                "ttl": self.ttl,
+            }
+
+
+class BloomFilter:
+    """
+    布隆过滤器：判断“一定不存在”或“可能存在”
+    位数组大小和哈希次数按预期容量与误判率计算，哈希使用 blake2b 双重哈希
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class UsernameRegistry:
+    """
+    已存在用户名的内存索引：布隆过滤器（全量）+ 精确 LRU（最近确认已被占用的用户名）
+    check 返回 'available'（一定可用）/ 'taken'（一定已占用）/ 'unknown'（需要查库确认）
+    用户名按数据库排序规则（大小写、重音不敏感）近似归一化后再比较
+    """
+
+    def __init__(self, error_rate: float = 0.001, min_capacity: int = 100000, lru_size: int = 10000):
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.lru_size = lru_size
+        self._bloom: Optional[BloomFilter] = None
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: list = []  # 加载期间新注册的用户名，加载完成后补进新过滤器
+        self._loading = False
+        self._lock = threading.Lock()
+        self.bloom_hits = 0
+        self.lru_hits = 0
+        self.unknown = 0
+
+    @staticmethod
+    def normalize(username: str) -> str:
+        decomposed = unicodedata.normalize("NFKD", username)
+        return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+    def load(self, usernames: Iterable[str], expected: int = 0) -> int:
+        """用全量用户名重建布隆过滤器（可在服务运行中重建），返回加载数量"""
+        with self._lock:
+            self._loading = True
+            self._pending = []
+        bloom = BloomFilter(max(self.min_capacity, expected * 2), self.error_rate)
+        loaded = 0
+        try:
+            for name in usernames:
+                bloom.add(self.normalize(name))
+                loaded += 1
+        finally:
+            with self._lock:
+                for name in self._pending:
+                    bloom.add(name)
+                self._pending = []
+                self._loading = False
+        with self._lock:
+            self._bloom = bloom
+        return loaded
+
+    def add(self, username: str) -> None:
+        """新注册或确认已被占用的用户名"""
+        key = self.normalize(username)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key)
+            if self._loading:
+                self._pending.append(key)
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.lru_size:
+                self._recent.popitem(last=False)
+
+    def check(self, username: str) -> str:
+        key = self.normalize(username)
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                self.lru_hits += 1
+                return "taken"
+            if self._bloom is not None and key not in self._bloom:
+                self.bloom_hits += 1
+                return "available"
+            self.unknown += 1
+            return "unknown"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            bloom = self._bloom
+            return {
+                "loaded": bloom is not None,
+                "items": bloom.count if bloom else 0,
+                "capacity": bloom.capacity if bloom else 0,
+                "bits": bloom.num_bits if bloom else 0,
+                "hashes": bloom.num_hashes if bloom else 0,
+                "recent_items": len(self._recent),
+                "bloom_hits": self.bloom_hits,
+                "lru_hits": self.lru_hits,
+                "db_checks": self.unknown,
+            }
+
+
+class SessionCache:
+    """
+    登录会话缓存：令牌 -> 会话（user_id、username、role、status）
+    会话绑定在登录所用的连接上，连接断开时撤销；按用户建立索引，封号时撤销该用户全部会话
+    status 为最近一次核对的账号状态，checked_at 超过 status_ttl 秒后由调用方查库刷新（其他服务器上的封号也能生效）
+    """
+
+    def __init__(self, status_ttl: float = 30.0):
+        self.status_ttl = status_ttl
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.revoked = 0
+
+    def create(self, user_info: Dict[str, Any]) -> str:
+        """登录成功后创建会话，返回令牌"""
+        token = secrets.token_urlsafe(24)
+        user_id = int(user_info["user_id"])
+        session = {
+            "token": token,
+            "user_id": user_id,
+            "username": user_info.get("username"),
+            "role": user_info.get("role"),
+            "status": user_info.get("status", "active"),
+            "created_at": time.time(),
+            "checked_at": time.time(),
+        }
+        with self._lock:
+            self._sessions[token] = session
+            self._by_user.setdefault(user_id, set()).add(token)
+            self.created += 1
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """按令牌取会话，已撤销或不存在时返回 None（返回副本，调用方修改不影响缓存）"""
+        with self._lock:
+            session = self._sessions.get(token)
+            return dict(session) if session else None
+
+    def status_stale(self, session: Dict[str, Any]) -> bool:
+        """会话中的账号状态是否需要重新查库核对"""
+        return time.time() - session["checked_at"] >= self.status_ttl
+
+    def set_status(self, token: str, status: str) -> None:
+        """记录查库核对后的账号状态"""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                session["status"] = status
+                session["checked_at"] = time.time()
+
+    def revoke(self, token: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(token, None)
+            if session is None:
+                return False
+            tokens = self._by_user.get(session["user_id"])
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._by_user[session["user_id"]]
+            self.revoked += 1
+            return True
+
+    def revoke_user(self, user_id: int) -> int:
+        """撤销某用户的全部会话（封号时调用），返回撤销数量"""
+        with self._lock:
+            tokens = self._by_user.pop(int(user_id), set())
+            for token in tokens:
+                self._sessions.pop(token, None)
+            self.revoked += len(tokens)
+            return len(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "users": len(self._by_user),
+                "created": self.created,
+                "revoked": self.revoked,
+            }
@@ -2,16 +2,225 @@
 数据库并发控制工具模块
 提供事务管理、行锁、乐观锁等并发控制机制
 防止脏读、丢失修改、不可重复读等问题
+事务使用连接池中的连接，并按连接记录会话变量，取值未变化时不再重复发送 SET 语句
 """
 
 import pymysql
 import pymysql.cursors
-from typing import Optional, Callable, Any, Tuple
+from typing import Optional, Callable, Any, Dict, List, Tuple
 from contextlib import contextmanager
+import random
 import time
 import threading
 
 
+class ConnectionPool:
+    """
+    数据库连接池
+    连接用完后归还到池中复用（后进先出，优先复用刚用过的连接），
+    每个连接上记录当前的会话变量（_session_vars），由 ConcurrencyControl 据此跳过重复的 SET
+    """
+
+    def __init__(self, connect: Callable[[], Any], max_idle: int = 16, ping_interval: float = 30.0):
+        """
+        Args:
+            connect: 创建新连接的函数，失败时返回 None
+            max_idle: 池中最多保留的空闲连接数
+            ping_interval: 连接空闲超过该时长（秒）后，取出时先 ping 检查是否可用
+        """
+        self.connect = connect
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+        self._idle: List[Tuple[Any, float]] = []  # [(连接, 归还时间)]
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.pings = 0
+        self.discarded = 0
+
+    def acquire(self):
+        """取出一个可用连接，池为空时新建；返回 None 表示数据库连接失败"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at >= self.ping_interval:
+                with self._lock:
+                    self.pings += 1
+                try:
+                    # 不自动重连：重连后会话变量会丢失，直接丢弃该连接
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._discard(conn)
+                    continue
+            with self._lock:
+                self.reused += 1
+            return conn
+
+        conn = self.connect()
+        if conn is None:
+            return None
+        conn._session_vars = {}
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def release(self, conn, reusable: bool = True) -> None:
+        """归还连接；连接状态未知（如回滚失败）时传 reusable=False 直接关闭"""
+        if reusable:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append((conn, time.monotonic()))
+                    return
+        self._discard(conn)
+
+    def _discard(self, conn) -> None:
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "pings": self.pings,
+                "discarded": self.discarded,
+            }
+
+
+# 可重试的 MySQL 错误码 -> 冲突类型
+RETRYABLE_ERRORS = {
+    1205: "lock_wait_timeout",         # ER_LOCK_WAIT_TIMEOUT：锁等待超时
+    1213: "deadlock",                  # ER_LOCK_DEADLOCK：死锁，事务已被整体回滚
+    3572: "lock_nowait",               # ER_LOCK_NOWAIT：NOWAIT 加锁失败
+    3101: "serialization_failure",     # ER_TRANSACTION_ROLLBACK_DURING_COMMIT：提交时冲突被回滚（组复制认证失败）
+}
+
+
+class RetryPolicy:
+    """
+    锁冲突重试策略
+    按 pymysql 异常的错误码判断是否可重试，重试间隔为带完全抖动的指数退避（random(0, min(上限, 基数 * 2^n))），
+    并用重试预算（令牌桶）限制整体重试量：每次调用存入 budget_ratio 个令牌、每秒补充 budget_per_second 个，
+    每次重试消耗 1 个，冲突严重时不会因为集中重试把数据库压垮
+    同时按表记录冲突次数、重试次数和最终放弃次数
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.01, max_delay: float = 0.5,
+                 budget_ratio: float = 0.2, budget_per_second: float = 5.0, max_budget: float = 50.0):
+        """
+        Args:
+            max_attempts: 单次调用最多执行次数（含首次）
+            base_delay: 退避基数（秒）
+            max_delay: 单次退避上限（秒）
+            budget_ratio: 每次调用存入的重试令牌数
+            budget_per_second: 每秒补充的重试令牌数（保证低流量时也能重试）
+            max_budget: 令牌桶容量
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_per_second = budget_per_second
+        self.max_budget = max_budget
+        self._tokens = max_budget
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        # 表名 -> {冲突类型: 次数, "retries": 次数, "gave_up": 次数}
+        self.contention: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def classify(error: Exception) -> Optional[str]:
+        """返回冲突类型，不可重试的错误返回 None"""
+        code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+        if code in RETRYABLE_ERRORS:
+            return RETRYABLE_ERRORS[code]
+        # select_for_update 会把锁等待超时包装为普通异常
+        message = str(error)
+        if "Lock wait timeout" in message or "获取行锁超时" in message:
+            return "lock_wait_timeout"
+        if "Deadlock found" in message:
+            return "deadlock"
+        return None
+
+    def _deposit(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.max_budget, self._tokens + self.budget_ratio)
+
+    def _withdraw(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_budget, self._tokens + (now - self._refilled_at) * self.budget_per_second)
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.budget_exhausted += 1
+                return False
+            self._tokens -= 1
+            self.retries += 1
+            return True
+
+    def _record(self, table: str, key: str) -> None:
+        with self._lock:
+            counters = self.contention.setdefault(table, {})
+            counters[key] = counters.get(key, 0) + 1
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（完全抖动）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def run(self, func: Callable[[], Any], table: str = "unknown", max_attempts: int = None) -> Any:
+        """
+        执行 func，遇到可重试的锁冲突时退避后重新执行整个 func（func 应为完整的一个事务）
+        
+        Args:
+            func: 无参函数
+            table: 冲突计数归属的表名
+            max_attempts: 覆盖默认的最多执行次数
+        
+        Returns:
+            func 的返回值；不可重试、次数用尽或预算不足时抛出最后一次的异常
+        """
+        max_attempts = max_attempts or self.max_attempts
+        self._deposit()
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    raise
+                self._record(table, kind)
+                if attempt >= max_attempts or not self._withdraw():
+                    self._record(table, "gave_up")
+                    raise
+                self._record(table, "retries")
+                delay = self.backoff(attempt)
+                print(f"[并发控制] {table} 表{kind}，{delay * 1000:.1f}ms 后第 {attempt} 次重试")
+                time.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "budget_tokens": round(self._tokens, 2),
+                "budget_exhausted": self.budget_exhausted,
+                "contention": {table: dict(counters) for table, counters in self.contention.items()},
+            }
+
+
 class ConcurrencyControl:
     """
     数据库并发控制工具类
@@ -28,6 +237,51 @@ class ConcurrencyControl:
         self.db_manager = db_manager
         self.lock_timeout = 5  # 锁超时时间（秒）
         self.max_retries = 3   # 最大重试次数
+        # 事务连接池：连接保持 autocommit=0 并记录会话变量，复用时通常无需任何 SET
+        self.pool = ConnectionPool(db_manager._get_conn)
+        # 死锁/锁等待超时重试策略（指数退避 + 完全抖动 + 重试预算），按表记录冲突
+        self.retry_policy = RetryPolicy(max_attempts=self.max_retries + 1)
+        self._stats_lock = threading.Lock()
+        self.transactions = 0
+        self.round_trips = 0      # 事务控制语句实际产生的往返次数（SET、autocommit、COMMIT/ROLLBACK）
+        self.sets_sent = 0
+        self.sets_skipped = 0
+
+    def _count(self, transactions: int = 0, round_trips: int = 0, sent: int = 0, skipped: int = 0) -> None:
+        with self._stats_lock:
+            self.transactions += transactions
+            self.round_trips += round_trips
+            self.sets_sent += sent
+            self.sets_skipped += skipped
+
+    def set_session_var(self, conn, name: str, value: Any, sql: str) -> bool:
+        """
+        设置会话变量；连接上记录的当前值与 value 相同时跳过
+        
+        Args:
+            name: 变量名（记录用的键）
+            value: 期望的取值
+            sql: 实际执行的 SET 语句
+        
+        Returns:
+            是否发送了 SET 语句
+        """
+        session_vars = getattr(conn, "_session_vars", None)
+        if session_vars is None:
+            session_vars = conn._session_vars = {}
+        if session_vars.get(name) == value:
+            self._count(skipped=1)
+            return False
+        # 执行失败时连接上的取值未知，先删除记录
+        session_vars.pop(name, None)
+        cur = conn.cursor()
+        try:
+            cur.execute(sql)
+        finally:
+            cur.close()
+        session_vars[name] = value
+        self._count(round_trips=1, sent=1)
+        return True
     
     @contextmanager
     def transaction(self, isolation_level: str = "REPEATABLE READ"):
@@ -47,41 +301,36 @@ class ConcurrencyControl:
                 cur.execute("UPDATE ...")
                 conn.commit()
         """
-        conn = self.db_manager._get_conn()
+        conn = self.pool.acquire()
         if not conn:
             raise Exception("数据库连接失败")
         
-        original_autocommit = conn.autocommit
-        original_isolation = None
-        
+        round_trips = 1  # COMMIT 或 ROLLBACK（SET 语句由 set_session_var 单独计数）
+        reusable = True
         try:
-            # 设置事务隔离级别
+            # 设置事务隔离级别（连接上已是该级别时不发送）
             if isolation_level:
-                cur = conn.cursor()
-                cur.execute(f"SET SESSION TRANSACTION ISOLATION LEVEL {isolation_level}")
-                original_isolation = cur.fetchone()
-                cur.close()
+                self.set_session_var(conn, "isolation_level", isolation_level,
+                                     f"SET SESSION TRANSACTION ISOLATION LEVEL {isolation_level}")
             
-            # 关闭自动提交，开启事务
-            conn.autocommit(False)
+            # 关闭自动提交，开启事务；池中连接一直保持 autocommit=0，只有新连接需要切换
+            if conn.get_autocommit():
+                conn.autocommit(False)
+                round_trips += 1
             yield conn
             
             # 提交事务
             conn.commit()
         except Exception as e:
-            # 回滚事务
-            conn.rollback()
+            # 回滚事务；回滚失败说明连接状态未知，不再放回池中
+            try:
+                conn.rollback()
+            except Exception:
+                reusable = False
             raise e
         finally:
-            # 恢复原始设置
-            try:
-                conn.autocommit(original_autocommit)
-                if original_isolation:
-                    cur = conn.cursor()
-                    cur.execute(f"SET SESSION TRANSACTION ISOLATION LEVEL {original_isolation}")
-                    cur.close()
-            except:
-                pass
+            self.pool.release(conn, reusable)
+            self._count(transactions=1, round_trips=round_trips)
     
     def select_for_update(self, conn, table: str, where_clause: str, params: tuple, 
                          timeout: int = None) -> Optional[dict]:
@@ -102,11 +351,12 @@ class ConcurrencyControl:
         timeout = timeout or self.lock_timeout
         
         sql = f"SELECT * FROM {table} WHERE {where_clause} FOR UPDATE"
+        # 设置锁超时（连接上已是该值时不发送）
+        self.set_session_var(conn, "innodb_lock_wait_timeout", int(timeout),
+                             f"SET SESSION innodb_lock_wait_timeout = {int(timeout)}")
         cur = conn.cursor(pymysql.cursors.DictCursor)
         
         try:
-            # 设置锁超时
-            cur.execute(f"SET innodb_lock_wait_timeout = {timeout}")
             cur.execute(sql, params)
             result = cur.fetchone()
             return result
@@ -117,11 +367,108 @@ class ConcurrencyControl:
         finally:
             cur.close()
     
+    def compare_and_swap(self, conn, table: str, pk_field: str, pk_value: Any, expected_version: int,
+                         updates: dict, version_field: str = "version") -> Tuple[bool, str]:
+        """
+        乐观锁更新（比较并交换）：调用方给出读取时的版本号，一条带版本条件的 UPDATE 完成校验和更新，
+        不加锁读、不额外往返
+        
+        Args:
+            conn: 数据库连接
+            table: 表名
+            pk_field: 主键字段名
+            pk_value: 主键值
+            expected_version: 调用方读取数据时的版本号
+            updates: 要更新的字段字典 {field: value}
+            version_field: 版本号字段名（默认 "version"）
+        
+        Returns:
+            (success: bool, message: str)，版本号不匹配（或记录不存在）时 success=False
+        """
+        set_clauses = [f"{field} = %s" for field in updates]
+        set_clauses.append(f"{version_field} = {version_field} + 1")
+        params = list(updates.values()) + [pk_value, expected_version]
+        sql = (f"UPDATE {table} SET {', '.join(set_clauses)} "
+               f"WHERE {pk_field} = %s AND {version_field} = %s")
+        
+        cur = conn.cursor()
+        try:
+            affected_rows = cur.execute(sql, params)
+        finally:
+            cur.close()
+        if affected_rows == 0:
+            return False, "更新失败：版本号不匹配（数据已被其他事务修改）或记录不存在"
+        return True, "更新成功"
+    
+    def compare_and_swap_many(self, conn, table: str, pk_field: str,
+                              rows: List[Tuple[Any, int, dict]],
+                              version_field: str = "version") -> Dict[Any, bool]:
+        """
+        批量乐观锁更新：一条 CASE UPDATE 按各行的期望版本号更新多行，并逐行报告冲突
+        全部成功时只需一条 UPDATE；影响行数不足时回滚到保存点，逐行执行 compare_and_swap 找出冲突行
+        （必须在事务中调用，如 with self.transaction() as conn）
+        
+        Args:
+            conn: 数据库连接（事务中）
+            table: 表名
+            pk_field: 主键字段名
+            rows: [(主键值, 期望版本号, 要更新的字段字典)]，主键不能重复
+            version_field: 版本号字段名（默认 "version"）
+        
+        Returns:
+            {主键值: 是否更新成功}
+        """
+        if not rows:
+            return {}
+        if len(rows) == 1:
+            pk_value, expected_version, updates = rows[0]
+            success, _ = self.compare_and_swap(conn, table, pk_field, pk_value, expected_version,
+                                               updates, version_field)
+            return {pk_value: success}
+        
+        fields = []
+        for _, _, updates in rows:
+            for field in updates:
+                if field not in fields:
+                    fields.append(field)
+        
+        set_clauses, params = [], []
+        for field in fields:
+            cases = []
+            for pk_value, _, updates in rows:
+                if field in updates:
+                    cases.append("WHEN %s THEN %s")
+                    params.extend([pk_value, updates[field]])
+            set_clauses.append(f"{field} = CASE {pk_field} {' '.join(cases)} ELSE {field} END")
+        set_clauses.append(f"{version_field} = {version_field} + 1")
+        conditions = " OR ".join([f"({pk_field} = %s AND {version_field} = %s)"] * len(rows))
+        for pk_value, expected_version, _ in rows:
+            params.extend([pk_value, expected_version])
+        sql = f"UPDATE {table} SET {', '.join(set_clauses)} WHERE {conditions}"
+        
+        cur = conn.cursor()
+        try:
+            cur.execute("SAVEPOINT cas_batch")
+            affected_rows = cur.execute(sql, params)
+            if affected_rows == len(rows):
+                return {pk_value: True for pk_value, _, _ in rows}
+            # 有冲突：一条语句无法区分哪些行未命中，撤销本批后逐行比较并交换
+            cur.execute("ROLLBACK TO SAVEPOINT cas_batch")
+        finally:
+            cur.close()
+        
+        results = {}
+        for pk_value, expected_version, updates in rows:
+            success, _ = self.compare_and_swap(conn, table, pk_field, pk_value, expected_version,
+                                               updates, version_field)
+            results[pk_value] = success
+        return results
+    
     def update_with_version(self, conn, table: str, pk_field: str, pk_value: Any,
                            updates: dict, version_field: str = "version") -> Tuple[bool, str]:
         """
         使用乐观锁更新（版本号机制）
-        防止丢失修改问题
+        防止丢失修改问题；读取版本号使用不加锁的一致性读，已知版本号时请直接调用 compare_and_swap
         
         Args:
             conn: 数据库连接（必须在事务中）
@@ -137,9 +484,9 @@ class ConcurrencyControl:
         cur = conn.cursor(pymysql.cursors.DictCursor)
         
         try:
-            # 1. 查询当前版本号
+            # 1. 查询当前版本号（不加锁）
             cur.execute(
-                f"SELECT {version_field} FROM {table} WHERE {pk_field} = %s FOR UPDATE",
+                f"SELECT {version_field} FROM {table} WHERE {pk_field} = %s",
                 (pk_value,)
             )
             row = cur.fetchone()
@@ -147,70 +494,43 @@ class ConcurrencyControl:
             if not row:
                 return False, f"记录不存在: {pk_field}={pk_value}"
             
-            current_version = row[version_field]
-            
-            # 2. 构建更新SQL（包含版本号检查）
-            set_clauses = []
-            update_params = []
-            
-            for field, value in updates.items():
-                set_clauses.append(f"{field} = %s")
-                update_params.append(value)
-            
-            # 版本号自增
-            set_clauses.append(f"{version_field} = {version_field} + 1")
-            
-            # WHERE 条件包含版本号检查
-            where_clause = f"{pk_field} = %s AND {version_field} = %s"
-            update_params.extend([pk_value, current_version])
-            
-            sql = f"UPDATE {table} SET {', '.join(set_clauses)} WHERE {where_clause}"
-            
-            # 3. 执行更新
-            affected_rows = cur.execute(sql, tuple(update_params))
-            
-            if affected_rows == 0:
-                return False, "更新失败：版本号不匹配，数据已被其他事务修改"
-            
-            return True, "更新成功"
-            
+            # 2. 带版本号条件更新
+            return self.compare_and_swap(conn, table, pk_field, pk_value, row[version_field],
+                                         updates, version_field)
         except Exception as e:
             return False, f"更新异常: {str(e)}"
         finally:
             cur.close()
     
+    def stats(self) -> Dict[str, Any]:
+        """事务控制开销统计：每个事务平均产生的控制语句往返次数、跳过的 SET 数量，以及连接池状态"""
+        with self._stats_lock:
+            return {
+                "transactions": self.transactions,
+                "control_round_trips": self.round_trips,
+                "avg_round_trips_per_txn": round(self.round_trips / self.transactions, 2) if self.transactions else 0.0,
+                "session_sets_sent": self.sets_sent,
+                "session_sets_skipped": self.sets_skipped,
+                "pool": self.pool.stats(),
+                "retry": self.retry_policy.stats(),
+            }
+    
     def retry_on_lock_timeout(self, func: Callable, max_retries: int = None, 
-                              delay: float = 0.1) -> Any:
+                              delay: float = None, table: str = "unknown") -> Any:
         """
-        锁超时重试装饰器
+        锁冲突重试（锁等待超时、死锁、NOWAIT 失败、提交冲突），委托给 retry_policy
         
         Args:
-            func: 要执行的函数
+            func: 要执行的函数（应为完整的一个事务）
             max_retries: 最大重试次数，None 使用默认值
-            delay: 重试延迟（秒）
+            delay: 已废弃，退避时间由 retry_policy 决定
+            table: 冲突计数归属的表名
         
         Returns:
             函数执行结果
         """
         max_retries = max_retries or self.max_retries
-        
-        for attempt in range(max_retries + 1):
-            try:
-                return func()
-            except Exception as e:
-                if "Lock wait timeout" in str(e) or "lock wait timeout" in str(e).lower():
-                    if attempt < max_retries:
-                        print(f"[并发控制] 锁超时，第 {attempt + 1} 次重试...")
-                        time.sleep(delay * (attempt + 1))  # 指数退避
-                        continue
-                    else:
-                        raise Exception(f"重试 {max_retries} 次后仍然失败: {str(e)}")
-                else:
-                    # 非锁超时错误，直接抛出
-                    raise e
-        
-        raise Exception("重试失败")
-
+        return self.retry_policy.run(func, table=table, max_attempts=max_retries + 1)
 
 class OptimisticLockMixin:
     """
@@ -296,6 +616,21 @@ class OptimisticLockMixin:
            raise Exception(msg)
    ```
 
+   已知读取时的版本号时直接比较并交换（一条 UPDATE，不加锁）：
+   ```python
+   success, msg = cc.compare_and_swap(
+       conn, "goods", "goods_id", goods["goods_id"], goods["version"],
+       {"stock_quantity": new_stock}
+   )
+   
+   # 批量：一条 CASE UPDATE，返回每行是否成功
+   results = cc.compare_and_swap_many(conn, "goods", "goods_id", [
+       (1, 3, {"price": 99}),
+       (2, 7, {"price": 199, "status": "on_sale"}),
+   ])
+   conflicts = [goods_id for goods_id, ok in results.items() if not ok]
+   ```
+
 3. 重试机制：
    ```python
    cc = ConcurrencyControl(db_manager)
@@ -305,14 +640,14 @@ class OptimisticLockMixin:
            # ... 更新操作
            pass
    
-   result = cc.retry_on_lock_timeout(update_goods, max_retries=3)
+   result = cc.retry_on_lock_timeout(update_goods, max_retries=3, table="goods")
    ```
 
 最佳实践：
 1. 关键业务操作（下单、库存扣减）使用悲观锁（FOR UPDATE）
-2. 非关键操作（更新昵称、描述）使用乐观锁（版本号）
+2. 非关键操作（更新昵称、描述）使用乐观锁（版本号），优先用 compare_and_swap 传入读取时的版本号
 3. 设置合适的事务隔离级别（推荐 REPEATABLE READ）
 4. 为关键表添加 version 字段支持乐观锁
-5. 使用重试机制处理锁冲突
+5. 使用重试机制处理锁冲突（死锁 1213、锁等待超时 1205 等），重试的函数必须是完整的事务
 """
 
@@ -1,11 +1,18 @@
+import base64
 import hashlib
 import pymysql
 import pymysql.cursors
 import os
 import random
 from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from db_concurrency import ConcurrencyControl
+from group_commit import ChatWriter, CommitUncertainError, OrderWriter
+from cache_utils import (CollectedSetCache, GoodsCountCache, GoodsListCache, SessionCache, SingleFlightCache,
+                         UsernameRegistry)
+from stock_reservation import StockReservations
+from id_generator import NodeLease
 
 
 class DBManager:
@@ -21,8 +28,33 @@ class DBManager:
         self.database = database
         # 初始化并发控制工具
         self.concurrency = ConcurrencyControl(self)
+        # 商品计数缓存：列表总数由 (category, status) 计数矩阵求和，写路径增量维护
+        self.goods_counts = GoodsCountCache()
+        # 商品列表页读穿缓存：热点列表（如各分类在售首页）直接从内存返回
+        self.goods_list_cache = GoodsListCache()
+        # 聊天消息组提交写入器：并发发送的消息合并为多行 INSERT 一起提交
+        self.chat_writer = ChatWriter(self)
+        # DATA_STAT 结果缓存：全站部分按 TTL 刷新；个人部分按用户缓存，订单变更时失效
+        self.stat_global_cache = SingleFlightCache(ttl=60)
+        self.stat_user_cache = SingleFlightCache(ttl=300, max_entries=10000)
+        # 已存在用户名索引（布隆过滤器 + 精确 LRU）：注册和用户名校验时跳过大部分查库
+        self.usernames = UsernameRegistry()
+        # 登录会话缓存：LOGIN 签发令牌，后续指令从会话解析身份和权限，无需查询 user 表
+        self.sessions = SessionCache()
+        # 订单/商品归属缓存（订单的买卖双方、商品的发布者创建后不变）：权限校验时免去逐条查库
+        self.owners = SingleFlightCache(ttl=3600, max_entries=50000)
+        # 内存库存预占：下单先在内存中扣减，库存不足直接拒绝；成功的预占由订单写入器批量落库
+        self.stock = StockReservations(self._load_goods_stock)
+        self.order_writer = OrderWriter(self)
+        # 订单号生成器（雪花算法，节点号从 id_node_lease 表租用，或由环境变量 ORDER_NODE_ID 指定）
+        self.order_ids = NodeLease(self)
+        # 用户收藏集合缓存：列表页批量判断“是否已收藏”（COLLECT_CHECK），收藏/取消收藏时同步增删
+        self.collected = CollectedSetCache()
         print(f"[DB INFO] 数据库管理器初始化完成，HOST: {host}, DB: {database}")
 
+    # 等待组提交写入器给出结果的最长时间（秒），超时按结果未知处理
+    WRITER_WAIT_TIMEOUT = 10.0
+
     # ---------- 工具方法 ----------
     def _get_conn(self):
         """尝试获取数据库连接，失败时捕获异常并返回 None"""
@@ -46,6 +78,88 @@ class DBManager:
     def _md5(text: str) -> str:
         return hashlib.md5(text.encode("utf-8")).hexdigest()
 
+    @staticmethod
+    def encode_cursor(sort_time: datetime, row_id: int) -> str:
+        """将排序键 (时间, 主键) 编码为不透明的分页游标"""
+        raw = f"{sort_time.strftime('%Y-%m-%d %H:%M:%S.%f')}|{int(row_id)}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+        """解析 encode_cursor 生成的游标，格式非法时返回 None"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+            time_str, row_id = raw.split("|", 1)
+            return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S.%f"), int(row_id)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _chat_pair_key(user_a: int, user_b: int) -> int:
+        """两人会话键：(较小用户ID << 32) | 较大用户ID，与发送方向无关"""
+        low, high = sorted((int(user_a), int(user_b)))
+        return (low << 32) | high
+
+    @staticmethod
+    def _load_goods_images(cur, goods_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """批量加载商品图片：一次 WHERE goods_id IN (...) 查询，在 Python 中按商品分组
+
+        Args:
+            cur: DictCursor
+            goods_ids: 商品ID列表（可重复）
+
+        Returns:
+            {goods_id: [{img_path, display_order, is_primary}, ...]}，每个商品的图片按 display_order 升序
+        """
+        unique_ids = list(dict.fromkeys(goods_ids))
+        if not unique_ids:
+            return {}
+
+        placeholders = ", ".join(["%s"] * len(unique_ids))
+        cur.execute(
+            f"""SELECT goods_id, img_path, display_order, is_primary
+                FROM goods_images
+                WHERE goods_id IN ({placeholders})
+                ORDER BY goods_id, display_order ASC, image_id ASC""",
+            unique_ids
+        )
+        images_map: Dict[int, List[Dict[str, Any]]] = {}
+        for image in cur.fetchall():
+            images_map.setdefault(image.pop("goods_id"), []).append(image)
+        return images_map
+
+    def _attach_goods_images(self, cur, rows: List[Dict[str, Any]], with_images: bool = True) -> None:
+        """为包含 goods_id 的结果行补充 primary_image（主图路径），with_images=True 时同时补充 images 列表"""
+        images_map = self._load_goods_images(cur, [row["goods_id"] for row in rows])
+        for row in rows:
+            images = images_map.get(row["goods_id"], [])
+            row["primary_image"] = next(
+                (img["img_path"] for img in images if img["is_primary"] == 1), None
+            )
+            if with_images:
+                row["images"] = [dict(img) for img in images]
+
+    def _count_goods(self, cur, category: str = None, status: str = None) -> int:
+        """按筛选条件取商品总数：优先使用计数缓存，缓存过期时一次 GROUP BY 查询重新对账"""
+        if self.goods_counts.is_stale():
+            seq = self.goods_counts.begin_reconcile()
+            cur.execute("SELECT category, status, COUNT(*) AS cnt FROM goods GROUP BY category, status")
+            rows = cur.fetchall()
+            self.goods_counts.load(((r["category"], r["status"], r["cnt"]) for r in rows), seq)
+            print(f"[DB DEBUG] 商品计数缓存已对账: {len(rows)} 个分类/状态组合")
+        total = self.goods_counts.total(category, status)
+        return total if total is not None else 0
+
+    def _on_goods_changed(self, goods_id: int, category: str = None,
+                          old_status: str = None, new_status: str = None) -> None:
+        """商品写入提交后调用：失效包含该商品的列表页；状态变化时同步维护计数缓存并失效相关筛选的列表页"""
+        self.goods_list_cache.invalidate_goods(goods_id)
+        if old_status != new_status:
+            self.goods_counts.move(category, old_status, new_status)
+            self.goods_list_cache.invalidate_filter(category, old_status)
+            self.goods_list_cache.invalidate_filter(category, new_status)
+
     def ensure_admin_account(self, username: str = "admin", password: str = "admin123") -> None:
         """
         确保管理员账号存在；若不存在则创建，若存在则强制设为管理员并重置密码为默认值。
@@ -119,23 +233,30 @@ class DBManager:
             success=False时: user_id为None，error_code为错误码（401=用户名已存在, 500=服务器内部错误）
         """
         
-        # 1. 检查连接
+        # 1. 先查内存用户名索引：最近确认已被占用的直接返回，布隆过滤器判定一定不存在的跳过查库
+        name_state = self.usernames.check(username)
+        if name_state == "taken":
+            return False, "该用户名已被使用，不可重复注册，请更换其他用户名", None, 401
+
+        # 2. 检查连接
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败，请联系管理员", None, 500
             
-        # 2. 校验唯一性 - 如果用户名已存在，返回401错误码
-        if self.get_user_by_username(username):
-             return False, "该用户名已被使用，不可重复注册，请更换其他用户名", None, 401
+        # 3. 校验唯一性 - 索引无法确定时查库；最终以唯一索引（1062）为准
+        if name_state == "unknown" and self.get_user_by_username(username):
+            self.usernames.add(username)
+            conn.close()
+            return False, "该用户名已被使用，不可重复注册，请更换其他用户名", None, 401
 
-        # 3. 密码加密
+        # 4. 密码加密
         password_hash = self._md5(password)
         
-        # 4. 设置默认值
+        # 5. 设置默认值
         if nickname is None:
             nickname = "新用户"
         
-        # 5. 插入数据库（phone 可以为 NULL）
+        # 6. 插入数据库（phone 可以为 NULL）
         sql = "INSERT INTO user (username, password_hash, phone, nickname) VALUES (%s, %s, %s, %s)"
         cur = None
         try:
@@ -146,6 +267,7 @@ class DBManager:
             # 确保提交（虽然 autocommit=True，但显式提交更安全）
             conn.commit()
             user_id = cur.lastrowid
+            self.usernames.add(username)
             print(f"[DB DEBUG] 用户注册成功: {username}, user_id={user_id}")
             return True, "注册成功", user_id, None
         except pymysql.IntegrityError as e:
@@ -156,6 +278,7 @@ class DBManager:
                 pass
             error_code, error_msg = e.args if len(e.args) >= 2 else (e.args[0] if e.args else None, str(e))
             if error_code == 1062:  # Duplicate entry - 用户名重复
+                self.usernames.add(username)
                 print(f"[DB EXEC ERROR] 用户名重复: {username}, 错误: {error_msg}")
                 return False, "该用户名已被使用，不可重复注册，请更换其他用户名", None, 401
             else:
@@ -177,6 +300,62 @@ class DBManager:
             if conn:
                 conn.close()
             
+    def load_usernames(self, batch_size: int = 5000) -> int:
+        """启动时流式读取全部用户名，重建内存用户名索引（SSCursor，不在客户端缓存整个结果集）
+
+        Returns:
+            加载的用户名数量；数据库不可用时返回 -1（索引保持未加载状态，注册时照常查库）
+        """
+        conn = self._get_conn()
+        if not conn:
+            return -1
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM user")
+            expected = cur.fetchone()[0]
+            cur.close()
+            cur = conn.cursor(pymysql.cursors.SSCursor)
+            cur.execute("SELECT username FROM user")
+
+            def names():
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for (username,) in rows:
+                        yield username
+
+            loaded = self.usernames.load(names(), expected)
+            print(f"[DB INFO] 用户名索引加载完成: {loaded} 个用户名")
+            return loaded
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 加载用户名索引失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return -1
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+
+    def check_username(self, username: str) -> Tuple[bool, str]:
+        """检查用户名是否可注册（用于注册表单实时校验）
+
+        Returns:
+            (available, source)：source 为判定来源，bloom=布隆过滤器、cache=最近占用缓存、db=查库
+        """
+        name_state = self.usernames.check(username)
+        if name_state == "available":
+            return True, "bloom"
+        if name_state == "taken":
+            return False, "cache"
+        if self.get_user_by_username(username):
+            self.usernames.add(username)
+            return False, "db"
+        return True, "db"
+
     def validate_login(self, username: str, password: str) -> Tuple[bool, str, Optional[Dict[str, Any]], Optional[int]]:
         """校验用户名和密码
         
@@ -195,22 +374,115 @@ class DBManager:
             return False, "用户名或密码错误", None, 401
 
         return True, "登录成功", {"user_id": user["user_id"], "role": user["role"], "username": user["username"]}, None
+
+    def create_session(self, user_info: Dict[str, Any]) -> str:
+        """为登录成功的用户创建会话，返回会话令牌"""
+        return self.sessions.create(user_info)
+
+    def get_user_status(self, user_id: int) -> Optional[str]:
+        """查询账号状态（active/blocked，用户已不存在按 blocked 处理），查询失败返回 None"""
+        conn = self._get_conn()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT status FROM user WHERE user_id = %s", (user_id,))
+                row = cur.fetchone()
+                return row[0] if row else "blocked"
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 查询用户状态失败: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def get_session(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        按令牌取会话；账号状态超过核对周期时查库刷新，已被封禁则撤销会话
+        Returns:
+            会话字典（status 不为 active 表示已被封禁），令牌无效时返回 None
+        """
+        session = self.sessions.get(token)
+        if session is None:
+            return None
+        if self.sessions.status_stale(session):
+            status = self.get_user_status(session["user_id"])
+            if status is not None:
+                self.sessions.set_status(token, status)
+                session["status"] = status
+        if session["status"] != "active":
+            self.sessions.revoke(token)
+        return session
     
     # ... (其他方法省略，保持不变)
-    def list_users(self) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _user_filter(username_prefix: str = None, status: str = None) -> Tuple[List[str], List[Any]]:
+        """用户列表筛选条件：用户名前缀（走 idx_username 范围扫描）+ 账号状态"""
+        conditions, params = [], []
+        if username_prefix:
+            escaped = username_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("username LIKE %s")
+            params.append(escaped + "%")
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        return conditions, params
+
+    def list_users(self, limit: int = 100, after_id: int = None, username_prefix: str = None,
+                   status: str = None) -> List[Dict[str, Any]]:
+        """分页查询用户列表（按 user_id 倒序，游标分页）
+        
+        Args:
+            limit: 每页数量（默认100）
+            after_id: 游标，返回 user_id 小于该值的用户（上一页最后一个用户ID）
+            username_prefix: 用户名前缀（可选）
+            status: 账号状态 'active' / 'blocked'（可选）
+        """
         conn = self._get_conn()
         if not conn: return []
         
-        sql = "SELECT user_id, username, role, status, created_at FROM user ORDER BY user_id DESC"
+        conditions, params = self._user_filter(username_prefix, status)
+        if after_id:
+            conditions.append("user_id < %s")
+            params.append(after_id)
+        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+        sql = f"SELECT user_id, username, role, status, created_at FROM user {where_clause} ORDER BY user_id DESC LIMIT %s"
+        params.append(limit)
         try:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute(sql)
+                cur.execute(sql, params)
                 return cur.fetchall()
         except Exception as e:
             print(f"[DB EXEC ERROR] 查询用户列表失败: {e}")
             return []
         finally:
             conn.close()
+
+    def iter_users(self, username_prefix: str = None, status: str = None, batch_size: int = 500):
+        """流式读取全部符合条件的用户，每次产出一批（List[Dict]）
+        使用无缓冲的 SSDictCursor，结果集不在客户端整体缓存，内存占用只与 batch_size 有关；
+        迭代结束（或生成器被关闭）前会一直占用一个数据库连接
+        """
+        conn = self._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+        
+        conditions, params = self._user_filter(username_prefix, status)
+        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+        sql = f"SELECT user_id, username, role, status, created_at FROM user {where_clause} ORDER BY user_id DESC"
+        cur = None
+        try:
+            cur = conn.cursor(pymysql.cursors.SSDictCursor)
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            if cur:
+                # 未读完的结果集必须先读完/丢弃，连接才能正常关闭
+                cur.close()
+            conn.close()
             
     def update_user_status(self, user_id: int, status: str) -> Tuple[bool, str]:
         """更新用户状态 - 使用行锁防止并发冲突"""
@@ -243,8 +515,13 @@ class DBManager:
                 
                 if affected_rows == 0:
                     return False, "更新失败"
-                
-                return True, f"用户ID {user_id} 状态更新为 {status} 成功"
+            
+            # 封号提交后撤销该用户的全部会话，已登录的连接后续指令需重新登录（届时被拒绝）
+            if status == "blocked":
+                revoked = self.sessions.revoke_user(user_id)
+                if revoked:
+                    print(f"[DB INFO] 用户 {user_id} 已封禁，撤销会话 {revoked} 个")
+            return True, f"用户ID {user_id} 状态更新为 {status} 成功"
                 
         except Exception as e:
             print(f"[DB EXEC ERROR] 更新用户状态失败: {e}")
@@ -301,179 +578,10 @@ class DBManager:
             print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
             return False, f"更新失败: {str(e)}"
 
-    # ---------- 商品相关方法 ----------
-    def add_goods(self, user_id: int, title: str, description: str, category: str,
-                  price: float, brand: str = None, original_price: float = None,
-                  purchase_time: str = None, stock_quantity: int = 1,
-                  img_path: str = None) -> Tuple[bool, str, Optional[int]]:
-        """添加商品（发布商品，状态置为 pending_review）"""
-        conn = self._get_conn()
-        if not conn:
-            return False, "服务器数据库连接失败，请联系管理员", None
-
-        sql = """INSERT INTO goods (user_id, title, description, category, price, brand,
-                 original_price, purchase_time, stock_quantity, img_path, status)
-                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending_review')"""
-
-        cur = None
-        try:
-            cur = conn.cursor()
-            print(f"[DB DEBUG] 准备添加商品: user_id={user_id}, title={title}, category={category}")
-            cur.execute(sql, (user_id, title, description, category, price, brand,
-                              original_price, purchase_time, stock_quantity, img_path))
-            goods_id = cur.lastrowid
-            conn.commit()
-            print(f"[DB DEBUG] 商品添加成功: goods_id={goods_id}")
-            return True, "商品发布成功，等待审核", goods_id
-        except Exception as e:
-            print(f"[DB EXEC ERROR] 添加商品失败: {e}")
-            import traceback
-            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            try:
-                conn.rollback()
-            except:
-                pass
-            return False, f"商品发布失败: {str(e)}", None
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
-
-    def get_goods_list(self, category: str = None, page: int = 1, page_size: int = 20,
-                       status: str = None) -> Tuple[bool, str, List[Dict[str, Any]], int]:
-        """获取商品列表（分页查询）"""
-        conn = self._get_conn()
-        if not conn:
-            return False, "服务器数据库连接失败", [], 0
-
-        conditions = []
-        params = []
-        if category:
-            conditions.append("category = %s")
-            params.append(category)
-        if status:
-            conditions.append("status = %s")
-            params.append(status)
-        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-
-        count_sql = f"SELECT COUNT(*) as total FROM goods {where_clause}"
-        offset = (page - 1) * page_size
-        list_sql = f"""SELECT g.goods_id, g.user_id, g.title, g.description, g.category,
-                       g.brand, g.price, g.original_price, g.purchase_time,
-                       g.stock_quantity, g.sold_count, g.img_path, g.status, g.create_time,
-                       (SELECT img_path FROM goods_images WHERE goods_id = g.goods_id
-                        AND is_primary = 1 ORDER BY display_order LIMIT 1) as primary_image
-                       FROM goods g {where_clause}
-                       ORDER BY g.create_time DESC LIMIT %s OFFSET %s"""
-
-        cur = None
-        try:
-            cur = conn.cursor(pymysql.cursors.DictCursor)
-            cur.execute(count_sql, params)
-            total_result = cur.fetchone()
-            total_count = total_result['total'] if total_result else 0
-
-            list_params = params + [page_size, offset]
-            cur.execute(list_sql, list_params)
-            goods_list = cur.fetchall()
-
-            for goods in goods_list:
-                goods_id = goods['goods_id']
-                images_sql = """SELECT img_path, display_order, is_primary
-                                FROM goods_images
-                                WHERE goods_id = %s
-                                ORDER BY display_order ASC"""
-                cur.execute(images_sql, (goods_id,))
-                goods['images'] = cur.fetchall()
-
-            print(f"[DB DEBUG] 查询商品列表成功: category={category}, page={page}, 返回{len(goods_list)}条")
-            return True, "查询成功", goods_list, total_count
-        except Exception as e:
-            print(f"[DB EXEC ERROR] 查询商品列表失败: {e}")
-            import traceback
-            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            return False, f"查询失败: {str(e)}", [], 0
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
-
-    def audit_goods(self, goods_id: int, status: str, admin_user_id: int = None) -> Tuple[bool, str]:
-        """审核商品（管理员操作）- 使用行锁防止并发冲突"""
-        if status not in ('on_sale', 'rejected'):
-            return False, "无效的状态值，只能设置为 'on_sale'（在售）或 'rejected'（驳回）"
-
-        try:
-            with self.concurrency.transaction(isolation_level="REPEATABLE READ") as conn:
-                # 使用行锁查询，防止审核期间商品被修改
-                goods = self.concurrency.select_for_update(
-                    conn, 
-                    "goods", 
-                    "goods_id = %s", 
-                    (goods_id,)
-                )
-
-                if not goods:
-                    return False, "商品不存在"
-
-                # 检查当前状态
-                current_status = goods.get("status")
-                if current_status == status:
-                    return True, f"商品状态已经是 {status}，无需重复操作"
-                
-                # 更新状态
-                cur = conn.cursor()
-                cur.execute(
-                    "UPDATE goods SET status = %s WHERE goods_id = %s",
-                    (status, goods_id)
-                )
-                
-                print(f"[DB DEBUG] 商品审核成功: goods_id={goods_id}, {current_status} -> {status}")
-                status_msg = "已通过审核，商品已上架" if status == 'on_sale' else "审核未通过，商品已驳回"
-                return True, status_msg
-                
-        except Exception as e:
-            print(f"[DB EXEC ERROR] 审核商品失败: {e}")
-            import traceback
-            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            return False, f"审核失败: {str(e)}"
-
-    def add_goods_image(self, goods_id: int, img_path: str, display_order: int = 0,
-                        is_primary: int = 0) -> Tuple[bool, str]:
-        """添加商品图片到 goods_images 表"""
-        conn = self._get_conn()
-        if not conn:
-            return False, "服务器数据库连接失败"
-
-        sql = """INSERT INTO goods_images (goods_id, img_path, display_order, is_primary)
-                 VALUES (%s, %s, %s, %s)"""
-        cur = None
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, (goods_id, img_path, display_order, is_primary))
-            conn.commit()
-            print(f"[DB DEBUG] 商品图片添加成功: goods_id={goods_id}, img_path={img_path}")
-            return True, "图片添加成功"
-        except Exception as e:
-            print(f"[DB EXEC ERROR] 添加商品图片失败: {e}")
-            try:
-                conn.rollback()
-            except:
-                pass
-            return False, f"添加图片失败: {str(e)}"
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
-
     # ---------- 订单与收藏相关方法 ----------
     def _generate_order_no(self) -> str:
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        suffix = f"{random.randint(0, 9999):04d}"
-        return f"ORD{timestamp}{suffix}"
+        """生成订单编号（时间 + 节点号 + 进程内序号，不同进程、同一毫秒内也不会重复）"""
+        return self.order_ids.next_order_no()
 
     def get_goods_by_id(self, goods_id: int) -> Optional[Dict[str, Any]]:
         conn = self._get_conn()
@@ -491,84 +599,113 @@ class DBManager:
         finally:
             conn.close()
 
-    def add_order(self, buyer_id: int, goods_id: int, quantity: int = 1) -> Tuple[bool, str, Optional[int], Optional[str]]:
-        """下单：校验商品在售，创建订单（待付款），并将商品置为已售出"""
+    def get_order_by_id(self, order_id: int) -> Optional[Dict[str, Any]]:
+        """按主键查询订单归属和状态（会话权限校验用）"""
         conn = self._get_conn()
         if not conn:
-            return False, "服务器数据库连接失败", None, None
-
-        cur = None
+            return None
+        sql = "SELECT order_id, buyer_id, seller_id, status FROM `order` WHERE order_id=%s"
         try:
-            conn.autocommit(False)
-            cur = conn.cursor(pymysql.cursors.DictCursor)
-
-            # 查询商品并锁定（包含库存信息）
-            cur.execute("SELECT goods_id, user_id, price, status, stock_quantity, sold_count FROM goods WHERE goods_id=%s FOR UPDATE", (goods_id,))
-            goods = cur.fetchone()
-            if not goods:
-                conn.rollback()
-                return False, "商品不存在", None, None
-            if goods["status"] != "on_sale":
-                conn.rollback()
-                return False, "商品不可下单（非在售状态）", None, None
-            
-            # 检查库存是否充足
-            current_stock = goods["stock_quantity"]
-            if current_stock < quantity:
-                conn.rollback()
-                return False, f"库存不足，当前库存：{current_stock}，需要：{quantity}", None, None
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(sql, (order_id,))
+                return cur.fetchone()
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 查询订单失败: {e}")
+            return None
+        finally:
+            conn.close()
 
-            seller_id = goods["user_id"]
-            price = goods["price"]
-            total_price = float(price) * int(quantity)
-            order_no = self._generate_order_no()
+    def get_goods_owner(self, goods_id: int) -> Optional[int]:
+        """商品发布者ID（走归属缓存），商品不存在或查询失败返回 None"""
+        def load():
+            goods = self.get_goods_by_id(goods_id)
+            return goods["user_id"] if goods else None
+        owner, _ = self.owners.get_or_load(("goods", goods_id), load, cacheable=lambda v: v is not None)
+        return owner
+
+    def get_order_parties(self, order_id: int) -> Optional[Tuple[int, int]]:
+        """订单的 (买家ID, 卖家ID)（走归属缓存），订单不存在或查询失败返回 None"""
+        def load():
+            order = self.get_order_by_id(order_id)
+            return (order["buyer_id"], order["seller_id"]) if order else None
+        parties, _ = self.owners.get_or_load(("order", order_id), load, cacheable=lambda v: v is not None)
+        return parties
+
+    def _load_goods_stock(self, goods_id: int) -> Optional[Dict[str, Any]]:
+        """库存预占首次访问商品时调用：读取商品状态和库存（不加锁）"""
+        conn = self._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute("SELECT status, stock_quantity FROM goods WHERE goods_id=%s", (goods_id,))
+                return cur.fetchone()
+        finally:
+            conn.close()
 
-            # 创建订单
-            cur.execute(
-                "INSERT INTO `order` (order_no, buyer_id, seller_id, goods_id, quantity, total_price, status) "
-                "VALUES (%s, %s, %s, %s, %s, %s, 'pending_payment')",
-                (order_no, buyer_id, seller_id, goods_id, quantity, total_price)
-            )
-            order_id = cur.lastrowid
+    def add_order(self, buyer_id: int, goods_id: int, quantity: int = 1) -> Tuple[bool, str, Optional[int], Optional[str]]:
+        """下单：校验商品在售，创建订单（待付款），并扣减库存（库存为0时商品置为已售出）
+        
+        先在内存中预占库存，库存不足或商品不在售时直接拒绝，不访问数据库；
+        预占成功后交给订单写入器，与其它并发订单合并在一个事务中落库（数据库侧仍按库存校验）
+        """
+        try:
+            buyer_id, goods_id, quantity = int(buyer_id), int(goods_id), int(quantity)
+        except (TypeError, ValueError):
+            return False, "买家ID、商品ID和购买数量必须为整数", None, None
+        if quantity <= 0:
+            return False, "购买数量必须大于0", None, None
 
-            # 更新商品：状态改为已售出，减少库存，增加已售数量
-            new_stock = current_stock - quantity
-            new_sold_count = goods["sold_count"] + quantity
-            
-            # 如果库存为0，状态改为sold；如果还有库存，保持on_sale（允许继续销售）
-            new_status = 'sold' if new_stock == 0 else 'on_sale'
-            
-            cur.execute(
-                "UPDATE goods SET status=%s, stock_quantity=%s, sold_count=%s WHERE goods_id=%s",
-                (new_status, new_stock, new_sold_count, goods_id)
-            )
+        try:
+            reserved, msg, stock_generation = self.stock.reserve(goods_id, quantity)
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 加载商品库存失败: {e}")
+            return False, "服务器数据库连接失败", None, None
+        if not reserved:
+            return False, msg, None, None
 
-            conn.commit()
-            print(f"[DB DEBUG] 订单创建成功: order_id={order_id}, order_no={order_no}")
-            return True, "下单成功，待付款", order_id, order_no
+        try:
+            result = self.order_writer.submit((buyer_id, goods_id, quantity)).result(timeout=self.WRITER_WAIT_TIMEOUT)
+        except (CommitUncertainError, FutureTimeoutError) as e:
+            # 订单可能已经落库：释放预占并重新加载库存，提示用户到订单列表确认，避免重复下单
+            self.stock.release(goods_id, quantity, reload=True)
+            self.stat_user_cache.invalidate(int(buyer_id))
+            print(f"[DB EXEC ERROR] 订单提交结果未知: {e.__cause__ or repr(e)}")
+            return False, "下单结果未知，请在我的订单中确认后再重新下单", None, None
         except Exception as e:
+            self.stock.release(goods_id, quantity)
             print(f"[DB EXEC ERROR] 创建订单失败: {e}")
             import traceback
             print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            try:
-                conn.rollback()
-            except:
-                pass
             return False, f"下单失败: {str(e)}", None, None
-        finally:
-            if cur:
-                cur.close()
-            try:
-                conn.autocommit(True)
-            except:
-                pass
-            if conn:
-                conn.close()
+
+        if not result["success"]:
+            # 数据库拒绝了内存放行的订单，说明内存库存已过期，释放预占并重新加载
+            self.stock.release(goods_id, quantity, reload=True)
+            return False, result["msg"], None, None
+
+        self.stock.confirm(goods_id, quantity, stock_generation)
+        self.stat_user_cache.invalidate(int(buyer_id))
+        print(f"[DB DEBUG] 订单创建成功: order_id={result['order_id']}, order_no={result['order_no']}")
+        return True, result["msg"], result["order_id"], result["order_no"]
 
     def update_order_status(self, order_id: int, new_status: str) -> Tuple[bool, str]:
         """按流程更新订单状态：pending_payment→pending_shipment→pending_receipt→completed
         注意：订单取消时需要恢复商品库存
+        遇到死锁、锁等待超时时按重试策略退避后重新执行整个事务
         """
+        try:
+            return self.concurrency.retry_policy.run(
+                lambda: self._update_order_status_once(order_id, new_status), table="order"
+            )
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 更新订单状态失败: {e}")
+            import traceback
+            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
+            return False, f"订单状态更新失败: {str(e)}"
+
+    def _update_order_status_once(self, order_id: int, new_status: str) -> Tuple[bool, str]:
+        """update_order_status 的单次事务；数据库错误回滚后抛出，由重试策略决定是否重试"""
         allowed = {
             "pending_payment": "pending_shipment",
             "pending_shipment": "pending_receipt",
@@ -585,13 +722,16 @@ class DBManager:
             cur = conn.cursor(pymysql.cursors.DictCursor)
             
             # 查询订单信息（包含商品ID和数量）
-            cur.execute("SELECT status, goods_id, quantity FROM `order` WHERE order_id=%s FOR UPDATE", (order_id,))
+            cur.execute("SELECT status, buyer_id, goods_id, quantity, completed_at FROM `order` WHERE order_id=%s FOR UPDATE", (order_id,))
             row = cur.fetchone()
             if not row:
                 conn.rollback()
                 return False, "订单不存在"
 
             current_status = row["status"]
+            goods_status_change = None
+            restock = None
+            goods_category = None
             
             # 处理订单取消：恢复商品库存
             if new_status == "canceled" and current_status != "canceled":
@@ -599,9 +739,10 @@ class DBManager:
                 quantity = row["quantity"]
                 
                 # 恢复商品库存和状态
-                cur.execute("SELECT stock_quantity, sold_count, status FROM goods WHERE goods_id=%s FOR UPDATE", (goods_id,))
+                cur.execute("SELECT category, stock_quantity, sold_count, status FROM goods WHERE goods_id=%s FOR UPDATE", (goods_id,))
                 goods = cur.fetchone()
                 if goods:
+                    goods_category = goods["category"]
                     new_stock = goods["stock_quantity"] + quantity
                     new_sold_count = max(0, goods["sold_count"] - quantity)
                     # 如果商品状态是sold且恢复库存后>0，改回on_sale
@@ -611,6 +752,8 @@ class DBManager:
                         "UPDATE goods SET stock_quantity=%s, sold_count=%s, status=%s WHERE goods_id=%s",
                         (new_stock, new_sold_count, new_goods_status, goods_id)
                     )
+                    goods_status_change = (goods_id, goods["category"], goods["status"], new_goods_status)
+                    restock = (goods_id, quantity, new_goods_status)
                     print(f"[DB DEBUG] 订单取消，恢复商品库存: goods_id={goods_id}, 恢复数量={quantity}")
             
             # 检查状态流转是否合法
@@ -620,54 +763,193 @@ class DBManager:
                     conn.rollback()
                     return False, f"非法的状态流转，当前状态 {current_status} 无法变更为 {new_status}"
 
-            # 更新订单状态
-            cur.execute("UPDATE `order` SET status=%s WHERE order_id=%s", (new_status, order_id))
+            # 更新订单状态，同时记录对应环节的时间
+            timestamp_columns = {
+                "pending_shipment": ["paid_at"],
+                "pending_receipt": ["shipped_at"],
+                "completed": ["received_at", "completed_at"],
+                "canceled": ["canceled_at"],
+            }.get(new_status, [])
+            set_clause = ", ".join(["status=%s"] + [f"{col}=CURRENT_TIMESTAMP" for col in timestamp_columns])
+            cur.execute(f"UPDATE `order` SET {set_clause} WHERE order_id=%s", (new_status, order_id))
+
+            # 同一事务内维护成交汇总表：完成 +1；已完成的订单被取消时按原完成日期 -1
+            completion_delta = 0
+            if new_status == "completed":
+                completion_delta = 1
+            elif new_status == "canceled" and current_status == "completed":
+                completion_delta = -1
+            if completion_delta:
+                if goods_category is None:
+                    cur.execute("SELECT category FROM goods WHERE goods_id=%s", (row["goods_id"],))
+                    goods_row = cur.fetchone()
+                    goods_category = goods_row["category"] if goods_row else None
+                completed_date = row["completed_at"].date() if completion_delta < 0 and row["completed_at"] else None
+                self._rollup_order_completed(cur, row["buyer_id"], goods_category, completion_delta, completed_date)
+            conn.commit()
+            if goods_status_change:
+                self._on_goods_changed(*goods_status_change)
+            if restock:
+                # 取消订单归还的库存同步到内存预占表
+                self.stock.restock(*restock)
+            self.stat_user_cache.invalidate(row["buyer_id"])
+            print(f"[DB DEBUG] 订单状态更新成功: order_id={order_id}, {current_status} -> {new_status}")
+            return True, "订单状态更新成功"
+        except Exception:
+            try:
+                conn.rollback()
+            except:
+                pass
+            raise
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                conn.close()
+
+    def expire_unpaid_orders(self, ttl_seconds: int, batch_size: int = 100) -> int:
+        """取消一批超时未付款的订单并归还库存（一个事务），返回本批取消的订单数
+        
+        使用 FOR UPDATE SKIP LOCKED 领取订单：多台服务器同时执行时各自处理不同的订单，
+        正在被用户付款/取消（已加锁）的订单留到下一轮；遇到死锁等冲突时按重试策略重新执行
+        
+        Args:
+            ttl_seconds: 待付款订单的有效期（秒），下单时间早于 当前时间-ttl_seconds 的订单被取消
+            batch_size: 单个事务最多取消的订单数
+        """
+        return self.concurrency.retry_policy.run(
+            lambda: self._expire_unpaid_orders_once(ttl_seconds, batch_size), table="order"
+        )
+
+    def _expire_unpaid_orders_once(self, ttl_seconds: int, batch_size: int) -> int:
+        """expire_unpaid_orders 的单次事务"""
+        conn = self._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+
+        cur = None
+        try:
+            conn.autocommit(False)
+            cur = conn.cursor(pymysql.cursors.DictCursor)
+            # 走 idx_status_created 范围扫描，只锁定本批订单
+            cur.execute(
+                "SELECT order_id, buyer_id, goods_id, quantity FROM `order` "
+                "WHERE status='pending_payment' AND created_at < NOW() - INTERVAL %s SECOND "
+                "ORDER BY created_at, order_id LIMIT %s FOR UPDATE SKIP LOCKED",
+                (int(ttl_seconds), int(batch_size))
+            )
+            orders = cur.fetchall()
+            if not orders:
+                conn.rollback()
+                return 0
+
+            order_ids = [row["order_id"] for row in orders]
+            cur.execute(
+                f"UPDATE `order` SET status='canceled', canceled_at=CURRENT_TIMESTAMP "
+                f"WHERE order_id IN ({', '.join(['%s'] * len(order_ids))})",
+                order_ids
+            )
+
+            # 按商品汇总归还数量，商品行按 goods_id 顺序加锁，每个商品只更新一次
+            restore: Dict[int, int] = {}
+            for row in orders:
+                restore[row["goods_id"]] = restore.get(row["goods_id"], 0) + row["quantity"]
+            goods_ids = sorted(restore)
+            cur.execute(
+                f"SELECT goods_id, category, stock_quantity, sold_count, status FROM goods "
+                f"WHERE goods_id IN ({', '.join(['%s'] * len(goods_ids))}) ORDER BY goods_id FOR UPDATE",
+                goods_ids
+            )
+            goods_changes = []
+            for goods in cur.fetchall():
+                quantity = restore[goods["goods_id"]]
+                new_stock = goods["stock_quantity"] + quantity
+                new_sold_count = max(0, goods["sold_count"] - quantity)
+                # 如果商品状态是sold且恢复库存后>0，改回on_sale
+                new_goods_status = 'on_sale' if (goods["status"] == 'sold' and new_stock > 0) else goods["status"]
+                cur.execute(
+                    "UPDATE goods SET stock_quantity=%s, sold_count=%s, status=%s WHERE goods_id=%s",
+                    (new_stock, new_sold_count, new_goods_status, goods["goods_id"])
+                )
+                goods_changes.append((goods["goods_id"], goods["category"], goods["status"], new_goods_status, quantity))
             conn.commit()
-            print(f"[DB DEBUG] 订单状态更新成功: order_id={order_id}, {current_status} -> {new_status}")
-            return True, "订单状态更新成功"
-        except Exception as e:
-            print(f"[DB EXEC ERROR] 更新订单状态失败: {e}")
-            import traceback
-            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
+        except Exception:
             try:
                 conn.rollback()
             except:
                 pass
-            return False, f"订单状态更新失败: {str(e)}"
+            raise
         finally:
             if cur:
                 cur.close()
-            if conn:
-                conn.close()
+            try:
+                conn.autocommit(True)
+            except:
+                pass
+            conn.close()
+
+        # 提交后维护缓存：商品计数/列表页、内存库存预占、买家的个人统计
+        for goods_id, category, old_status, new_status, quantity in goods_changes:
+            self._on_goods_changed(goods_id, category, old_status, new_status)
+            self.stock.restock(goods_id, quantity, new_status)
+        for buyer_id in {row["buyer_id"] for row in orders}:
+            self.stat_user_cache.invalidate(buyer_id)
+        print(f"[DB INFO] 超时未付款订单已取消: {len(orders)} 个，归还库存的商品 {len(goods_changes)} 个")
+        return len(orders)
+
+    def get_orders(self, user_id: int, status: str = None, role: str = "buyer", cursor: str = None,
+                   page_size: int = 20) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """按买家或卖家ID和可选状态查询订单（按下单时间倒序）
+        
+        Args:
+            user_id: 买家ID（role="buyer"）或卖家ID（role="seller"）
+            status: 订单状态（可选）
+            role: buyer=我买到的（走 idx_buyer_*），seller=我卖出的（走 idx_seller_*）
+            cursor: 游标（可选）。None=返回全部订单；""=游标分页第一页；
+                    其它值为上一页最后一条订单的 encode_cursor(created_at, order_id) 结果
+            page_size: 游标分页时的每页数量
+        """
+        if role not in ("buyer", "seller"):
+            return False, "无效的角色，只能为 buyer 或 seller", []
+        seek = None
+        if cursor:
+            seek = self.decode_cursor(cursor)
+            if seek is None:
+                return False, "无效的分页游标", []
 
-    def get_orders(self, buyer_id: int, status: str = None) -> Tuple[bool, str, List[Dict[str, Any]]]:
-        """按买家ID和可选状态查询订单"""
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
-        conditions = ["o.buyer_id = %s"]
-        params = [buyer_id]
+        conditions = [f"o.{role}_id = %s"]
+        params = [user_id]
         if status:
             conditions.append("o.status = %s")
             params.append(status)
+        # 游标分页：从上一页最后一条 (created_at, order_id) 之后直接定位
+        if seek:
+            conditions.append("(o.created_at < %s OR (o.created_at = %s AND o.order_id < %s))")
+            params.extend([seek[0], seek[0], seek[1]])
         where_clause = "WHERE " + " AND ".join(conditions)
+        limit_clause = ""
+        if cursor is not None:
+            limit_clause = "LIMIT %s"
+            params.append(int(page_size))
 
         sql = f"""SELECT o.order_id, o.order_no, o.buyer_id, o.seller_id, o.goods_id,
                          o.quantity, o.total_price, o.status, o.created_at, o.updated_at,
-                         g.title, g.img_path,
-                         (SELECT img_path FROM goods_images WHERE goods_id=g.goods_id AND is_primary=1
-                          ORDER BY display_order LIMIT 1) as primary_image
+                         g.title, g.img_path
                   FROM `order` o
                   JOIN goods g ON o.goods_id = g.goods_id
                   {where_clause}
-                  ORDER BY o.created_at DESC"""
+                  ORDER BY o.created_at DESC, o.order_id DESC {limit_clause}"""
 
         cur = None
         try:
             cur = conn.cursor(pymysql.cursors.DictCursor)
             cur.execute(sql, params)
             rows = cur.fetchall()
+            self._attach_goods_images(cur, rows, with_images=False)
             return True, "查询成功", rows
         except Exception as e:
             print(f"[DB EXEC ERROR] 查询订单失败: {e}")
@@ -680,38 +962,192 @@ class DBManager:
             if conn:
                 conn.close()
 
-    # ---------- 统计分析相关方法（用于 DATA_STAT） ----------
-    def stat_category_goods(self) -> Tuple[bool, str, List[Dict[str, Any]]]:
-        """统计各分类商品数量（总数 + 在售数）"""
+    def count_orders(self, user_id: int, role: str = "buyer", status: str = None) -> Tuple[bool, str, Dict[str, Any]]:
+        """只统计订单数量（卖家看板等场景无需拉取订单明细），按状态分组，只扫描 (seller_id/buyer_id, status) 索引
+        
+        Returns:
+            (success, message, {"total": int, "by_status": {status: count}})
+        """
+        if role not in ("buyer", "seller"):
+            return False, "无效的角色，只能为 buyer 或 seller", {}
         conn = self._get_conn()
         if not conn:
-            return False, "服务器数据库连接失败", []
+            return False, "服务器数据库连接失败", {}
 
-        sql = """
-            SELECT
-              category,
-              SUM(CASE WHEN status = 'on_sale' THEN 1 ELSE 0 END) AS on_sale_count,
-              COUNT(*) AS total_count
-            FROM goods
-            GROUP BY category
-            ORDER BY total_count DESC
-        """
+        conditions = [f"{role}_id = %s"]
+        params = [user_id]
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        sql = f"SELECT status, COUNT(*) AS cnt FROM `order` WHERE {' AND '.join(conditions)} GROUP BY status"
         try:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-                return True, "查询成功", rows
+                cur.execute(sql, params)
+                by_status = {row["status"]: row["cnt"] for row in cur.fetchall()}
+            return True, "查询成功", {"total": sum(by_status.values()), "by_status": by_status}
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 统计订单数量失败: {e}")
+            return False, f"统计订单数量失败: {str(e)}", {}
+        finally:
+            conn.close()
+
+    # ---------- 统计分析相关方法（用于 DATA_STAT） ----------
+    # 统计数据来自订单写路径增量维护的汇总表（stat_daily_orders、stat_daily_category_completed、
+    # stat_user_category），查询只扫描小表；口径变化或数据修复后可用 rebuild_stat_rollups 重建
+    # stat_daily_orders 每天分成 STAT_ORDER_SLOTS 行，写入时随机选一行累加、读取时按天求和，
+    # 避免所有下单/成交事务都排队等待当天这一行的行锁
+
+    STAT_ORDER_SLOTS = 16
+    # 统计查询在数据库侧的最长执行时间（毫秒），与 DATA_STAT 单次请求截止时间一致：
+    # 超时的子查询由 MySQL 中止，不会在请求返回后继续占用统计线程池和数据库
+    STAT_QUERY_TIMEOUT_MS = 2000
+
+    def _get_stat_conn(self):
+        """获取统计查询用的连接：会话级设置 MAX_EXECUTION_TIME（只作用于只读 SELECT）"""
+        conn = self._get_conn()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET SESSION MAX_EXECUTION_TIME = %s", (self.STAT_QUERY_TIMEOUT_MS,))
+        except Exception as e:
+            # 不支持该变量的数据库（如 MariaDB）仍照常查询，只是无法在库侧中止
+            print(f"[DB WARN] 设置统计查询超时失败: {e}")
+        return conn
+
+    @classmethod
+    def _rollup_order_created(cls, cur, orders: int = 1) -> None:
+        """下单时调用（与订单插入同一事务）：当天下单数 +orders"""
+        cur.execute(
+            "INSERT INTO stat_daily_orders (stat_date, slot, orders, completed) VALUES (CURDATE(), %s, %s, 0) "
+            "ON DUPLICATE KEY UPDATE orders = orders + VALUES(orders)",
+            (random.randrange(cls.STAT_ORDER_SLOTS), orders)
+        )
+
+    @classmethod
+    def _rollup_order_completed(cls, cur, buyer_id: int, category: Optional[str], delta: int,
+                                completed_date=None) -> None:
+        """订单完成（delta=1）或已完成订单被取消（delta=-1）时调用，与订单更新同一事务
+        
+        Args:
+            completed_date: 成交日期，None 表示今天
+        """
+        # 单个分片行可以为负（-1 落在了另一行上），按天求和后才是当天成交数
+        cur.execute(
+            "INSERT INTO stat_daily_orders (stat_date, slot, orders, completed) "
+            "VALUES (COALESCE(%s, CURDATE()), %s, 0, %s) "
+            "ON DUPLICATE KEY UPDATE completed = completed + VALUES(completed)",
+            (completed_date, random.randrange(cls.STAT_ORDER_SLOTS), delta)
+        )
+        if category is None:
+            return
+        cur.execute(
+            "INSERT INTO stat_daily_category_completed (stat_date, category, completed) "
+            "VALUES (COALESCE(%s, CURDATE()), %s, %s) "
+            "ON DUPLICATE KEY UPDATE completed = GREATEST(0, completed + VALUES(completed))",
+            (completed_date, category, delta)
+        )
+        cur.execute(
+            "INSERT INTO stat_user_category (buyer_id, category, completed_count) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE completed_count = GREATEST(0, completed_count + VALUES(completed_count))",
+            (buyer_id, category, delta)
+        )
+
+    def rebuild_stat_rollups(self) -> Tuple[bool, str]:
+        """根据订单表全量重建统计汇总表（回填任务），在一个事务中清空并重新聚合"""
+        conn = self._get_conn()
+        if not conn:
+            return False, "服务器数据库连接失败"
+
+        cur = None
+        try:
+            conn.autocommit(False)
+            cur = conn.cursor()
+            cur.execute("DELETE FROM stat_daily_orders")
+            cur.execute("DELETE FROM stat_daily_category_completed")
+            cur.execute("DELETE FROM stat_user_category")
+            cur.execute("""
+                INSERT INTO stat_daily_orders (stat_date, slot, orders, completed)
+                SELECT dt, 0, SUM(orders), SUM(completed)
+                FROM (
+                    SELECT DATE(created_at) AS dt, COUNT(*) AS orders, 0 AS completed
+                    FROM `order`
+                    WHERE created_at IS NOT NULL
+                    GROUP BY DATE(created_at)
+                    UNION ALL
+                    SELECT DATE(completed_at) AS dt, 0 AS orders, COUNT(*) AS completed
+                    FROM `order`
+                    WHERE status = 'completed' AND completed_at IS NOT NULL
+                    GROUP BY DATE(completed_at)
+                ) AS t
+                GROUP BY dt
+            """)
+            days = cur.rowcount
+            cur.execute("""
+                INSERT INTO stat_daily_category_completed (stat_date, category, completed)
+                SELECT DATE(o.completed_at), g.category, COUNT(*)
+                FROM `order` o
+                JOIN goods g ON o.goods_id = g.goods_id
+                WHERE o.status = 'completed' AND o.completed_at IS NOT NULL
+                GROUP BY DATE(o.completed_at), g.category
+            """)
+            cur.execute("""
+                INSERT INTO stat_user_category (buyer_id, category, completed_count)
+                SELECT o.buyer_id, g.category, COUNT(*)
+                FROM `order` o
+                JOIN goods g ON o.goods_id = g.goods_id
+                WHERE o.status = 'completed'
+                GROUP BY o.buyer_id, g.category
+            """)
+            users = cur.rowcount
+            conn.commit()
+            print(f"[DB DEBUG] 统计汇总表重建完成: {days} 天, {users} 个用户分类组合")
+            return True, f"统计汇总表重建完成（{days} 天）"
         except Exception as e:
-            print(f"[DB EXEC ERROR] 分类商品统计失败: {e}")
+            print(f"[DB EXEC ERROR] 重建统计汇总表失败: {e}")
             import traceback
             print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            return False, f"查询失败: {str(e)}", []
+            try:
+                conn.rollback()
+            except:
+                pass
+            return False, f"重建失败: {str(e)}"
         finally:
+            if cur:
+                cur.close()
             conn.close()
 
+    def stat_category_goods(self) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """统计各分类商品数量（总数 + 在售数），直接来自商品计数缓存"""
+        if self.goods_counts.is_stale():
+            conn = self._get_stat_conn()
+            if not conn:
+                return False, "服务器数据库连接失败", []
+            try:
+                with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                    self._count_goods(cur)
+            except Exception as e:
+                print(f"[DB EXEC ERROR] 分类商品统计失败: {e}")
+                import traceback
+                print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
+                return False, f"查询失败: {str(e)}", []
+            finally:
+                conn.close()
+
+        rows = [
+            {
+                "category": category,
+                "on_sale_count": statuses.get("on_sale", 0),
+                "total_count": sum(statuses.values()),
+            }
+            for category, statuses in self.goods_counts.counts_by_category().items()
+        ]
+        rows.sort(key=lambda r: r["total_count"], reverse=True)
+        return True, "查询成功", rows
+
     def stat_user_order_status(self, buyer_id: int) -> Tuple[bool, str, List[Dict[str, Any]]]:
         """统计某个用户的订单状态分布"""
-        conn = self._get_conn()
+        conn = self._get_stat_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
@@ -739,49 +1175,35 @@ class DBManager:
         统计最近 N 天下单数和成交数（按天）
         返回列表：[{date: 'YYYY-MM-DD', orders: x, completed: y}, ...]
         """
-        conn = self._get_conn()
+        conn = self._get_stat_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
-        # 下单数（按 created_at）
-        orders_sql = """
-            SELECT DATE(created_at) AS dt, COUNT(*) AS orders
-            FROM `order`
-            WHERE created_at >= CURDATE() - INTERVAL %s DAY
-            GROUP BY DATE(created_at)
-        """
-        # 成交数（按 completed_at）
-        completed_sql = """
-            SELECT DATE(completed_at) AS dt, COUNT(*) AS completed
-            FROM `order`
-            WHERE status = 'completed'
-              AND completed_at IS NOT NULL
-              AND completed_at >= CURDATE() - INTERVAL %s DAY
-            GROUP BY DATE(completed_at)
+        sql = """
+            SELECT stat_date AS dt, CAST(SUM(orders) AS SIGNED) AS orders,
+                   CAST(GREATEST(0, SUM(completed)) AS SIGNED) AS completed
+            FROM stat_daily_orders
+            WHERE stat_date >= CURDATE() - INTERVAL %s DAY
+            GROUP BY stat_date
         """
         try:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute(orders_sql, (days - 1,))
-                orders_rows = cur.fetchall()
-                cur.execute(completed_sql, (days - 1,))
-                completed_rows = cur.fetchall()
-
-            # 转成字典方便 merge
-            orders_map = {row["dt"].strftime("%Y-%m-%d"): row["orders"] for row in orders_rows}
-            completed_map = {
-                row["dt"].strftime("%Y-%m-%d"): row["completed"] for row in completed_rows
-            }
+                cur.execute(sql, (days - 1,))
+                rows = cur.fetchall()
+
+            day_map = {row["dt"].strftime("%Y-%m-%d"): row for row in rows}
 
             result: List[Dict[str, Any]] = []
             today = datetime.now().date()
             for i in range(days - 1, -1, -1):
                 day = today - timedelta(days=i)
                 key = day.strftime("%Y-%m-%d")
+                row = day_map.get(key)
                 result.append(
                     {
                         "date": key,
-                        "orders": int(orders_map.get(key, 0)),
-                        "completed": int(completed_map.get(key, 0)),
+                        "orders": int(row["orders"]) if row else 0,
+                        "completed": int(row["completed"]) if row else 0,
                     }
                 )
 
@@ -796,20 +1218,18 @@ class DBManager:
 
     def stat_hot_categories_top5(self, days: int = 30) -> Tuple[bool, str, List[Dict[str, Any]]]:
         """按成交量统计热门分类 TOP5（最近 days 天）"""
-        conn = self._get_conn()
+        conn = self._get_stat_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
         sql = """
             SELECT
-              g.category,
-              COUNT(*) AS completed_orders
-            FROM `order` o
-            JOIN goods g ON o.goods_id = g.goods_id
-            WHERE o.status = 'completed'
-              AND o.completed_at IS NOT NULL
-              AND o.completed_at >= CURDATE() - INTERVAL %s DAY
-            GROUP BY g.category
+              category,
+              CAST(SUM(completed) AS SIGNED) AS completed_orders
+            FROM stat_daily_category_completed
+            WHERE stat_date >= CURDATE() - INTERVAL %s DAY
+            GROUP BY category
+            HAVING completed_orders > 0
             ORDER BY completed_orders DESC
             LIMIT 5
         """
@@ -828,19 +1248,15 @@ class DBManager:
 
     def stat_user_favorite_categories(self, buyer_id: int) -> Tuple[bool, str, List[Dict[str, Any]]]:
         """按已完成订单统计用户的偏好分类（购买次数）"""
-        conn = self._get_conn()
+        conn = self._get_stat_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
         sql = """
-            SELECT
-              g.category,
-              COUNT(*) AS buy_count
-            FROM `order` o
-            JOIN goods g ON o.goods_id = g.goods_id
-            WHERE o.buyer_id = %s
-              AND o.status = 'completed'
-            GROUP BY g.category
+            SELECT category, completed_count AS buy_count
+            FROM stat_user_category
+            WHERE buyer_id = %s
+              AND completed_count > 0
             ORDER BY buy_count DESC
         """
         try:
@@ -861,17 +1277,15 @@ class DBManager:
         统计最近 N 天每天的成交数量，用于移动平均 / 预测
         返回：[{date: 'YYYY-MM-DD', completed: x}, ...]
         """
-        conn = self._get_conn()
+        conn = self._get_stat_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
         sql = """
-            SELECT DATE(completed_at) AS dt, COUNT(*) AS completed
-            FROM `order`
-            WHERE status = 'completed'
-              AND completed_at IS NOT NULL
-              AND completed_at >= CURDATE() - INTERVAL %s DAY
-            GROUP BY DATE(completed_at)
+            SELECT stat_date AS dt, CAST(GREATEST(0, SUM(completed)) AS SIGNED) AS completed
+            FROM stat_daily_orders
+            WHERE stat_date >= CURDATE() - INTERVAL %s DAY
+            GROUP BY stat_date
         """
         try:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
@@ -893,10 +1307,43 @@ class DBManager:
             print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
             return False, f"查询失败: {str(e)}", []
         finally:
-                conn.close()
+            conn.close()
+
+    def stat_category_completed_history(self, days: int = 84) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """
+        最近 N 天每天每分类的成交数明细（一次查询取全部分类），供需求预测使用
+        返回：[{stat_date: date, category: str, completed: int}, ...]，没有成交的日期不返回
+        """
+        conn = self._get_stat_conn()
+        if not conn:
+            return False, "服务器数据库连接失败", []
+
+        sql = """
+            SELECT stat_date, category, completed
+            FROM stat_daily_category_completed
+            WHERE stat_date >= CURDATE() - INTERVAL %s DAY
+              AND completed > 0
+        """
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(sql, (days - 1,))
+                rows = cur.fetchall()
+                return True, "查询成功", rows
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 分类成交历史查询失败: {e}")
+            import traceback
+            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
+            return False, f"查询失败: {str(e)}", []
+        finally:
+            conn.close()
 
     # ---------- 收藏相关 ----------
     def add_collect(self, user_id: int, goods_id: int) -> Tuple[bool, str]:
+        try:
+            # 统一为整数：收藏集合缓存按整数ID维护
+            user_id, goods_id = int(user_id), int(goods_id)
+        except (TypeError, ValueError):
+            return False, "用户ID和商品ID必须为整数"
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败"
@@ -907,10 +1354,12 @@ class DBManager:
             cur = conn.cursor()
             cur.execute(sql, (user_id, goods_id))
             conn.commit()
+            self.collected.add(user_id, goods_id)
             return True, "收藏成功"
         except pymysql.IntegrityError as e:
             # 1062 重复收藏
             if e.args and e.args[0] == 1062:
+                self.collected.add(user_id, goods_id)
                 return False, "已收藏该商品"
             return False, f"收藏失败: {e}"
         except Exception as e:
@@ -926,24 +1375,48 @@ class DBManager:
             if conn:
                 conn.close()
 
-    def get_collects(self, user_id: int) -> Tuple[bool, str, List[Dict[str, Any]]]:
+    def get_collects(self, user_id: int, cursor: str = None,
+                     page_size: int = 20) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """查询用户收藏（按收藏时间倒序）
+        
+        Args:
+            cursor: 游标（可选）。None=返回全部收藏；""=游标分页第一页；
+                    其它值为上一页最后一条的 encode_cursor(collected_at, collect_id) 结果
+            page_size: 游标分页时的每页数量
+        """
+        seek = None
+        if cursor:
+            seek = self.decode_cursor(cursor)
+            if seek is None:
+                return False, "无效的分页游标", []
+
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
 
-        sql = """SELECT c.collect_id, c.goods_id, c.collected_at,
-                        g.title, g.price, g.status, g.img_path,
-                        (SELECT img_path FROM goods_images WHERE goods_id=g.goods_id AND is_primary=1
-                         ORDER BY display_order LIMIT 1) as primary_image
-                 FROM collect c
-                 JOIN goods g ON c.goods_id = g.goods_id
-                 WHERE c.user_id = %s
-                 ORDER BY c.collected_at DESC"""
+        conditions = ["c.user_id = %s"]
+        params = [user_id]
+        # 游标分页：从上一页最后一条 (collected_at, collect_id) 之后直接定位（走 idx_user_collected）
+        if seek:
+            conditions.append("(c.collected_at < %s OR (c.collected_at = %s AND c.collect_id < %s))")
+            params.extend([seek[0], seek[0], seek[1]])
+        limit_clause = ""
+        if cursor is not None:
+            limit_clause = "LIMIT %s"
+            params.append(int(page_size))
+
+        sql = f"""SELECT c.collect_id, c.goods_id, c.collected_at,
+                         g.title, g.price, g.status, g.img_path
+                  FROM collect c
+                  JOIN goods g ON c.goods_id = g.goods_id
+                  WHERE {" AND ".join(conditions)}
+                  ORDER BY c.collected_at DESC, c.collect_id DESC {limit_clause}"""
         cur = None
         try:
             cur = conn.cursor(pymysql.cursors.DictCursor)
-            cur.execute(sql, (user_id,))
+            cur.execute(sql, params)
             rows = cur.fetchall()
+            self._attach_goods_images(cur, rows, with_images=False)
             return True, "查询成功", rows
         except Exception as e:
             print(f"[DB EXEC ERROR] 查询收藏失败: {e}")
@@ -956,7 +1429,40 @@ class DBManager:
             if conn:
                 conn.close()
 
+    def _load_collected_ids(self, user_id: int) -> List[int]:
+        """读取用户全部已收藏商品ID（只扫描 uk_user_goods 索引，不回表、不关联商品），数据库不可用时抛出异常"""
+        conn = self._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT goods_id FROM collect WHERE user_id = %s", (user_id,))
+            return [goods_id for (goods_id,) in cur.fetchall()]
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+
+    def check_collected(self, user_id: int, goods_ids: List[int]) -> Tuple[bool, str, Dict[int, bool]]:
+        """批量判断商品是否已被用户收藏（列表页收藏图标），命中收藏集合缓存时不访问数据库
+        
+        Returns:
+            (success, message, {goods_id: 是否已收藏})
+        """
+        try:
+            result = self.collected.check(user_id, goods_ids, lambda: self._load_collected_ids(user_id))
+            return True, "查询成功", result
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 查询收藏状态失败: {e}")
+            return False, f"查询收藏状态失败: {str(e)}", {}
+
     def del_collect(self, user_id: int, goods_id: int) -> Tuple[bool, str]:
+        try:
+            # 统一为整数：收藏集合缓存按整数ID维护
+            user_id, goods_id = int(user_id), int(goods_id)
+        except (TypeError, ValueError):
+            return False, "用户ID和商品ID必须为整数"
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败"
@@ -967,6 +1473,7 @@ class DBManager:
             cur = conn.cursor()
             cur.execute(sql, (user_id, goods_id))
             conn.commit()
+            self.collected.remove(user_id, goods_id)
             if cur.rowcount == 0:
                 return False, "未找到收藏记录"
             return True, "取消收藏成功"
@@ -1021,6 +1528,8 @@ class DBManager:
                             original_price, purchase_time, stock_quantity, img_path))
             goods_id = cur.lastrowid
             conn.commit()
+            self.goods_counts.apply_delta(category, 'pending_review', 1)
+            self.goods_list_cache.invalidate_filter(category, 'pending_review')
             print(f"[DB DEBUG] 商品添加成功: goods_id={goods_id}")
             return True, "商品发布成功，等待审核", goods_id
         except Exception as e:
@@ -1039,18 +1548,36 @@ class DBManager:
                 conn.close()
     
     def get_goods_list(self, category: str = None, page: int = 1, page_size: int = 20, 
-                       status: str = None) -> Tuple[bool, str, List[Dict[str, Any]], int]:
+                       status: str = None, cursor: str = None,
+                       with_total: bool = True) -> Tuple[bool, str, List[Dict[str, Any]], Optional[int]]:
         """获取商品列表（分页查询）
         
         Args:
             category: 商品分类（可选，None表示查询所有分类）
-            page: 页码（从1开始）
+            page: 页码（从1开始，仅 cursor 为 None 时使用 OFFSET 分页）
             page_size: 每页数量（默认20）
             status: 商品状态（可选，None表示查询所有状态）
+            cursor: 游标（可选）。None=按页码分页；""=游标分页第一页；
+                    其它值为上一页最后一条记录的 encode_cursor 结果，按 (create_time, goods_id) 直接定位
+            with_total: 是否统计总数（游标分页时通常不需要）
         
         Returns:
-            (success: bool, message: str, goods_list: List[Dict], total_count: int)
+            (success: bool, message: str, goods_list: List[Dict], total_count: int or None)
+            with_total=False 时 total_count 为 None
         """
+        seek = None
+        if cursor:
+            seek = self.decode_cursor(cursor)
+            if not seek:
+                return False, "无效的分页游标", [], None
+
+        # 读穿缓存：命中直接返回，未命中查库后回填
+        cache_key = self.goods_list_cache.make_key(category, status, page, cursor, page_size, with_total)
+        cached = self.goods_list_cache.get(cache_key)
+        if cached is not None:
+            return True, "查询成功", cached[0], cached[1]
+        generation = self.goods_list_cache.generation()
+
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败", [], 0
@@ -1067,46 +1594,45 @@ class DBManager:
             conditions.append("status = %s")
             params.append(status)
         
-        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-        
-        # 查询总数
-        count_sql = f"SELECT COUNT(*) as total FROM goods {where_clause}"
+        # 游标分页：从上一页最后一条 (create_time, goods_id) 之后直接定位，不再扫描并丢弃 offset 行
+        list_conditions = list(conditions)
+        list_params = list(params)
+        if seek:
+            list_conditions.append("(create_time < %s OR (create_time = %s AND goods_id < %s))")
+            list_params.extend([seek[0], seek[0], seek[1]])
+        list_where = "WHERE " + " AND ".join(list_conditions) if list_conditions else ""
         
-        # 查询商品列表（包含图片路径）
-        offset = (page - 1) * page_size
+        # 查询商品列表（图片在列表查询后按整页批量加载）
+        if cursor is None:
+            limit_clause = "LIMIT %s OFFSET %s"
+            list_params.extend([page_size, (page - 1) * page_size])
+        else:
+            limit_clause = "LIMIT %s"
+            list_params.append(page_size)
         list_sql = f"""SELECT g.goods_id, g.user_id, g.title, g.description, g.category, 
                        g.brand, g.price, g.original_price, g.purchase_time, 
-                       g.stock_quantity, g.sold_count, g.img_path, g.status, g.create_time,
-                       (SELECT img_path FROM goods_images WHERE goods_id = g.goods_id 
-                        AND is_primary = 1 ORDER BY display_order LIMIT 1) as primary_image
-                       FROM goods g {where_clause} 
-                       ORDER BY g.create_time DESC LIMIT %s OFFSET %s"""
+                       g.stock_quantity, g.sold_count, g.img_path, g.status, g.create_time
+                       FROM goods g {list_where} 
+                       ORDER BY g.create_time DESC, g.goods_id DESC {limit_clause}"""
         
         cur = None
         try:
             cur = conn.cursor(pymysql.cursors.DictCursor)
             
-            # 查询总数
-            cur.execute(count_sql, params)
-            total_result = cur.fetchone()
-            total_count = total_result['total'] if total_result else 0
+            # 查询总数（可选，来自计数缓存，不再对 goods 执行 COUNT(*)）
+            total_count = None
+            if with_total:
+                total_count = self._count_goods(cur, category or None, status or None)
             
             # 查询商品列表
-            list_params = params + [page_size, offset]
             cur.execute(list_sql, list_params)
             goods_list = cur.fetchall()
             
-            # 为每个商品查询所有图片
-            for goods in goods_list:
-                goods_id = goods['goods_id']
-                images_sql = """SELECT img_path, display_order, is_primary 
-                               FROM goods_images 
-                               WHERE goods_id = %s 
-                               ORDER BY display_order ASC"""
-                cur.execute(images_sql, (goods_id,))
-                goods['images'] = cur.fetchall()
+            # 整页商品的图片一次查询加载（主图 + 全部图片）
+            self._attach_goods_images(cur, goods_list)
+            self.goods_list_cache.put(cache_key, goods_list, total_count, generation)
             
-            print(f"[DB DEBUG] 查询商品列表成功: category={category}, page={page}, 返回{len(goods_list)}条")
+            print(f"[DB DEBUG] 查询商品列表成功: category={category}, page={page}, cursor={cursor}, 返回{len(goods_list)}条")
             return True, "查询成功", goods_list, total_count
         except Exception as e:
             print(f"[DB EXEC ERROR] 查询商品列表失败: {e}")
@@ -1137,16 +1663,25 @@ class DBManager:
         if not conn:
             return False, "服务器数据库连接失败"
         
-        sql = "UPDATE goods SET status = %s WHERE goods_id = %s"
         cur = None
         try:
-            cur = conn.cursor()
+            conn.autocommit(False)
+            cur = conn.cursor(pymysql.cursors.DictCursor)
             print(f"[DB DEBUG] 准备审核商品: goods_id={goods_id}, status={status}")
-            affected_rows = cur.execute(sql, (status, goods_id))
-            conn.commit()
-            
-            if affected_rows == 0:
+            # 锁定商品行读取原状态，用于维护计数缓存
+            cur.execute("SELECT category, status FROM goods WHERE goods_id = %s FOR UPDATE", (goods_id,))
+            goods = cur.fetchone()
+            if not goods:
+                conn.rollback()
                 return False, "商品不存在"
+            if goods["status"] == status:
+                conn.rollback()
+                return True, f"商品状态已经是 {status}，无需重复操作"
+            
+            cur.execute("UPDATE goods SET status = %s WHERE goods_id = %s", (status, goods_id))
+            conn.commit()
+            self._on_goods_changed(goods_id, goods["category"], goods["status"], status)
+            self.stock.invalidate(goods_id)
             
             print(f"[DB DEBUG] 商品审核成功: goods_id={goods_id}, status={status}")
             status_msg = "已通过审核，商品已上架" if status == 'on_sale' else "审核未通过，商品已驳回"
@@ -1168,7 +1703,7 @@ class DBManager:
     
     def add_goods_image(self, goods_id: int, img_path: str, display_order: int = 0, 
                         is_primary: int = 0) -> Tuple[bool, str]:
-        """添加商品图片到 goods_images 表
+        """添加商品图片到 goods_images 表；主图同时写入 goods.img_path（兼容旧字段），两者在同一事务中提交
         
         Args:
             goods_id: 商品ID
@@ -1187,9 +1722,14 @@ class DBManager:
                  VALUES (%s, %s, %s, %s)"""
         cur = None
         try:
+            conn.autocommit(False)
             cur = conn.cursor()
             cur.execute(sql, (goods_id, img_path, display_order, is_primary))
+            if is_primary:
+                cur.execute("UPDATE goods SET img_path=%s WHERE goods_id=%s", (img_path, goods_id))
             conn.commit()
+            # 列表页中带有主图/图片列表，需在全部写入提交后再失效，避免并发查询把旧的 img_path 重新缓存
+            self.goods_list_cache.invalidate_goods(goods_id)
             print(f"[DB DEBUG] 商品图片添加成功: goods_id={goods_id}, img_path={img_path}")
             return True, "图片添加成功"
         except Exception as e:
@@ -1204,10 +1744,42 @@ class DBManager:
                 cur.close()
             if conn:
                 conn.close()
-    
+
+    def get_goods_primary_image(self, goods_id: int) -> Optional[str]:
+        """获取商品主图路径：优先 goods_images 表中的主图，其次兼容旧的 goods.img_path 字段"""
+        conn = self._get_conn()
+        if not conn:
+            return None
+
+        images_sql = """SELECT img_path FROM goods_images
+                        WHERE goods_id = %s
+                        ORDER BY is_primary DESC, display_order ASC
+                        LIMIT 1"""
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(images_sql, (goods_id,))
+                row = cur.fetchone()
+                if row and row["img_path"]:
+                    return row["img_path"]
+
+                cur.execute("SELECT img_path FROM goods WHERE goods_id = %s", (goods_id,))
+                row = cur.fetchone()
+                if row and row["img_path"]:
+                    # 爬虫写入的 img_path 可能是逗号分隔的多张图片，取第一张
+                    return row["img_path"].split(",")[0].strip() or None
+                return None
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 查询商品主图失败: {e}")
+            return None
+        finally:
+            conn.close()
+
     # ---------- 聊天相关方法 ----------
-    def send_chat_message(self, sender_id: int, receiver_id: int, content: str) -> Tuple[bool, str, Optional[int]]:
-        """发送聊天消息
+    def post_chat_message(self, sender_id: int, receiver_id: int, content: str) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """发送聊天消息（经组提交写入器与其它并发消息合并写入）
+        
+        最多等待 WRITER_WAIT_TIMEOUT 秒；超时与提交结果未知一样提示用户刷新确认，
+        不按失败处理，避免消息随后写入、客户端又重发造成重复消息
         
         Args:
             sender_id: 发送者用户ID
@@ -1215,44 +1787,74 @@ class DBManager:
             content: 消息内容
         
         Returns:
-            (success: bool, message: str, message_id: int or None)
+            (success: bool, message: str, message_data: Dict or None)
+            message_data 包含: message_id, sender_id, receiver_id, content, sent_at
         """
-        conn = self._get_conn()
-        if not conn:
-            return False, "服务器数据库连接失败，请联系管理员", None
-        
         if not content or not content.strip():
             return False, "消息内容不能为空", None
         
         if sender_id == receiver_id:
             return False, "不能给自己发送消息", None
         
-        sql = """INSERT INTO chat (sender_id, receiver_id, content) 
-                 VALUES (%s, %s, %s)"""
-        cur = None
+        sent_at = datetime.now().replace(microsecond=0)
+        print(f"[DB DEBUG] 准备发送消息: sender_id={sender_id}, receiver_id={receiver_id}")
         try:
-            cur = conn.cursor()
-            print(f"[DB DEBUG] 准备发送消息: sender_id={sender_id}, receiver_id={receiver_id}")
-            cur.execute(sql, (sender_id, receiver_id, content.strip()))
-            message_id = cur.lastrowid
-            conn.commit()
-            print(f"[DB DEBUG] 消息发送成功: message_id={message_id}")
-            return True, "消息发送成功", message_id
+            future = self.chat_writer.submit((int(sender_id), int(receiver_id), content.strip(), sent_at))
+            message_data = future.result(timeout=self.WRITER_WAIT_TIMEOUT)
+            print(f"[DB DEBUG] 消息发送成功: message_id={message_data['message_id']}")
+            return True, "消息发送成功", message_data
+        except (CommitUncertainError, FutureTimeoutError) as e:
+            print(f"[DB EXEC ERROR] 消息提交结果未知: {e.__cause__ or repr(e)}")
+            return False, "消息发送结果未知，请刷新聊天记录确认后再重发", None
         except Exception as e:
             print(f"[DB EXEC ERROR] 发送消息失败: {e}")
             import traceback
             print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
-            try:
-                conn.rollback()
-            except:
-                pass
             return False, f"发送消息失败: {str(e)}", None
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
+
+    def send_chat_message(self, sender_id: int, receiver_id: int, content: str) -> Tuple[bool, str, Optional[int]]:
+        """发送聊天消息
+        
+        Args:
+            sender_id: 发送者用户ID
+            receiver_id: 接收者用户ID
+            content: 消息内容
+        
+        Returns:
+            (success: bool, message: str, message_id: int or None)
+        """
+        success, msg, message_data = self.post_chat_message(sender_id, receiver_id, content)
+        return success, msg, message_data["message_id"] if message_data else None
     
+    @staticmethod
+    def _upsert_conversations(cur, messages: List[Tuple[int, int, int, str, datetime]]) -> None:
+        """按消息更新 chat_conversation：发送方与接收方各一行，接收方未读数 +1
+        
+        Args:
+            messages: [(message_id, sender_id, receiver_id, content, sent_at)]
+        """
+        rows = []
+        for message_id, sender_id, receiver_id, content, sent_at in messages:
+            snippet = content[:255]
+            rows.append((sender_id, receiver_id, message_id, snippet, sender_id, sent_at, 0))
+            rows.append((receiver_id, sender_id, message_id, snippet, sender_id, sent_at, 1))
+        # 按主键顺序加锁，避免双方同时互发消息时交叉加锁死锁
+        rows.sort(key=lambda r: (r[0], r[1], r[2]))
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+        # 并发写入可能乱序到达，只在消息更新时覆盖“最后一条”；last_message_id 必须最后赋值
+        cur.execute(
+            f"""INSERT INTO chat_conversation
+                (user_id, peer_id, last_message_id, last_content, last_sender_id, last_time, unread_count)
+                VALUES {placeholders}
+                ON DUPLICATE KEY UPDATE
+                    last_content = IF(VALUES(last_message_id) > last_message_id, VALUES(last_content), last_content),
+                    last_sender_id = IF(VALUES(last_message_id) > last_message_id, VALUES(last_sender_id), last_sender_id),
+                    last_time = IF(VALUES(last_message_id) > last_message_id, VALUES(last_time), last_time),
+                    unread_count = unread_count + VALUES(unread_count),
+                    last_message_id = GREATEST(last_message_id, VALUES(last_message_id))""",
+            [value for row in rows for value in row]
+        )
+
     def get_chat_message_by_id(self, message_id: int) -> Optional[Dict[str, Any]]:
         """根据消息ID获取消息详情
         
@@ -1279,34 +1881,62 @@ class DBManager:
         finally:
             conn.close()
     
-    def get_chat_history(self, user_id: int, other_user_id: int, limit: int = 50, offset: int = 0) -> Tuple[bool, str, List[Dict[str, Any]]]:
+    def get_chat_history(self, user_id: int, other_user_id: int, limit: int = 50, offset: int = 0,
+                         before_id: int = None, after_id: int = None) -> Tuple[bool, str, List[Dict[str, Any]]]:
         """获取聊天历史记录（两人之间的对话）
         
         Args:
             user_id: 当前用户ID
             other_user_id: 对方用户ID
             limit: 返回消息数量限制（默认50）
-            offset: 偏移量（用于分页，默认0）
+            offset: 偏移量（仅旧的按页分页使用，默认0）
+            before_id: 游标分页，返回 message_id 小于该值的最近 limit 条；0 表示从最新一条开始
+            after_id: 游标分页，返回 message_id 大于该值的 limit 条（拉取新消息）
         
         Returns:
             (success: bool, message: str, messages: List[Dict])
             每条消息包含: message_id, sender_id, receiver_id, content, sent_at
+            使用 before_id/after_id 时按 message_id 从新到旧返回；否则保持旧行为从旧到新返回
         """
         conn = self._get_conn()
         if not conn:
             return False, "服务器数据库连接失败", []
         
-        sql = """SELECT message_id, sender_id, receiver_id, content, sent_at
-                 FROM chat
-                 WHERE (sender_id = %s AND receiver_id = %s) 
-                    OR (sender_id = %s AND receiver_id = %s)
-                 ORDER BY sent_at ASC
-                 LIMIT %s OFFSET %s"""
+        # 两人的全部消息共享同一会话键，查询只扫描 (pair_key, message_id) 索引的一段
+        pair_key = self._chat_pair_key(user_id, other_user_id)
+        columns = "message_id, sender_id, receiver_id, content, sent_at"
+        ascending = False
+        if after_id is not None:
+            # 拉取新消息：从游标之后按升序取，保证消息多于 limit 时不丢中间的消息
+            sql = f"""SELECT {columns} FROM chat
+                     WHERE pair_key = %s AND message_id > %s
+                     ORDER BY message_id ASC LIMIT %s"""
+            params = (pair_key, after_id, limit)
+            ascending = True
+        elif before_id is not None:
+            if before_id:
+                sql = f"""SELECT {columns} FROM chat
+                         WHERE pair_key = %s AND message_id < %s
+                         ORDER BY message_id DESC LIMIT %s"""
+                params = (pair_key, before_id, limit)
+            else:
+                sql = f"""SELECT {columns} FROM chat
+                         WHERE pair_key = %s
+                         ORDER BY message_id DESC LIMIT %s"""
+                params = (pair_key, limit)
+        else:
+            sql = f"""SELECT {columns} FROM chat
+                     WHERE pair_key = %s
+                     ORDER BY message_id ASC
+                     LIMIT %s OFFSET %s"""
+            params = (pair_key, limit, offset)
         cur = None
         try:
             cur = conn.cursor(pymysql.cursors.DictCursor)
-            cur.execute(sql, (user_id, other_user_id, other_user_id, user_id, limit, offset))
-            messages = cur.fetchall()
+            cur.execute(sql, params)
+            messages = list(cur.fetchall())
+            if ascending:
+                messages.reverse()
             print(f"[DB DEBUG] 查询聊天记录成功: user_id={user_id}, other_user_id={other_user_id}, 返回{len(messages)}条")
             return True, "查询成功", messages
         except Exception as e:
@@ -1319,3 +1949,82 @@ class DBManager:
                 cur.close()
             if conn:
                 conn.close()
+
+    def get_conversations(self, user_id: int, limit: int = 50,
+                          before_message_id: int = None) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """获取用户的会话列表（按最后一条消息从新到旧）
+        
+        Args:
+            user_id: 当前用户ID
+            limit: 返回会话数量（默认50）
+            before_message_id: 游标分页，返回最后消息ID小于该值的会话
+        
+        Returns:
+            (success: bool, message: str, conversations: List[Dict])
+            每个会话包含: peer_id, peer_username, peer_nickname, last_message_id, last_content,
+            last_sender_id, last_time, unread_count
+        """
+        conn = self._get_conn()
+        if not conn:
+            return False, "服务器数据库连接失败", []
+        
+        conditions = ["c.user_id = %s"]
+        params: List[Any] = [user_id]
+        if before_message_id:
+            conditions.append("c.last_message_id < %s")
+            params.append(before_message_id)
+        params.append(limit)
+        sql = f"""SELECT c.peer_id, u.username AS peer_username, u.nickname AS peer_nickname,
+                         c.last_message_id, c.last_content, c.last_sender_id, c.last_time, c.unread_count
+                  FROM chat_conversation c
+                  JOIN user u ON u.user_id = c.peer_id
+                  WHERE {" AND ".join(conditions)}
+                  ORDER BY c.last_message_id DESC
+                  LIMIT %s"""
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(sql, params)
+                conversations = cur.fetchall()
+            print(f"[DB DEBUG] 查询会话列表成功: user_id={user_id}, 返回{len(conversations)}条")
+            return True, "查询成功", conversations
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 查询会话列表失败: {e}")
+            import traceback
+            print(f"[DB EXEC ERROR] 详细错误信息: {traceback.format_exc()}")
+            return False, f"查询失败: {str(e)}", []
+        finally:
+            conn.close()
+
+    def mark_conversation_read(self, user_id: int, peer_id: int, last_seen_id: Optional[int] = None) -> Tuple[bool, str]:
+        """将用户与某人的会话标记为已读
+        
+        last_seen_id 为客户端已看到的最后一条消息ID：会话最后一条消息不晚于它时未读数清零，
+        否则（读取后又收到新消息）按 (pair_key, message_id) 索引重新统计此后收到的消息数；
+        未传时直接清零（兼容旧客户端）
+        """
+        conn = self._get_conn()
+        if not conn:
+            return False, "服务器数据库连接失败"
+        
+        try:
+            with conn.cursor() as cur:
+                if last_seen_id is None:
+                    cur.execute(
+                        "UPDATE chat_conversation SET unread_count = 0 WHERE user_id = %s AND peer_id = %s",
+                        (user_id, peer_id)
+                    )
+                else:
+                    cur.execute(
+                        """UPDATE chat_conversation
+                           SET unread_count = IF(last_message_id <= %s, 0,
+                               (SELECT COUNT(*) FROM chat
+                                WHERE pair_key = %s AND message_id > %s AND receiver_id = %s))
+                           WHERE user_id = %s AND peer_id = %s""",
+                        (last_seen_id, self._chat_pair_key(user_id, peer_id), last_seen_id, user_id, user_id, peer_id)
+                    )
+            return True, "已标记为已读"
+        except Exception as e:
+            print(f"[DB EXEC ERROR] 标记会话已读失败: {e}")
+            return False, f"操作失败: {str(e)}"
+        finally:
+            conn.close()
@@ -0,0 +1,185 @@
+"""
+查询执行计划检查工具
+逐个调用 DBManager 的读方法，记录其实际发出的 SELECT 语句，再对每条语句执行 EXPLAIN，
+任一语句在数据量较大的表上出现全表扫描（type=ALL）时以非零状态码退出，用于发现索引回退
+
+用法：
+    python explain_check.py --password 123456
+    python explain_check.py --min-rows 0   # 不论表大小，出现全表扫描即视为失败
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pymysql
+import pymysql.cursors
+
+from db_utils import DBManager
+
+# 允许全表扫描的方法（语义上就是读整表，后续改造后应从这里移除）
+EXPECTED_FULL_SCANS = set()
+
+
+class QueryRecorder:
+    """替换 pymysql Cursor.execute，记录调用期间发出的 SELECT 语句"""
+
+    def __init__(self):
+        self.label: Optional[str] = None
+        self.queries: List[Tuple[str, str]] = []
+        self._original_execute = None
+
+    def __enter__(self):
+        recorder = self
+        original = pymysql.cursors.Cursor.execute
+        self._original_execute = original
+
+        def execute(cursor, query, args=None):
+            if recorder.label and query.lstrip().upper().startswith("SELECT"):
+                recorder.queries.append((recorder.label, cursor.mogrify(query, args)))
+            return original(cursor, query, args)
+
+        pymysql.cursors.Cursor.execute = execute
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pymysql.cursors.Cursor.execute = self._original_execute
+        return False
+
+    def call(self, label: str, func: Callable, *args, **kwargs) -> Any:
+        self.label = label
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.label = None
+
+
+def pick_sample_ids(db_config: dict) -> Dict[str, Any]:
+    """从库中取样本数据作为查询参数，空库时使用默认值"""
+    samples = {"user_id": 1, "other_user_id": 2, "username": "admin", "category": "数码产品"}
+    conn = pymysql.connect(**db_config, cursorclass=pymysql.cursors.DictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT buyer_id, seller_id FROM `order` ORDER BY order_id DESC LIMIT 1")
+            row = cur.fetchone()
+            if row:
+                samples["user_id"], samples["other_user_id"] = row["buyer_id"], row["seller_id"]
+            cur.execute("SELECT category FROM goods ORDER BY goods_id DESC LIMIT 1")
+            row = cur.fetchone()
+            if row:
+                samples["category"] = row["category"]
+            cur.execute("SELECT username FROM user WHERE user_id = %s", (samples["user_id"],))
+            row = cur.fetchone()
+            if row:
+                samples["username"] = row["username"]
+    finally:
+        conn.close()
+    return samples
+
+
+def record_queries(db: DBManager, samples: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """调用各读方法并记录 SQL（调用前清空进程内缓存，确保真正访问数据库）"""
+    user_id = samples["user_id"]
+    other_user_id = samples["other_user_id"]
+    category = samples["category"]
+
+    calls: List[Tuple[str, Callable, tuple]] = [
+        ("get_user_by_username", db.get_user_by_username, (samples["username"],)),
+        ("list_users", db.list_users, ()),
+        ("list_users[prefix]", db.list_users, (100, None, samples["username"][:2])),
+        ("get_goods_list", db.get_goods_list, (None, 1, 20, None)),
+        ("get_goods_list[status]", db.get_goods_list, (None, 1, 20, "on_sale")),
+        ("get_goods_list[category]", db.get_goods_list, (category, 1, 20, None)),
+        ("get_goods_list[category+status]", db.get_goods_list, (category, 1, 20, "on_sale")),
+        ("get_goods_list[cursor]", db.get_goods_list,
+         (category, 1, 20, "on_sale", db.encode_cursor(datetime.now(), 2 ** 31 - 1), False)),
+        ("get_goods_primary_image", db.get_goods_primary_image, (1,)),
+        ("get_orders", db.get_orders, (user_id,)),
+        ("get_orders[status]", db.get_orders, (user_id, "completed")),
+        ("get_orders[seller]", db.get_orders, (user_id, None, "seller")),
+        ("get_orders[seller+status]", db.get_orders, (user_id, "pending_shipment", "seller")),
+        ("get_orders[seller+cursor]", db.get_orders,
+         (user_id, None, "seller", db.encode_cursor(datetime.now(), 2 ** 31 - 1))),
+        ("count_orders[seller]", db.count_orders, (user_id, "seller")),
+        ("get_collects", db.get_collects, (user_id,)),
+        ("get_collects[cursor]", db.get_collects, (user_id, db.encode_cursor(datetime.now(), 2 ** 31 - 1))),
+        ("get_chat_history", db.get_chat_history, (user_id, other_user_id)),
+        ("get_chat_history[before_id]", db.get_chat_history, (user_id, other_user_id, 50, 0, 2 ** 31 - 1)),
+        ("get_chat_history[after_id]", db.get_chat_history, (user_id, other_user_id, 50, 0, None, 0)),
+        ("get_conversations", db.get_conversations, (user_id,)),
+        ("stat_category_goods", db.stat_category_goods, ()),
+        ("stat_user_order_status", db.stat_user_order_status, (user_id,)),
+        ("stat_last_n_days_orders", db.stat_last_n_days_orders, (7,)),
+        ("stat_hot_categories_top5", db.stat_hot_categories_top5, (30,)),
+        ("stat_user_favorite_categories", db.stat_user_favorite_categories, (user_id,)),
+        ("stat_last_n_days_completed", db.stat_last_n_days_completed, (7,)),
+    ]
+
+    with QueryRecorder() as recorder:
+        for label, func, args in calls:
+            db.goods_list_cache.clear()
+            db.goods_counts.invalidate()
+            recorder.call(label, func, *args)
+    return recorder.queries
+
+
+def check_plans(db_config: dict, queries: List[Tuple[str, str]], min_rows: int) -> List[str]:
+    """对记录的语句执行 EXPLAIN，返回失败描述列表"""
+    failures = []
+    conn = pymysql.connect(**db_config, cursorclass=pymysql.cursors.DictCursor)
+    try:
+        with conn.cursor() as cur:
+            for label, sql in queries:
+                cur.execute("EXPLAIN " + sql)
+                plan = cur.fetchall()
+                method = label.split("[")[0]
+                for step in plan:
+                    # 全表扫描时 rows 即优化器估计的表行数
+                    rows = step.get("rows") or 0
+                    summary = (f"{label}: table={step.get('table')} type={step.get('type')} key={step.get('key')} "
+                               f"rows={step.get('rows')} extra={step.get('Extra')}")
+                    if step.get("type") == "ALL" and method not in EXPECTED_FULL_SCANS:
+                        if rows >= min_rows:
+                            failures.append(summary)
+                            print(f"[FAIL] {summary}")
+                        else:
+                            print(f"[WARN] {summary}（表仅约 {rows} 行，忽略）")
+                    else:
+                        print(f"[ OK ] {summary}")
+    finally:
+        conn.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查 DBManager 查询的执行计划是否出现全表扫描")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--database", default="used_goods_platform")
+    parser.add_argument("--min-rows", type=int, default=1000,
+                        help="表行数低于该值时全表扫描只告警不失败（小表上优化器可能主动选择全表扫描）")
+    args = parser.parse_args()
+
+    db_config = {
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+        'charset': 'utf8mb4'
+    }
+    db = DBManager(args.host, args.port, args.user, args.password, args.database)
+    queries = record_queries(db, pick_sample_ids(db_config))
+    print(f"共记录 {len(queries)} 条查询语句")
+    failures = check_plans(db_config, queries, args.min_rows)
+    if failures:
+        print(f"执行计划检查失败：{len(failures)} 处全表扫描")
+        sys.exit(1)
+    print("执行计划检查通过")
+
+
+if __name__ == "__main__":
+    main()
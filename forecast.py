@@ -0,0 +1,160 @@
+"""
+需求预测模块（用于 DATA_STAT 的 next7_forecast）
+对所有分类的每日成交序列一次性做向量化的加法 Holt-Winters（周季节性）拟合：
+参数网格 × 分类 组成一个矩阵同时递推，按一步预测误差为每个分类选出最优参数并缓存，
+之后在参数有效期内只需用缓存参数对最新数据递推一遍即可出预测
+
+依赖 NumPy；未安装时退化为近 7 天平均值的平稳预测
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+from itertools import product
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：未安装时使用移动平均
+    np = None
+
+SEASON_LENGTH = 7  # 周季节性
+ALPHA_GRID = (0.1, 0.3, 0.5, 0.7)
+BETA_GRID = (0.0, 0.05, 0.15)
+GAMMA_GRID = (0.05, 0.2, 0.4)
+
+
+def _holt_winters_filter(values, alpha, beta, gamma, season: int):
+    """
+    向量化加法 Holt-Winters 递推
+    Args:
+        values: (K, T) 每个分类的每日成交量
+        alpha/beta/gamma: 可广播到 (P, K) 的平滑参数（P 为参数组合数）
+    Returns:
+        (level, trend, seasonal, sse)：level/trend/sse 形状 (P, K)，seasonal 形状 (P, K, season)
+    """
+    k, t_len = values.shape
+    first = values[:, :season]
+    level0 = first.mean(axis=1)
+    trend0 = (values[:, season:2 * season].mean(axis=1) - level0) / season
+
+    shape = np.broadcast(alpha, np.empty(k)).shape
+    level = np.broadcast_to(level0, shape).copy()
+    trend = np.broadcast_to(trend0, shape).copy()
+    seasonal = np.broadcast_to(first - level0[:, None], shape + (season,)).copy()
+    sse = np.zeros(shape)
+
+    for t in range(season, t_len):
+        y = values[:, t]
+        idx = t % season
+        s = seasonal[..., idx]
+        err = y - (level + trend + s)
+        sse += err * err
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[..., idx] = gamma * (y - new_level) + (1 - gamma) * s
+        level = new_level
+    return level, trend, seasonal, sse
+
+
+class DemandForecaster:
+    """
+    分类成交量预测器
+    参数网格搜索结果按分类缓存 refit_interval 秒，期间新数据只用缓存参数递推，不再搜索
+    """
+
+    def __init__(self, horizon: int = 7, season: int = SEASON_LENGTH, refit_interval: float = 3600.0):
+        self.horizon = horizon
+        self.season = season
+        self.refit_interval = refit_interval
+        # 分类 -> (alpha, beta, gamma)
+        self._params: Dict[str, Tuple[float, float, float]] = {}
+        self._fitted_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.fits = 0
+
+    @staticmethod
+    def build_matrix(rows: Sequence[Dict[str, Any]], days: int, today: date = None):
+        """
+        将 [{stat_date, category, completed}] 转为 (分类列表, 日期列表, (K, days) 成交矩阵)，缺失日期补 0
+        """
+        today = today or date.today()
+        start = today - timedelta(days=days - 1)
+        dates = [start + timedelta(days=i) for i in range(days)]
+        categories = sorted({row["category"] for row in rows})
+        if np is None or not categories:
+            return categories, dates, None
+        cat_index = {cat: i for i, cat in enumerate(categories)}
+        matrix = np.zeros((len(categories), days))
+        rows = [row for row in rows if start <= row["stat_date"] <= today]
+        if rows:
+            cat_idx = np.fromiter((cat_index[row["category"]] for row in rows), dtype=np.int64, count=len(rows))
+            day_idx = np.fromiter(((row["stat_date"] - start).days for row in rows), dtype=np.int64, count=len(rows))
+            counts = np.fromiter((row["completed"] for row in rows), dtype=float, count=len(rows))
+            np.add.at(matrix, (cat_idx, day_idx), counts)
+        return categories, dates, matrix
+
+    def _grid_search(self, categories: List[str], matrix) -> None:
+        """对所有分类同时做参数网格搜索，缓存每个分类的最优参数（调用方需持有锁）"""
+        grid = np.array(list(product(ALPHA_GRID, BETA_GRID, GAMMA_GRID)))  # (P, 3)
+        alpha, beta, gamma = (grid[:, i:i + 1] for i in range(3))           # (P, 1)
+        _, _, _, sse = _holt_winters_filter(matrix, alpha, beta, gamma, self.season)
+        best = sse.argmin(axis=0)                                            # (K,)
+        self._params = {cat: tuple(grid[best[i]]) for i, cat in enumerate(categories)}
+        self._fitted_at = time.time()
+        self.fits += 1
+
+    def forecast(self, rows: Sequence[Dict[str, Any]], history_days: int,
+                 today: date = None) -> Tuple[str, Dict[str, List[float]]]:
+        """
+        Args:
+            rows: 每日分类成交明细 [{stat_date, category, completed}]
+            history_days: rows 覆盖的天数（含今天）
+        Returns:
+            (模型名称, {分类: 未来 horizon 天的预测值})
+        """
+        categories, dates, matrix = self.build_matrix(rows, history_days, today)
+        if not categories:
+            return "holt_winters" if np is not None else "moving_average", {}
+        if matrix is None or history_days < 2 * self.season:
+            return "moving_average", self._moving_average(rows, categories, dates)
+
+        with self._lock:
+            stale = (
+                self._fitted_at is None
+                or time.time() - self._fitted_at >= self.refit_interval
+                or any(cat not in self._params for cat in categories)
+            )
+            if stale:
+                self._grid_search(categories, matrix)
+            params = np.array([self._params[cat] for cat in categories])  # (K, 3)
+
+        # 用各分类的参数（形状 (1, K)）对最新数据递推一遍，得到最新的水平/趋势/季节项
+        level, trend, seasonal, _ = _holt_winters_filter(
+            matrix, params[None, :, 0], params[None, :, 1], params[None, :, 2], self.season
+        )
+        steps = np.arange(1, self.horizon + 1)                                # (H,)
+        season_idx = (matrix.shape[1] + steps - 1) % self.season
+        predicted = level[0][:, None] + trend[0][:, None] * steps + seasonal[0][:, season_idx]
+        predicted = np.clip(predicted, 0, None)
+        return "holt_winters", {cat: predicted[i].round(2).tolist() for i, cat in enumerate(categories)}
+
+    def _moving_average(self, rows: Sequence[Dict[str, Any]], categories: List[str],
+                        dates: List[date]) -> Dict[str, List[float]]:
+        """无 NumPy 或历史不足两周时：每个分类用近 7 天平均值作平稳预测"""
+        recent = set(dates[-7:])
+        totals = {cat: 0.0 for cat in categories}
+        for row in rows:
+            if row["stat_date"] in recent:
+                totals[row["category"]] += float(row["completed"])
+        window = min(7, len(dates)) or 1
+        return {cat: [round(total / window, 2)] * self.horizon for cat, total in totals.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "numpy": np is not None,
+                "fits": self.fits,
+                "categories": len(self._params),
+                "params_age_seconds": round(time.time() - self._fitted_at, 1) if self._fitted_at else None,
+            }
@@ -0,0 +1,409 @@
+"""
+组提交写入模块
+将多个线程并发提交的写请求在后台线程中按批合并，一个事务写入一批数据，
+减少连接建立和事务提交（刷盘）的次数。调用方通过 Future 获取各自的写入结果
+"""
+
+import abc
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import pymysql
+
+
+class CommitUncertainError(Exception):
+    """COMMIT 执行时出错（如连接中断、未收到确认），事务可能已经提交，不能重放"""
+
+
+def commit_batch(conn) -> None:
+    """提交批量事务；COMMIT 本身出错时无法确定是否已提交，包装为 CommitUncertainError"""
+    try:
+        conn.commit()
+    except Exception as e:
+        raise CommitUncertainError("事务提交结果未知（提交时连接异常）") from e
+
+
+class GroupCommitWriter(abc.ABC):
+    """
+    通用组提交写入器
+    子类实现 write_batch（一个事务写入一批）；批量在提交前失败时逐条调用 write_one 重试，
+    保证单条数据的错误不会连累同批其它请求；提交结果未知时整批报错，不重放
+    停止或后台线程异常退出时，尚未写入的排队请求全部以异常结束，调用方不会一直等待
+    """
+
+    def __init__(self, name: str, max_batch: int = 100, max_delay: float = 0.005):
+        """
+        Args:
+            name: 写入器名称（用于线程名和日志）
+            max_batch: 单批最多合并的请求数
+            max_delay: 收到第一条请求后最多等待多久凑批（秒）
+        """
+        self.name = name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+        self.uncertain = 0
+        self._thread = threading.Thread(target=self._run, name=f"group-commit-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """提交一条写请求，返回 Future，结果为 write_batch/write_one 对应的返回值"""
+        future: Future = Future()
+        if self._stopped.is_set():
+            future.set_exception(RuntimeError(f"{self.name} 写入器已停止"))
+            return future
+        self._queue.put((item, future))
+        if self._stopped.is_set() and not self._thread.is_alive():
+            # 入队时写入器恰好退出，没有线程会再处理这条请求
+            self._fail_pending(RuntimeError(f"{self.name} 写入器已停止"))
+        return future
+
+    @abc.abstractmethod
+    def write_batch(self, items: List[Any]) -> List[Any]:
+        """在一个事务中写入一批数据，按顺序返回每条的结果；失败时抛出异常（提交时出错须抛出 CommitUncertainError）"""
+
+    def write_one(self, item: Any) -> Any:
+        """单条写入（批量失败后的回退路径），默认复用 write_batch"""
+        return self.write_batch([item])[0]
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        """阻塞等待第一条请求，然后在 max_delay 内尽量凑满一批"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _fail_pending(self, error: Exception) -> int:
+        """取出队列中尚未写入的请求，全部以 error 结束，返回条数"""
+        failed = 0
+        while True:
+            try:
+                _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return failed
+            if not future.done():
+                future.set_exception(error)
+                failed += 1
+
+    def _run(self) -> None:
+        try:
+            while not (self._stopped.is_set() and self._queue.empty()):
+                batch = self._collect()
+                if not batch:
+                    continue
+                try:
+                    self._flush(batch)
+                except BaseException as e:
+                    # _flush 中途异常：本批可能已部分写入，未给出结果的按提交结果未知处理
+                    print(f"[GROUP COMMIT] {self.name} 批量处理异常: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(CommitUncertainError(f"{self.name} 写入器处理异常，结果未知"))
+                    if not isinstance(e, Exception):
+                        raise
+        finally:
+            # 正常停止时队列已空；线程异常退出时拒绝后续请求并结束排队中的请求
+            self._stopped.set()
+            failed = self._fail_pending(RuntimeError(f"{self.name} 写入器已停止"))
+            if failed:
+                print(f"[GROUP COMMIT] {self.name} 写入器退出，{failed} 条排队请求未写入")
+
+    def _flush(self, batch: List[Tuple[Any, Future]]) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = self.write_batch(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+            return
+        except CommitUncertainError as e:
+            # 整批可能已经写入，逐条重写会产生重复数据，只能把结果未知告知调用方
+            print(f"[GROUP COMMIT] {self.name} 批量提交结果未知（{len(batch)} 条），不重放: {e.__cause__ or e}")
+            for _, future in batch:
+                future.set_exception(e)
+            with self._stats_lock:
+                self.uncertain += len(batch)
+            return
+        except Exception as e:
+            print(f"[GROUP COMMIT] {self.name} 批量写入失败（{len(batch)} 条），改为逐条写入: {e}")
+
+        with self._stats_lock:
+            self.fallbacks += 1
+        for item, future in batch:
+            try:
+                future.set_result(self.write_one(item))
+            except Exception as e:
+                future.set_exception(e)
+            with self._stats_lock:
+                self.batches += 1
+                self.items += 1
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止写入器：不再接受新请求，已排队的请求写完后退出；超时仍未写完的排队请求以异常结束"""
+        self._stopped.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            failed = self._fail_pending(RuntimeError(f"{self.name} 写入器已停止"))
+            print(f"[GROUP COMMIT] {self.name} 写入器停止超时，{failed} 条排队请求未写入")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "fallbacks": self.fallbacks,
+                "uncertain": self.uncertain,
+                "queued": self._queue.qsize(),
+            }
+
+
+class ChatWriter(GroupCommitWriter):
+    """
+    聊天消息组提交写入器
+    一批消息用一条多行 INSERT 写入 chat，并在同一事务中更新 chat_conversation，
+    返回的消息字典直接由写入数据构造，无需回查数据库
+
+    多行 INSERT 的自增ID只有在 auto_increment_increment = 1 时才是 lastrowid 起的连续值；
+    多主/Galera 等配置了步长的环境下改为在同一事务中逐行 INSERT，各自取 lastrowid
+    """
+
+    def __init__(self, db_manager, max_batch: int = 100, max_delay: float = 0.005):
+        """
+        Args:
+            db_manager: DBManager 实例（用于获取数据库连接）
+        """
+        self.db_manager = db_manager
+        self._consecutive_ids = None  # 首次写入时检测 @@auto_increment_increment
+        super().__init__("chat", max_batch, max_delay)
+
+    def _multi_row_ids(self, cur) -> bool:
+        """多行 INSERT 的自增ID是否连续（检测一次后缓存）"""
+        if self._consecutive_ids is None:
+            cur.execute("SELECT @@auto_increment_increment")
+            increment = int(cur.fetchone()[0])
+            self._consecutive_ids = increment == 1
+            if not self._consecutive_ids:
+                print(f"[GROUP COMMIT] auto_increment_increment={increment}，聊天消息改为逐行 INSERT（仍在同一事务中提交）")
+        return self._consecutive_ids
+
+    def write_batch(self, items: List[Tuple[int, int, str, datetime]]) -> List[Dict[str, Any]]:
+        """
+        Args:
+            items: [(sender_id, receiver_id, content, sent_at)]
+
+        Returns:
+            与 items 顺序一致的消息字典列表
+        """
+        conn = self.db_manager._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+
+        cur = None
+        try:
+            conn.autocommit(False)
+            cur = conn.cursor()
+            sql = "INSERT INTO chat (sender_id, receiver_id, pair_key, content, sent_at) VALUES "
+            rows = [
+                (sender_id, receiver_id, self.db_manager._chat_pair_key(sender_id, receiver_id), content, sent_at)
+                for sender_id, receiver_id, content, sent_at in items
+            ]
+            if len(rows) == 1 or self._multi_row_ids(cur):
+                cur.execute(sql + ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows)), [v for row in rows for v in row])
+                # 多行 INSERT（行数已知的 simple insert）一次性分配连续的自增ID，lastrowid 为第一行的ID
+                first_id = cur.lastrowid
+                message_ids = [first_id + i for i in range(len(rows))]
+            else:
+                message_ids = []
+                for row in rows:
+                    cur.execute(sql + "(%s, %s, %s, %s, %s)", row)
+                    message_ids.append(cur.lastrowid)
+            messages = [
+                (message_id, sender_id, receiver_id, content, sent_at)
+                for message_id, (sender_id, receiver_id, content, sent_at) in zip(message_ids, items)
+            ]
+            self.db_manager._upsert_conversations(cur, messages)
+            commit_batch(conn)
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+
+        return [
+            {
+                "message_id": message_id,
+                "sender_id": sender_id,
+                "receiver_id": receiver_id,
+                "content": content,
+                "sent_at": sent_at,
+            }
+            for message_id, sender_id, receiver_id, content, sent_at in messages
+        ]
+
+
+class OrderWriter(GroupCommitWriter):
+    """
+    订单组提交写入器（配合内存库存预占使用）
+    一批下单请求在一个事务中处理：涉及的商品行按 goods_id 顺序一次性加锁，
+    订单用一条多行 INSERT 写入，每个商品只更新一次库存；
+    单个订单的业务失败（库存不足、商品已下架）只体现在该订单的结果中，不影响同批其它订单
+    订单ID按唯一的 order_no 回查，不依赖自增ID连续；提交后的缓存维护不在重试和逐条回退范围内
+    """
+
+    def __init__(self, db_manager, max_batch: int = 100, max_delay: float = 0.002):
+        """
+        Args:
+            db_manager: DBManager 实例（用于获取数据库连接和提交后的缓存维护）
+        """
+        self.db_manager = db_manager
+        super().__init__("order", max_batch, max_delay)
+
+    def write_batch(self, items: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        """
+        Args:
+            items: [(buyer_id, goods_id, quantity)]
+
+        Returns:
+            与 items 顺序一致的结果：{"success", "msg", "order_id", "order_no"}
+        """
+        # 死锁、锁等待超时时按重试策略退避后重新执行整批事务（提交结果未知时不重试）
+        results, goods_changes = self.db_manager.concurrency.retry_policy.run(
+            lambda: self._write_batch_once(items), table="goods"
+        )
+        # 事务已提交：缓存维护失败只记录日志，不能让整批进入逐条回退而重复下单
+        for goods_id, category, old_status, new_status in goods_changes:
+            try:
+                self.db_manager._on_goods_changed(goods_id, category, old_status, new_status)
+            except Exception as e:
+                print(f"[GROUP COMMIT] 订单提交后维护商品缓存失败: goods_id={goods_id}, {e}")
+        return results
+
+    def _write_batch_once(self, items: List[Tuple[int, int, int]]) -> Tuple[List[Dict[str, Any]], List[Tuple]]:
+        """write_batch 的单次事务，返回 (各订单结果, 提交后需要同步到缓存的商品状态变化)"""
+        conn = self.db_manager._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+
+        cur = None
+        try:
+            conn.autocommit(False)
+            cur = conn.cursor(pymysql.cursors.DictCursor)
+            goods_ids = sorted({goods_id for _, goods_id, _ in items})
+            placeholders = ", ".join(["%s"] * len(goods_ids))
+            cur.execute(
+                f"SELECT goods_id, user_id, category, price, status, stock_quantity, sold_count "
+                f"FROM goods WHERE goods_id IN ({placeholders}) ORDER BY goods_id FOR UPDATE",
+                goods_ids
+            )
+            goods_rows = {row["goods_id"]: dict(row, old_status=row["status"]) for row in cur.fetchall()}
+
+            results: List[Dict[str, Any]] = []
+            accepted = []  # (结果下标, order_no, buyer_id, seller_id, goods_id, quantity, total_price)
+            for buyer_id, goods_id, quantity in items:
+                goods = goods_rows.get(goods_id)
+                if not goods:
+                    results.append({"success": False, "msg": "商品不存在"})
+                    continue
+                if goods["status"] != "on_sale":
+                    results.append({"success": False, "msg": "商品不可下单（非在售状态）"})
+                    continue
+                if goods["stock_quantity"] < quantity:
+                    results.append({
+                        "success": False,
+                        "msg": f"库存不足，当前库存：{goods['stock_quantity']}，需要：{quantity}"
+                    })
+                    continue
+
+                goods["stock_quantity"] -= quantity
+                goods["sold_count"] += quantity
+                # 如果库存为0，状态改为sold；如果还有库存，保持on_sale（允许继续销售）
+                if goods["stock_quantity"] == 0:
+                    goods["status"] = "sold"
+                order_no = self.db_manager._generate_order_no()
+                accepted.append((len(results), order_no, buyer_id, goods["user_id"], goods_id, quantity,
+                                 float(goods["price"]) * int(quantity)))
+                results.append(None)
+
+            if accepted:
+                values = ", ".join(["(%s, %s, %s, %s, %s, %s, 'pending_payment')"] * len(accepted))
+                params = []
+                for _, order_no, buyer_id, seller_id, goods_id, quantity, total_price in accepted:
+                    params.extend([order_no, buyer_id, seller_id, goods_id, quantity, total_price])
+                cur.execute(
+                    "INSERT INTO `order` (order_no, buyer_id, seller_id, goods_id, quantity, total_price, status) "
+                    f"VALUES {values}",
+                    params
+                )
+                # 按唯一的 order_no 回查订单ID（自增步长不为 1 时多行 INSERT 的ID并不连续）
+                order_nos = [order_no for _, order_no, *_rest in accepted]
+                cur.execute(
+                    f"SELECT order_id, order_no FROM `order` WHERE order_no IN ({', '.join(['%s'] * len(order_nos))})",
+                    order_nos
+                )
+                order_ids = {row["order_no"]: row["order_id"] for row in cur.fetchall()}
+                for index, order_no, *_rest in accepted:
+                    results[index] = {
+                        "success": True,
+                        "msg": "下单成功，待付款",
+                        "order_id": order_ids[order_no],
+                        "order_no": order_no,
+                    }
+                self.db_manager._rollup_order_created(cur, len(accepted))
+
+                sold_goods = {goods_id for _, _, _, _, goods_id, _, _ in accepted}
+                for goods_id in sorted(sold_goods):
+                    goods = goods_rows[goods_id]
+                    cur.execute(
+                        "UPDATE goods SET status=%s, stock_quantity=%s, sold_count=%s WHERE goods_id=%s",
+                        (goods["status"], goods["stock_quantity"], goods["sold_count"], goods_id)
+                    )
+            commit_batch(conn)
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            if cur:
+                cur.close()
+            try:
+                conn.autocommit(True)
+            except Exception:
+                pass
+            conn.close()
+
+        # 提交成功后由 write_batch 维护计数缓存和列表页缓存
+        goods_changes = []
+        for goods_id in sorted({goods_id for _, _, _, _, goods_id, _, _ in accepted}):
+            goods = goods_rows[goods_id]
+            goods_changes.append((goods_id, goods["category"], goods["old_status"], goods["status"]))
+        return results, goods_changes
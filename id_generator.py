@@ -0,0 +1,283 @@
+"""
+订单号生成模块
+雪花算法（Snowflake）风格的 ID：41 位毫秒时间戳 + 10 位节点号 + 12 位序号，
+同一节点内单调递增，不同节点（进程）之间靠节点号区分，生成时不访问数据库
+
+节点号由 NodeLease 从数据库表 id_node_lease 租用（主键唯一，存活进程定期续约），
+多进程/多服务器部署无需手工分配；也可用环境变量 ORDER_NODE_ID（0~1023）指定，
+指定的节点号正被其它存活进程持有时拒绝使用。租约行同时登记已使用时间戳的上界，
+进程重启或接手过期节点后从该上界之后继续生成，时钟回拨或重启前借用的未来毫秒都不会产生重复
+"""
+
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+EPOCH_MS = 1704038400000  # 2024-01-01 00:00:00 +08:00
+ORDER_NO_TZ = timezone(timedelta(hours=8))  # 订单号中的时间固定按东八区格式化（无夏令时，保证时间到字符串一一对应）
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+NODE_ENV = "ORDER_NODE_ID"
+
+
+def configured_node_id() -> Optional[int]:
+    """环境变量指定的节点号，未设置时返回 None（由租约分配）"""
+    value = os.environ.get(NODE_ENV)
+    if value is None or value == "":
+        return None
+    node_id = int(value)
+    if not 0 <= node_id <= MAX_NODE_ID:
+        raise ValueError(f"{NODE_ENV} 必须在 0~{MAX_NODE_ID} 之间: {value}")
+    return node_id
+
+
+class SnowflakeGenerator:
+    """
+    雪花 ID 生成器（线程安全）
+    每毫秒最多 4096 个；序号用尽或系统时钟回拨时沿用/借用下一毫秒，保证 ID 严格递增
+    临界区只有几次整数运算，不访问数据库，也不会等待时钟
+    """
+
+    def __init__(self, node_id: int, not_after_ms: int = 0):
+        """
+        Args:
+            node_id: 节点号（0~1023）
+            not_after_ms: 该节点已使用过的时间戳上界（Unix 毫秒），只生成晚于它的 ID
+        """
+        self.node_id = node_id
+        if not 0 <= self.node_id <= MAX_NODE_ID:
+            raise ValueError(f"节点号必须在 0~{MAX_NODE_ID} 之间: {self.node_id}")
+        self._last_ms = max(0, not_after_ms - EPOCH_MS)
+        self._sequence = MAX_SEQUENCE  # 下一个 ID 至少从上界的下一毫秒开始
+        self._limit_ms: Optional[int] = None  # 允许使用的最大时间戳（相对 EPOCH_MS），None 表示不限制
+        self._lock = threading.Lock()
+        self.borrowed_ms = 0  # 因序号用尽或时钟回拨而借用未来毫秒的次数
+        self._second_prefix = (None, "")  # (秒, 订单号时间前缀)
+
+    def next_id(self) -> int:
+        now_ms = int(time.time() * 1000) - EPOCH_MS
+        with self._lock:
+            last_ms, sequence = self._last_ms, self._sequence
+            if now_ms > last_ms:
+                last_ms, sequence = now_ms, 0
+            else:
+                # 同一毫秒内或时钟回拨：在上一个时间戳上继续递增序号，用尽后借用下一毫秒
+                sequence += 1
+                if sequence > MAX_SEQUENCE:
+                    last_ms, sequence = last_ms + 1, 0
+                    self.borrowed_ms += 1
+            if self._limit_ms is not None and last_ms > self._limit_ms:
+                raise RuntimeError("订单号生成器的时间戳超出已登记的上界（节点租约未续期）")
+            self._last_ms, self._sequence = last_ms, sequence
+            return (last_ms << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | sequence
+
+    def last_unix_ms(self) -> int:
+        """最近一次生成的 ID 的时间戳（Unix 毫秒）"""
+        with self._lock:
+            return self._last_ms + EPOCH_MS
+
+    def set_limit(self, limit_unix_ms: Optional[int]) -> None:
+        """设置允许使用的时间戳上界（Unix 毫秒，须先持久化再设置）；None 表示不限制"""
+        with self._lock:
+            self._limit_ms = None if limit_unix_ms is None else limit_unix_ms - EPOCH_MS
+
+    @staticmethod
+    def parse(snowflake_id: int) -> Tuple[int, int, int]:
+        """拆分 ID，返回 (Unix 毫秒时间戳, 节点号, 序号)"""
+        sequence = snowflake_id & MAX_SEQUENCE
+        node_id = (snowflake_id >> SEQUENCE_BITS) & MAX_NODE_ID
+        timestamp_ms = (snowflake_id >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
+        return timestamp_ms, node_id, sequence
+
+    def next_order_no(self) -> str:
+        """订单编号：ORD + 毫秒时间(yyyyMMddHHmmssSSS) + 4 位节点号 + 4 位序号，共 28 位"""
+        timestamp_ms, node_id, sequence = self.parse(self.next_id())
+        second, millis = divmod(timestamp_ms, 1000)
+        # 同一秒内的订单号共用格式化好的时间前缀
+        cached = self._second_prefix
+        if cached[0] != second:
+            cached = (second, f"ORD{datetime.fromtimestamp(second, ORDER_NO_TZ):%Y%m%d%H%M%S}")
+            self._second_prefix = cached
+        return f"{cached[1]}{millis:03d}{node_id:04d}{sequence:04d}"
+
+
+class NodeLease:
+    """
+    订单号节点租约
+    首次生成订单号时从 id_node_lease 表租用一个节点号（优先指定的 ORDER_NODE_ID，否则取空闲或已过期的节点），
+    后台线程每 interval 秒续约，并把“已使用时间戳上界”提前登记 window_ms 毫秒；
+    生成器只使用已登记范围内的时间戳，租约丢失（超过 ttl 秒未续约被其它进程接手）时立即停用
+    """
+
+    def __init__(self, db_manager, ttl: int = 30, interval: float = 3.0, window_ms: int = 10000):
+        """
+        Args:
+            db_manager: DBManager 实例（用于获取数据库连接）
+            ttl: 租约有效期（秒），超过该时间未续约的节点可被其它进程接手
+            interval: 续约间隔（秒），应远小于 ttl
+            window_ms: 每次续约提前登记的时间戳范围（毫秒），应小于 ttl
+        """
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self.interval = interval
+        self.window_ms = window_ms
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"[:100]
+        self._generator: Optional[SnowflakeGenerator] = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.acquired = 0
+        self.renewals = 0
+        self.lost = 0
+
+    def next_order_no(self) -> str:
+        return self.generator().next_order_no()
+
+    def generator(self) -> SnowflakeGenerator:
+        """当前租约对应的生成器，尚未租用（或租约已丢失）时先租用节点号"""
+        generator = self._generator
+        if generator is not None:
+            return generator
+        with self._lock:
+            if self._generator is None:
+                self._generator = self._acquire()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="order-node-lease", daemon=True)
+                    self._thread.start()
+            return self._generator
+
+    def _acquire(self) -> SnowflakeGenerator:
+        conn = self.db_manager._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败，无法分配订单号节点")
+        try:
+            with conn.cursor() as cur:
+                node_id = configured_node_id()
+                if node_id is not None:
+                    candidates = [node_id]
+                else:
+                    cur.execute(
+                        "SELECT node_id, heartbeat_at < NOW(3) - INTERVAL %s SECOND FROM id_node_lease",
+                        (self.ttl,)
+                    )
+                    rows = cur.fetchall()
+                    used = {row[0] for row in rows}
+                    # 先用从未分配过的节点号，用尽后接手已过期的节点
+                    candidates = [n for n in range(MAX_NODE_ID + 1) if n not in used]
+                    candidates += sorted(row[0] for row in rows if row[1])
+
+                for node_id in candidates:
+                    if self._claim(cur, node_id):
+                        break
+                else:
+                    if configured_node_id() is not None:
+                        raise RuntimeError(f"{NODE_ENV}={node_id} 正被其它进程使用（租约未过期）")
+                    raise RuntimeError("没有空闲的订单号节点")
+
+                cur.execute("SELECT reserved_ms FROM id_node_lease WHERE node_id=%s", (node_id,))
+                reserved_ms = cur.fetchone()[0]
+                generator = SnowflakeGenerator(node_id, not_after_ms=reserved_ms)
+                limit_ms = max(reserved_ms, int(time.time() * 1000)) + self.window_ms
+                cur.execute(
+                    "UPDATE id_node_lease SET reserved_ms=%s WHERE node_id=%s AND owner=%s",
+                    (limit_ms, node_id, self.owner)
+                )
+                generator.set_limit(limit_ms)
+            self.acquired += 1
+            print(f"[ID INFO] 订单号节点租约: node_id={node_id}, 上次登记的时间戳上界={reserved_ms}")
+            return generator
+        finally:
+            conn.close()
+
+    def _claim(self, cur, node_id: int) -> bool:
+        """尝试占用节点号：未登记过的直接插入，已登记的只有租约过期时才能接手"""
+        try:
+            cur.execute(
+                "INSERT INTO id_node_lease (node_id, owner, reserved_ms, heartbeat_at) VALUES (%s, %s, 0, NOW(3))",
+                (node_id, self.owner)
+            )
+            return True
+        except Exception as e:
+            if not (e.args and e.args[0] == 1062):  # 1062：节点号已登记过
+                raise
+        cur.execute(
+            "UPDATE id_node_lease SET owner=%s, heartbeat_at=NOW(3) "
+            "WHERE node_id=%s AND (owner=%s OR heartbeat_at < NOW(3) - INTERVAL %s SECOND)",
+            (self.owner, node_id, self.owner, self.ttl)
+        )
+        return cur.rowcount == 1
+
+    def _renew(self) -> None:
+        """续约并提前登记时间戳上界；租约已被接手时停用当前生成器，下次生成时重新租用"""
+        generator = self._generator
+        if generator is None:
+            return
+        conn = self.db_manager._get_conn()
+        if not conn:
+            raise RuntimeError("服务器数据库连接失败")
+        try:
+            limit_ms = max(generator.last_unix_ms(), int(time.time() * 1000)) + self.window_ms
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE id_node_lease SET heartbeat_at=NOW(3), reserved_ms=GREATEST(reserved_ms, %s) "
+                    "WHERE node_id=%s AND owner=%s",
+                    (limit_ms, generator.node_id, self.owner)
+                )
+                renewed = cur.rowcount == 1
+        finally:
+            conn.close()
+        if renewed:
+            generator.set_limit(limit_ms)
+            self.renewals += 1
+            return
+        generator.set_limit(0)
+        with self._lock:
+            if self._generator is generator:
+                self._generator = None
+        self.lost += 1
+        print(f"[ID WARN] 订单号节点 {generator.node_id} 的租约已被其它进程接手，重新分配节点")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self._renew()
+            except Exception as e:
+                print(f"[ID WARN] 订单号节点租约续约失败: {e}")
+
+    def release(self) -> None:
+        """停止续约并释放节点（正常退出时调用），已登记的时间戳上界保留给下一个使用者"""
+        self._stopped.set()
+        with self._lock:
+            generator, self._generator = self._generator, None
+        if generator is None:
+            return
+        generator.set_limit(0)
+        conn = self.db_manager._get_conn()
+        if not conn:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE id_node_lease SET heartbeat_at='1970-01-01' WHERE node_id=%s AND owner=%s",
+                    (generator.node_id, self.owner)
+                )
+        except Exception as e:
+            print(f"[ID WARN] 释放订单号节点失败: {e}")
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        generator = self._generator
+        return {
+            "node_id": generator.node_id if generator else None,
+            "borrowed_ms": generator.borrowed_ms if generator else 0,
+            "acquired": self.acquired,
+            "renewals": self.renewals,
+            "lost": self.lost,
+        }
@@ -0,0 +1,103 @@
+"""
+图片存储工具模块
+按内容哈希前缀分层存储图片（ab/cd/<hash>.jpg），避免单个目录下文件过多导致
+目录查找、遍历和备份变慢；相同内容的图片天然去重
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from typing import Callable, Optional
+
+# 分层路径格式：两级 2 字符哈希前缀目录 + 32 位 md5 文件名
+SHARDED_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.[A-Za-z0-9]+$")
+
+
+def sharded_relpath(digest: str, ext: str = ".jpg") -> str:
+    """根据内容哈希生成分层相对路径，如 ab/cd/abcd...jpg（统一使用 / 分隔，便于存库）"""
+    ext = (ext or ".jpg").lower()
+    if not ext.startswith("."):
+        ext = "." + ext
+    return f"{digest[0:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_sharded(relpath: str) -> bool:
+    """判断相对路径是否已经是分层格式"""
+    return bool(SHARDED_PATTERN.match(relpath or ""))
+
+
+def file_digest(path: str, block_size: int = 65536) -> str:
+    """流式计算文件内容的 md5，避免大文件整体读入内存"""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _replace_atomically(target: str, write: Callable[[str], None]) -> None:
+    """
+    在目标目录中创建唯一的临时文件，由 write 写入内容后原子替换为 target，
+    避免并发读取到写了一半的图片；多个线程/进程同时写同一目标时各用各的临时文件
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644)  # mkstemp 创建的文件仅属主可读，恢复为普通文件权限
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_image_sharded(root: str, data: bytes, ext: str = ".jpg") -> str:
+    """
+    将图片内容写入 root 下的分层目录
+
+    Args:
+        root: 图片根目录
+        data: 图片二进制内容
+        ext: 文件扩展名（默认 .jpg）
+
+    Returns:
+        相对 root 的分层路径（/ 分隔）
+    """
+    relpath = sharded_relpath(hashlib.md5(data).hexdigest(), ext)
+    target = os.path.join(root, *relpath.split("/"))
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        def write(tmp_path: str) -> None:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        _replace_atomically(target, write)
+    return relpath
+
+
+def place_file_sharded(root: str, source: str, ext: Optional[str] = None) -> str:
+    """
+    将已有文件放入 root 下的分层目录（硬链接优先，失败时复制），不删除源文件
+
+    Returns:
+        相对 root 的分层路径（/ 分隔）
+    """
+    if ext is None:
+        ext = os.path.splitext(source)[1] or ".jpg"
+    relpath = sharded_relpath(file_digest(source), ext)
+    target = os.path.join(root, *relpath.split("/"))
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass  # 并发放入了相同内容的文件
+        except OSError:
+            _replace_atomically(target, lambda tmp_path: shutil.copyfile(source, tmp_path))
+    return relpath
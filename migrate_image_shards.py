@@ -0,0 +1,173 @@
+"""
+图片目录分层迁移工具
+将平铺存放的历史图片（uploads/goods_images/*.jpg、images/*.jpg）迁移到
+按哈希前缀分层的目录结构（ab/cd/<hash>.jpg），并分批事务改写
+goods.img_path 与 goods_images.img_path
+
+迁移顺序保证任意时刻数据库中的路径都可访问：
+1. 为源文件在分层目录中建立硬链接（跨设备时复制）
+2. 分批事务改写数据库路径
+3. 全部提交后再删除旧文件
+
+用法：
+    python migrate_image_shards.py --password 123456 --batch-size 500
+    python migrate_image_shards.py --dry-run   # 只统计，不改文件和数据库
+"""
+
+import argparse
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+import pymysql
+
+from image_storage import is_sharded, place_file_sharded
+
+
+class ImageShardMigrator:
+    """图片分层迁移器"""
+
+    def __init__(self, db_config: dict, roots: List[Tuple[str, str]], batch_size: int = 500,
+                 dry_run: bool = False):
+        """
+        Args:
+            db_config: 数据库配置字典
+            roots: [(数据库中的路径前缀, 本地目录)]，如 ("uploads/goods_images", "uploads/goods_images")
+            batch_size: 每个事务改写的行数
+            dry_run: 只统计不修改
+        """
+        self.db_config = db_config
+        self.roots = roots
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        # 旧路径 -> 新路径（同一文件可能同时被 goods 与 goods_images 引用）
+        self.path_map: Dict[str, str] = {}
+        # 已迁移、待最终删除的旧文件
+        self.sources_to_remove: Set[str] = set()
+        self.missing_files = 0
+
+    def map_path(self, img_path: str) -> Optional[str]:
+        """计算单个图片路径迁移后的新路径；无需迁移返回 None"""
+        if not img_path:
+            return None
+        if img_path in self.path_map:
+            return self.path_map[img_path]
+
+        normalized = img_path.strip().replace("\\", "/")
+        for prefix, local_dir in self.roots:
+            prefix = prefix.rstrip("/")
+            # 兼容 "/uploads/goods_images/xxx.jpg" 这类带前导斜杠的相对路径
+            for candidate in (normalized, normalized.lstrip("/")):
+                if not candidate.startswith(prefix + "/"):
+                    continue
+                rest = candidate[len(prefix) + 1:]
+                if is_sharded(rest):
+                    return None
+                source = os.path.join(local_dir, *rest.split("/"))
+                if not os.path.isfile(source):
+                    self.missing_files += 1
+                    print(f"[迁移警告] 文件不存在，跳过: {img_path}")
+                    return None
+
+                lead = normalized[:len(normalized) - len(candidate)]
+                if self.dry_run:
+                    new_path = f"{lead}{prefix}/<sharded>"
+                else:
+                    shard_path = place_file_sharded(local_dir, source)
+                    new_path = f"{lead}{prefix}/{shard_path}"
+                    self.sources_to_remove.add(source)
+                self.path_map[img_path] = new_path
+                return new_path
+        return None
+
+    def _migrate_table(self, conn, table: str, pk: str, multi_paths: bool) -> int:
+        """按主键分批迁移某张表的 img_path，返回改写行数"""
+        updated = 0
+        last_id = 0
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT {pk}, img_path FROM {table} "
+                    f"WHERE {pk} > %s AND img_path IS NOT NULL AND img_path <> '' "
+                    f"ORDER BY {pk} LIMIT %s",
+                    (last_id, self.batch_size)
+                )
+                rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            changes = []
+            for row_id, img_path in rows:
+                # goods.img_path 可能是爬虫写入的逗号分隔多图
+                parts = img_path.split(",") if multi_paths else [img_path]
+                new_parts = [self.map_path(p.strip()) or p.strip() for p in parts]
+                new_value = ",".join(new_parts)
+                if new_value != img_path:
+                    changes.append((new_value, row_id))
+
+            if changes and not self.dry_run:
+                # 每批一个事务，失败时整批回滚，已建立的链接文件可在重跑时复用
+                try:
+                    with conn.cursor() as cur:
+                        cur.executemany(f"UPDATE {table} SET img_path=%s WHERE {pk}=%s", changes)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            updated += len(changes)
+            print(f"[迁移进度] {table}: 已处理至 {pk}={last_id}，本批改写 {len(changes)} 行")
+        return updated
+
+    def run(self) -> None:
+        conn = pymysql.connect(**self.db_config, autocommit=False)
+        try:
+            images_rows = self._migrate_table(conn, "goods_images", "image_id", multi_paths=False)
+            goods_rows = self._migrate_table(conn, "goods", "goods_id", multi_paths=True)
+        finally:
+            conn.close()
+
+        removed = 0
+        for source in self.sources_to_remove:
+            try:
+                os.remove(source)
+                removed += 1
+            except OSError as e:
+                print(f"[迁移警告] 删除旧文件失败: {source}, {e}")
+
+        mode = "（演练模式，未修改）" if self.dry_run else ""
+        print(f"迁移完成{mode}: goods_images 改写 {images_rows} 行，goods 改写 {goods_rows} 行，"
+              f"删除旧文件 {removed} 个，缺失文件 {self.missing_files} 个")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将商品图片迁移到哈希前缀分层目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--database", default="used_goods_platform")
+    parser.add_argument("--images-dir", default="uploads/goods_images", help="服务器上传图片目录")
+    parser.add_argument("--spider-dir", default="images", help="爬虫图片目录")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db_config = {
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+        'charset': 'utf8mb4'
+    }
+    roots = [
+        ("uploads/goods_images", args.images_dir),
+        ("images", args.spider_dir),
+        # XianyuSpider 下载的图片以绝对路径入库
+        (os.path.abspath(args.spider_dir).replace("\\", "/"), args.spider_dir),
+    ]
+    ImageShardMigrator(db_config, roots, args.batch_size, args.dry_run).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+待付款订单超时取消模块
+后台线程定期扫描超过有效期仍未付款的订单，按批取消并归还库存；
+每批是一个大小有限的事务，使用 SKIP LOCKED 领取订单，多台服务器可同时运行而互不重复处理
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+
+class OrderExpiryScheduler:
+    """
+    超时订单取消调度器
+    每轮连续处理多批，直到某批不满（已无积压）或达到单轮批数上限，然后等待下一轮
+    """
+
+    def __init__(self, db_manager, ttl_seconds: int = 30 * 60, interval: float = 30.0,
+                 batch_size: int = 100, max_batches: int = 20):
+        """
+        Args:
+            db_manager: DBManager 实例
+            ttl_seconds: 待付款订单有效期（秒）
+            interval: 两轮扫描之间的间隔（秒）
+            batch_size: 单个事务最多取消的订单数
+            max_batches: 单轮最多处理的批数（避免积压很多时长时间占用数据库）
+        """
+        self.db_manager = db_manager
+        self.ttl_seconds = ttl_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.runs = 0
+        self.batches = 0
+        self.expired = 0
+        self.errors = 0
+        self.last_run_at = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="order-expiry", daemon=True)
+            self._thread.start()
+
+    def run_once(self) -> int:
+        """执行一轮扫描，返回本轮取消的订单数"""
+        total = 0
+        for _ in range(self.max_batches):
+            if self._stopped.is_set():
+                break
+            expired = self.db_manager.expire_unpaid_orders(self.ttl_seconds, self.batch_size)
+            with self._stats_lock:
+                self.batches += 1
+                self.expired += expired
+            total += expired
+            if expired < self.batch_size:
+                break
+        with self._stats_lock:
+            self.runs += 1
+            self.last_run_at = time.time()
+        return total
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                print(f"[ORDER EXPIRY] 超时订单取消失败: {e}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "runs": self.runs,
+                "batches": self.batches,
+                "expired": self.expired,
+                "errors": self.errors,
+                "last_run_age_seconds": round(time.time() - self.last_run_at, 1) if self.last_run_at else None,
+            }
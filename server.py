@@ -5,9 +5,21 @@ import sys
 import os
 import base64
 import struct
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 from db_utils import DBManager
+from cache_utils import ImageCache
+from image_storage import save_image_sharded
+from forecast import DemandForecaster
+from order_expiry import OrderExpiryScheduler
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时缩略图退化为原图
+    Image = None
 
 # =================配置区域=================
 SERVER_IP = '10.129.106.38'  
@@ -29,16 +41,81 @@ try:
     db_manager.ensure_admin_account("admin", "admin123")
 except Exception as e:
     print(f"[WARN] 初始化管理员账号失败: {e}")
+# 后台加载用户名索引（加载完成前注册/用户名校验照常查库）
+threading.Thread(target=db_manager.load_usernames, name="load-usernames", daemon=True).start()
 
 # 图片存储配置
-IMAGES_DIR = "uploads/goods_images"  # 商品图片存储目录
+IMAGES_DIR = "uploads/goods_images"  # 商品图片存储目录（按哈希前缀分层：ab/cd/<hash>.jpg）
 CHUNK_SIZE = 8192  # 图片分片大小（8KB）
 
+# 允许通过 IMAGE_GET 读取的图片根目录（上传目录 + 爬虫图片目录）
+IMAGE_ROOTS = (IMAGES_DIR, "images")
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 热点图片缓存字节预算（64MB）
+THUMBNAIL_SIZE = (240, 240)  # 缩略图最大尺寸
+
 # 确保图片目录存在
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
+# 热点图片内存缓存（原图/缩略图），商品图片变更时按 goods_id 失效
+image_cache = ImageCache(max_bytes=IMAGE_CACHE_MAX_BYTES)
+
+# DATA_STAT 各统计子查询并发执行：共享线程池 + 单次请求截止时间
+DATA_STAT_WORKERS = 12
+DATA_STAT_DEADLINE = 2.0  # 秒，超时的子统计不等待，返回其余部分（库侧超时见 DBManager.STAT_QUERY_TIMEOUT_MS）
+stat_executor = ThreadPoolExecutor(max_workers=DATA_STAT_WORKERS, thread_name_prefix="data-stat")
+FORECAST_HISTORY_DAYS = 84  # 需求预测使用的历史天数（12 周）
+# 分类需求预测器（Holt-Winters 参数按分类缓存，每小时重新搜索一次）
+demand_forecaster = DemandForecaster(horizon=7)
+
+# 用户管理列表分页配置
+USER_LIST_DEFAULT_LIMIT = 100
+USER_LIST_MAX_LIMIT = 1000
+USER_STREAM_BATCH = 500  # 流式返回时每帧的用户数
+
+# 商品列表分页配置
+GOODS_PAGE_DEFAULT_SIZE = 20
+GOODS_PAGE_MAX_SIZE = 100
+
+# 订单列表游标分页配置
+ORDER_PAGE_DEFAULT_SIZE = 20
+ORDER_PAGE_MAX_SIZE = 100
+
+# 收藏：列表游标分页配置；COLLECT_CHECK 单次最多判断的商品数
+COLLECT_PAGE_DEFAULT_SIZE = 20
+COLLECT_PAGE_MAX_SIZE = 100
+COLLECT_CHECK_MAX_IDS = 200
+
+# 待付款订单超时取消：超过有效期未付款的订单由后台任务按批取消并归还库存
+ORDER_PAYMENT_TTL = 30 * 60  # 秒
+ORDER_EXPIRY_INTERVAL = 30   # 扫描间隔（秒）
+order_expiry = OrderExpiryScheduler(db_manager, ttl_seconds=ORDER_PAYMENT_TTL, interval=ORDER_EXPIRY_INTERVAL)
+order_expiry.start()
+
+# 登录会话：指令 -> 请求体中表示“当前用户”的字段，已登录连接由会话补齐或校验该字段
+SESSION_IDENTITY_FIELDS = {
+    "GOODS_ADD": "user_id",
+    "GOODS_AUDIT": "admin_user_id",
+    "ORDER_ADD": "buyer_id",
+    "ORDER_GET": "buyer_id",
+    "COLLECT_ADD": "user_id",
+    "COLLECT_GET": "user_id",
+    "COLLECT_DEL": "user_id",
+    "COLLECT_CHECK": "user_id",
+    "CHAT_SEND": "sender_id",
+    "CHAT_GET": "user_id",
+    "CHAT_CONVERSATIONS": "user_id",
+    "CHAT_READ": "user_id",
+    "DATA_STAT": "user_id",
+}
+# 需要管理员权限的指令（必须先登录，按会话角色校验）
+ADMIN_COMMANDS = {"USER_MANAGE", "GOODS_AUDIT"}
+# 修改订单/商品的指令（必须先登录，按会话用户校验归属）
+OWNER_COMMANDS = {"ORDER_UPDATE", "GOODS_UPDATE_STATUS", "IMAGE_UPLOAD"}
+# 不依赖登录会话的指令
+SESSION_EXEMPT_COMMANDS = {"REGISTER", "LOGIN", "USERNAME_CHECK"}
+
 # 图片分片临时存储（用于拼接）
-image_chunks = {}  # {chunk_id: {chunks: [], total_size: int, filename: str}}
+image_chunks = {}  # {chunk_id: {chunks: [], total_size: int, filename: str, goods_id: int, uploader: int}}
 
 # 客户端连接管理（用于消息推送）
 # 格式: {user_id: client_socket}
@@ -76,6 +153,284 @@ def json_serialize(obj):
         return [json_serialize(item) for item in obj]
     return obj
 
+def resolve_image_file(img_path: str):
+    """将数据库中的图片相对路径解析为本地文件路径，只允许访问 IMAGE_ROOTS 下的文件"""
+    if not img_path:
+        return None
+    local_path = os.path.realpath(img_path.lstrip("/\\"))
+    for root in IMAGE_ROOTS:
+        root_path = os.path.realpath(root)
+        if local_path.startswith(root_path + os.sep) and os.path.isfile(local_path):
+            return local_path
+    return None
+
+def make_thumbnail(data: bytes) -> bytes:
+    """生成 JPEG 缩略图；未安装 Pillow 或解码失败时返回原图"""
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGB")
+            img.thumbnail(THUMBNAIL_SIZE)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=80)
+            return out.getvalue()
+    except Exception as e:
+        print(f"[SERVER WARN] 生成缩略图失败，返回原图: {e}")
+        return data
+
+def load_image(img_path: str, thumbnail: bool = False, goods_id=None, primary: bool = False):
+    """读取图片内容（优先走内存缓存），返回 bytes；文件不存在返回 None
+    带 goods_id 时缓存条目关联到该商品（primary 表示为其主图），商品图片变更时随之失效
+    """
+    variant = "thumb" if thumbnail else "full"
+    cached = image_cache.get(img_path, variant)
+    if cached is not None:
+        if goods_id is not None:
+            image_cache.put(img_path, variant, cached, goods_id, primary)
+        return cached
+
+    local_path = resolve_image_file(img_path)
+    if not local_path:
+        return None
+    with open(local_path, "rb") as f:
+        data = f.read()
+    if thumbnail:
+        data = make_thumbnail(data)
+    image_cache.put(img_path, variant, data, goods_id, primary)
+    return data
+
+def run_stat_part(func, *args):
+    """在线程池中执行单个统计方法，返回 (ok, data, 耗时毫秒)"""
+    started = time.perf_counter()
+    try:
+        ok, msg, data = func(*args)
+    except Exception as e:
+        print(f"[SERVER ERROR] 统计子查询 {func.__name__} 异常: {e}")
+        ok, data = False, []
+    return ok, data, round((time.perf_counter() - started) * 1000, 1)
+
+def run_stat_parts(parts: dict, deadline: float) -> dict:
+    """
+    并发执行一组统计方法，在截止时间内收集结果
+    Args:
+        parts: {名称: (方法, 参数...)}
+    返回 {"data": {...}, "timings": {part: ms}, "timed_out": [part], "failed": [part]}
+    超时或失败的部分返回空列表
+    """
+    started = time.perf_counter()
+    futures = {name: stat_executor.submit(run_stat_part, *call) for name, call in parts.items()}
+    wait(futures.values(), timeout=deadline)
+
+    data, timings, timed_out, failed = {}, {}, [], []
+    for name, future in futures.items():
+        if not future.done():
+            # 子查询仍在执行：不再等待；数据库侧由 MAX_EXECUTION_TIME 中止，线程随即释放，结果丢弃
+            future.cancel()
+            timed_out.append(name)
+            data[name] = []
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+            continue
+        ok, result, elapsed_ms = future.result()
+        data[name] = result if ok else []
+        timings[name] = elapsed_ms
+        if not ok:
+            failed.append(name)
+    return {"data": data, "timings": timings, "timed_out": timed_out, "failed": failed}
+
+def stat_result_complete(result: dict) -> bool:
+    """只有全部统计项都成功的结果才写入缓存"""
+    return not result["timed_out"] and not result["failed"]
+
+def build_global_stat(deadline: float) -> dict:
+    """全站统计部分（与用户无关）：分类商品数、7天趋势、热门分类、成交量及分类需求预测"""
+    result = run_stat_parts({
+        "category_counts": (db_manager.stat_category_goods,),
+        "last7_trend": (db_manager.stat_last_n_days_orders, 7),
+        "hot_categories": (db_manager.stat_hot_categories_top5, 30),
+        "last7_completed_daily": (db_manager.stat_last_n_days_completed, 7),
+        "category_history": (db_manager.stat_category_completed_history, FORECAST_HISTORY_DAYS),
+    }, deadline)
+
+    # 需求预测：各分类成交历史一次取出，向量化拟合后按分类预测，总量为各分类之和
+    history = result["data"].pop("category_history")
+    model, by_category = demand_forecaster.forecast(history, FORECAST_HISTORY_DAYS)
+    if not by_category:
+        # 没有分类成交历史时退化为近7天总成交量的移动平均
+        model = "moving_average"
+        last7_completed = result["data"]["last7_completed_daily"]
+        avg_completed = 0.0
+        if last7_completed:
+            avg_completed = sum(day["completed"] for day in last7_completed) / len(last7_completed)
+        totals = [avg_completed] * 7
+    else:
+        totals = [sum(values[i] for values in by_category.values()) for i in range(7)]
+
+    today = datetime.now().date()
+    future_dates = [(today + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, 8)]
+    next7_forecast = [
+        {"date": day, "predicted_completed": round(total, 2)}
+        for day, total in zip(future_dates, totals)
+    ]
+    result["data"]["next7_forecast_by_category"] = [
+        {
+            "category": category,
+            "forecast": [
+                {"date": day, "predicted_completed": value}
+                for day, value in zip(future_dates, values)
+            ],
+        }
+        for category, values in sorted(by_category.items(), key=lambda item: -sum(item[1]))
+    ]
+    result["data"]["forecast_model"] = model
+    result["data"]["next7_forecast"] = next7_forecast
+    return result
+
+def build_user_stat(uid: int, deadline: float) -> dict:
+    """个人统计部分：订单状态占比、偏好分类"""
+    return run_stat_parts({
+        "my_order_status_ratio": (db_manager.stat_user_order_status, uid),
+        "my_favorite_categories": (db_manager.stat_user_favorite_categories, uid),
+    }, deadline)
+
+def build_data_stat(user_id=None, deadline: float = DATA_STAT_DEADLINE) -> dict:
+    """
+    组装 DATA_STAT 结果：全站部分按 TTL 全局缓存，个人部分按用户缓存（下单/订单状态变更时失效）
+    两部分未命中时并发计算；超时或失败的结果不缓存
+    返回 {"data": {...}, "timings": {part: ms}, "timed_out": [part], "failed": [part], "cached": [...]}
+    """
+    uid = None
+    if user_id:
+        try:
+            uid = int(user_id)
+        except ValueError:
+            uid = None
+
+    started = time.perf_counter()
+    # 在请求线程中依次取两部分（各自内部并发）；不把外层任务放进同一线程池，避免单飞等待占满工作线程
+    global_result, global_hit = db_manager.stat_global_cache.get_or_load(
+        "global", lambda: build_global_stat(deadline), stat_result_complete
+    )
+    user_result, user_hit = {"data": {"my_order_status_ratio": [], "my_favorite_categories": []},
+                             "timings": {}, "timed_out": [], "failed": []}, False
+    if uid is not None:
+        user_result, user_hit = db_manager.stat_user_cache.get_or_load(
+            uid, lambda: build_user_stat(uid, deadline), stat_result_complete
+        )
+
+    cached = [name for name, hit in (("global", global_hit), ("user", user_hit)) if hit]
+    merged = {"data": {}, "timings": {}, "timed_out": [], "failed": [], "cached": cached}
+    for result, hit in ((global_result, global_hit), (user_result, user_hit)):
+        merged["data"].update(result["data"])
+        merged["timed_out"].extend(result["timed_out"])
+        merged["failed"].extend(result["failed"])
+        if not hit:
+            merged["timings"].update(result["timings"])
+    merged["timings"]["total"] = round((time.perf_counter() - started) * 1000, 1)
+    return merged
+
+def send_response(client_socket, cmd_type: str, response_data: dict) -> int:
+    """序列化响应并加 4 字节长度头发送，返回消息体字节数"""
+    response_data = json_serialize(response_data)
+    response_str = f"{cmd_type}|{json.dumps(response_data, ensure_ascii=False)}"
+    resp_bytes = response_str.encode("utf-8")
+    resp_header = len(resp_bytes).to_bytes(HEADER_SIZE, "big")
+    client_socket.sendall(resp_header + resp_bytes)
+    return len(resp_bytes)
+
+def parse_page_size(value, default: int, maximum: int):
+    """解析分页大小：未传时用默认值，超过上限时截断；不是正整数时返回 None（由调用方返回 400）"""
+    if value is None or value == "":
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(size, maximum) if size > 0 else None
+
+
+def stream_users(client_socket, cmd_type: str, username_prefix=None, status=None,
+                 batch_size: int = USER_STREAM_BATCH) -> None:
+    """
+    流式返回用户列表：每批用户单独一帧发送，最后一帧 done=true
+    数据库侧使用无缓冲游标，服务端内存占用只与 batch_size 有关
+    """
+    total = 0
+    seq = 0
+    try:
+        for batch in db_manager.iter_users(username_prefix, status, batch_size):
+            send_response(client_socket, cmd_type, {
+                "code": 200, "msg": "分批传输中", "users": batch, "seq": seq, "done": False
+            })
+            seq += 1
+            total += len(batch)
+    except (ConnectionResetError, BrokenPipeError):
+        # 客户端已断开，生成器关闭时会释放数据库连接
+        raise
+    except Exception as e:
+        print(f"[SERVER ERROR] 流式查询用户失败: {e}")
+        send_response(client_socket, cmd_type, {
+            "code": 500, "msg": f"查询用户失败: {str(e)}", "users": [], "seq": seq, "done": True, "total": total
+        })
+        return
+    send_response(client_socket, cmd_type, {
+        "code": 200, "msg": "查询成功", "users": [], "seq": seq, "done": True, "total": total
+    })
+
+def apply_session(cmd_type: str, body: dict, session: dict):
+    """
+    用会话解析请求身份和权限（不查库）：缺省的当前用户字段由会话补齐，
+    与会话不一致时仅管理员放行；管理员指令校验会话角色
+    Returns:
+        None 表示放行，否则为拒绝响应
+    """
+    is_admin = session["role"] == "admin"
+    if cmd_type in ADMIN_COMMANDS and not is_admin:
+        return {"code": 403, "msg": "权限不足，仅管理员可操作"}
+
+    if cmd_type == "UPDATE_PROFILE":
+        field, own_value = "username", session["username"]
+    elif cmd_type == "ORDER_GET" and body.get("role") == "seller":
+        field, own_value = "seller_id", session["user_id"]
+    elif cmd_type in SESSION_IDENTITY_FIELDS:
+        field, own_value = SESSION_IDENTITY_FIELDS[cmd_type], session["user_id"]
+    else:
+        return None
+
+    claimed = body.get(field)
+    if claimed is None or claimed == "":
+        body[field] = own_value
+    elif str(claimed) != str(own_value) and not is_admin:
+        return {"code": 403, "msg": "无权以其他用户身份操作"}
+    return None
+
+
+def check_ownership(cmd_type: str, body: dict, session: dict):
+    """
+    操作他人订单/商品的指令：取出归属（订单的买家或卖家、商品的发布者，走归属缓存），与会话用户比对，管理员放行
+    图片分片上传只在该 chunk_id 的首个分片时校验，后续分片沿用首个分片记录的商品ID
+    Returns:
+        None 表示放行，否则为拒绝响应
+    """
+    if session["role"] == "admin":
+        return None
+    if cmd_type == "IMAGE_UPLOAD" and body.get("chunk_id") in image_chunks:
+        if image_chunks[body["chunk_id"]]["uploader"] != session["user_id"]:
+            return {"code": 403, "msg": "无权操作他人的上传"}
+        return None
+    try:
+        if cmd_type == "ORDER_UPDATE" and body.get("order_id"):
+            parties = db_manager.get_order_parties(int(body["order_id"]))
+            if parties and session["user_id"] not in parties:
+                return {"code": 403, "msg": "无权操作他人的订单"}
+        elif cmd_type in ("GOODS_UPDATE_STATUS", "IMAGE_UPLOAD") and body.get("goods_id"):
+            owner = db_manager.get_goods_owner(int(body["goods_id"]))
+            if owner is not None and owner != session["user_id"]:
+                return {"code": 403, "msg": "无权修改他人的商品"}
+    except (TypeError, ValueError):
+        return {"code": 400, "msg": "订单ID或商品ID必须为整数"}
+    return None
+
 def push_message_to_client(user_id: int, cmd_type: str, data: dict):
     """向指定用户推送消息
     
@@ -112,6 +467,7 @@ def handle_client_request(client_socket, client_addr):
     对应任务清单：实现多线程处理 
     """
     print(f"[连接成功] 客户端 {client_addr} 已连接...")
+    session_token = None  # 本连接登录后绑定的会话令牌
     
     while True:
         try:
@@ -149,6 +505,28 @@ def handle_client_request(client_socket, client_addr):
                     client_socket.sendall(resp_header + resp_bytes)
                     continue
 
+                # 已登录连接：从会话解析身份和权限；会话被撤销或账号被封禁时要求重新登录
+                if session_token and cmd_type not in SESSION_EXEMPT_COMMANDS:
+                    session = db_manager.get_session(session_token)
+                    if session is None or body.get("token", session_token) != session_token:
+                        session_token = None
+                        send_response(client_socket, cmd_type, {"code": 401, "msg": "登录状态已失效，请重新登录"})
+                        continue
+                    if session["status"] != "active":
+                        session_token = None
+                        send_response(client_socket, cmd_type, {"code": 403, "msg": "账号已被封禁，请联系管理员"})
+                        continue
+                    denied = apply_session(cmd_type, body, session) or check_ownership(cmd_type, body, session)
+                    if denied:
+                        send_response(client_socket, cmd_type, denied)
+                        continue
+                elif cmd_type in ADMIN_COMMANDS:
+                    send_response(client_socket, cmd_type, {"code": 401, "msg": "请先登录管理员账号"})
+                    continue
+                elif cmd_type in OWNER_COMMANDS:
+                    send_response(client_socket, cmd_type, {"code": 401, "msg": "请先登录"})
+                    continue
+
                 # ================= 任务7：用户注册/登录/权限逻辑 =================
                 
                 if cmd_type == "REGISTER":
@@ -182,6 +560,19 @@ def handle_client_request(client_socket, client_addr):
                                 "msg": msg
                             }
                             
+                elif cmd_type == "USERNAME_CHECK":
+                    # 用户名可用性校验（注册表单实时校验）：优先由内存用户名索引判定，无法确定时查库
+                    username = body.get("username")
+                    if not username:
+                        response_data = {"code": 400, "msg": "缺少用户名"}
+                    else:
+                        available, source = db_manager.check_username(username)
+                        response_data = {
+                            "code": 200,
+                            "msg": "用户名可用" if available else "该用户名已被使用",
+                            "data": {"username": username, "available": available, "source": source}
+                        }
+
                 elif cmd_type == "LOGIN":
                     # 登录逻辑：校验用户名密码，返回用户ID和角色
                     # 1. 用户输入用户名和密码，点击"登录"
@@ -211,10 +602,15 @@ def handle_client_request(client_socket, client_addr):
                                     connected_clients[user_id] = client_socket
                                     print(f"[连接管理] 用户 {user_id} ({username}) 已登录，连接已记录")
                             
+                            # 签发会话令牌并绑定到本连接（同一连接重复登录时替换旧会话）
+                            if session_token:
+                                db_manager.sessions.revoke(session_token)
+                            session_token = db_manager.create_session(user_info)
+                            
                             response_data = {
                                 "code": 200,
                                 "msg": msg,
-                                "data": user_info  # 包含 user_id, role, username
+                                "data": dict(user_info, token=session_token)  # 包含 user_id, role, username, token
                             }
                         else:
                             # 失败：根据错误类型返回不同错误码
@@ -252,9 +648,24 @@ def handle_client_request(client_socket, client_addr):
                     user_id = body.get("user_id")
                     
                     if action == "LIST":
-                        # 查询所有用户
-                        users = db_manager.list_users()
-                        response_data = {"code": 200, "msg": "查询成功", "users": users}
+                        # 查询用户：默认按 user_id 倒序游标分页；stream=true 时分多帧返回全部符合条件的用户
+                        username_prefix = body.get("username_prefix")
+                        status = body.get("status")
+                        if body.get("stream"):
+                            stream_users(client_socket, cmd_type, username_prefix, status)
+                            response_data = None  # 已分帧发送
+                        else:
+                            limit = parse_page_size(body.get("limit"), USER_LIST_DEFAULT_LIMIT, USER_LIST_MAX_LIMIT)
+                            if limit is None:
+                                response_data = {"code": 400, "msg": "limit 必须为正整数"}
+                            else:
+                                users = db_manager.list_users(limit, body.get("after_id"), username_prefix, status)
+                                response_data = {
+                                    "code": 200,
+                                    "msg": "查询成功",
+                                    "users": users,
+                                    "next_after_id": users[-1]["user_id"] if len(users) >= limit else None
+                                }
                     elif action == "BLOCK":
                         # 封号
                         if not user_id:
@@ -316,24 +727,38 @@ def handle_client_request(client_socket, client_addr):
                 
                 elif cmd_type == "GOODS_GET":
                     # 获取商品列表：按分类/页码查询，返回商品元信息（含图片路径）
+                    # 传入 cursor 字段（首页传 "" 或 null）时使用游标分页，深翻页也是常数耗时
                     category = body.get("category")  # 可选
-                    page = body.get("page", 1)
-                    page_size = body.get("page_size", 20)
+                    # 页码和每页数量先转成整数：非法值返回 400，"2" 与 2 也不会在列表页缓存中分成两个键
+                    page = parse_page_size(body.get("page"), 1, sys.maxsize)
+                    page_size = parse_page_size(body.get("page_size"), GOODS_PAGE_DEFAULT_SIZE, GOODS_PAGE_MAX_SIZE)
                     status = body.get("status")  # 可选，如 'on_sale' 只查询在售商品
+                    cursor = (body.get("cursor") or "") if "cursor" in body else None
+                    # 游标分页默认不统计总数，可通过 with_total 显式要求
+                    with_total = bool(body.get("with_total", cursor is None))
                     
-                    print(f"[SERVER DEBUG] 收到查询商品列表请求: category={category}, page={page}")
+                    print(f"[SERVER DEBUG] 收到查询商品列表请求: category={category}, page={page}, cursor={cursor}")
                     
-                    success, msg, goods_list, total_count = db_manager.get_goods_list(
-                        category, page, page_size, status
-                    )
+                    if page is None or page_size is None:
+                        success, msg = False, "page 和 page_size 必须为正整数"
+                    else:
+                        success, msg, goods_list, total_count = db_manager.get_goods_list(
+                            category, page, page_size, status, cursor, with_total
+                        )
                     if success:
+                        # 满页时返回下一页游标（基于本页最后一条的 create_time, goods_id）
+                        next_cursor = None
+                        if goods_list and len(goods_list) >= page_size and goods_list[-1]["create_time"]:
+                            last = goods_list[-1]
+                            next_cursor = db_manager.encode_cursor(last["create_time"], last["goods_id"])
                         response_data = {
                             "code": 200,
                             "msg": msg,
                             "data": goods_list,
                             "total": total_count,
                             "page": page,
-                            "page_size": page_size
+                            "page_size": page_size,
+                            "next_cursor": next_cursor
                         }
                     else:
                         response_data = {"code": 400, "msg": msg}
@@ -366,8 +791,14 @@ def handle_client_request(client_socket, client_addr):
 
                     print(f"[SERVER DEBUG] 收到下单请求: buyer_id={buyer_id}, goods_id={goods_id}, quantity={quantity}")
 
-                    if not buyer_id or not goods_id:
-                        response_data = {"code": 400, "msg": "缺少买家或商品ID"}
+                    try:
+                        buyer_id = int(buyer_id) if buyer_id else None
+                        goods_id = int(goods_id) if goods_id else None
+                        quantity = int(quantity)
+                    except (TypeError, ValueError):
+                        buyer_id = goods_id = quantity = None
+                    if not buyer_id or not goods_id or quantity is None:
+                        response_data = {"code": 400, "msg": "缺少买家或商品ID，或ID、购买数量不是整数"}
                     else:
                         success, msg, order_id, order_no = db_manager.add_order(buyer_id, goods_id, quantity)
                         if success:
@@ -394,22 +825,38 @@ def handle_client_request(client_socket, client_addr):
                         response_data = {"code": 200 if success else 400, "msg": msg}
 
                 elif cmd_type == "ORDER_GET":
-                    # 获取我的订单：按用户ID和可选状态查询
-                    buyer_id = body.get("buyer_id")
+                    # 获取我的订单：按用户ID和可选状态查询；role=seller 时查询卖家收到的订单
+                    # 传入 cursor 字段（首页传 "" 或 null）时按 (created_at, order_id) 游标分页；count_only 只返回数量
+                    role = body.get("role") or "buyer"
+                    user_id = body.get("seller_id") if role == "seller" else body.get("buyer_id")
                     status = body.get("status")  # 可选
+                    cursor = (body.get("cursor") or "") if "cursor" in body else None
+                    page_size = parse_page_size(body.get("page_size"), ORDER_PAGE_DEFAULT_SIZE, ORDER_PAGE_MAX_SIZE)
 
-                    print(f"[SERVER DEBUG] 收到查询订单请求: buyer_id={buyer_id}, status={status}")
+                    print(f"[SERVER DEBUG] 收到查询订单请求: role={role}, user_id={user_id}, status={status}, cursor={cursor}")
 
                     try:
-                        if not buyer_id:
+                        if not user_id:
                             response_data = {"code": 400, "msg": "缺少用户ID"}
+                        elif page_size is None:
+                            response_data = {"code": 400, "msg": "page_size 必须为正整数"}
+                        elif body.get("count_only"):
+                            success, msg, counts = db_manager.count_orders(int(user_id), role, status)
+                            response_data = {"code": 200 if success else 400, "msg": msg, "data": counts}
                         else:
-                            # 确保 buyer_id 是整数类型
-                            buyer_id = int(buyer_id) if buyer_id else None
-                            success, msg, orders = db_manager.get_orders(buyer_id, status)
+                            # 确保 user_id 是整数类型
+                            user_id = int(user_id)
+                            success, msg, orders = db_manager.get_orders(user_id, status, role, cursor, page_size)
                             print(f"[SERVER DEBUG] 查询订单结果: success={success}, msg={msg}, orders数量={len(orders) if orders else 0}")
                             if success:
                                 response_data = {"code": 200, "msg": msg, "data": orders}
+                                if cursor is not None:
+                                    # 满页时返回下一页游标（基于本页最后一条的 created_at, order_id）
+                                    next_cursor = None
+                                    if len(orders) >= page_size and orders[-1]["created_at"]:
+                                        last = orders[-1]
+                                        next_cursor = db_manager.encode_cursor(last["created_at"], last["order_id"])
+                                    response_data["next_cursor"] = next_cursor
                             else:
                                 response_data = {"code": 400, "msg": msg}
                     except Exception as e:
@@ -432,64 +879,18 @@ def handle_client_request(client_socket, client_addr):
                     print(f"[SERVER DEBUG] 收到数据统计请求: user_id={user_id}")
 
                     try:
-                        # 1. 分类商品统计
-                        ok1, msg1, category_stats = db_manager.stat_category_goods()
-
-                        # 2. 用户订单状态统计（如果提供 user_id）
-                        user_order_stats = []
-                        if user_id:
-                            try:
-                                uid = int(user_id)
-                                ok2, msg2, user_order_stats = db_manager.stat_user_order_status(uid)
-                            except ValueError:
-                                user_order_stats = []
-
-                        # 3. 最近7天下单/成交趋势
-                        ok3, msg3, last7_trend = db_manager.stat_last_n_days_orders(7)
-
-                        # 4. 热门分类 TOP5（最近30天按成交量）
-                        ok4, msg4, hot_categories = db_manager.stat_hot_categories_top5(30)
-
-                        # 5. 用户偏好分类（购买次数）
-                        user_favorites = []
-                        if user_id:
-                            try:
-                                uid = int(user_id)
-                                ok5, msg5, user_favorites = db_manager.stat_user_favorite_categories(uid)
-                            except ValueError:
-                                user_favorites = []
-
-                        # 6. 最近7天成交量 + 简单预测（移动平均）
-                        ok6, msg6, last7_completed = db_manager.stat_last_n_days_completed(7)
-                        avg_completed = 0.0
-                        if last7_completed:
-                            total = sum(day["completed"] for day in last7_completed)
-                            avg_completed = total / len(last7_completed)
-
-                        # 构造下周7天的简单预测（使用固定平均值）
-                        next7_forecast = []
-                        today = datetime.now().date()
-                        for i in range(1, 8):
-                            day = today + timedelta(days=i)
-                            next7_forecast.append(
-                                {
-                                    "date": day.strftime("%Y-%m-%d"),
-                                    "predicted_completed": round(avg_completed, 2),
-                                }
-                            )
-
+                        # 各项统计互不依赖，并发执行；超时的部分返回空结果并在 timed_out 中列出
+                        stat_result = build_data_stat(user_id)
+                        partial = bool(stat_result["timed_out"] or stat_result["failed"])
                         response_data = {
                             "code": 200,
-                            "msg": "统计成功",
-                            "data": {
-                                "category_counts": category_stats if ok1 else [],
-                                "my_order_status_ratio": user_order_stats,
-                                "last7_trend": last7_trend if ok3 else [],
-                                "hot_categories": hot_categories if ok4 else [],
-                                "my_favorite_categories": user_favorites,
-                                "last7_completed_daily": last7_completed if ok6 else [],
-                                "next7_forecast": next7_forecast,
-                            },
+                            "msg": "部分统计未完成，返回部分结果" if partial else "统计成功",
+                            "data": stat_result["data"],
+                            "partial": partial,
+                            "timed_out": stat_result["timed_out"],
+                            "failed": stat_result["failed"],
+                            "timings": stat_result["timings"],
+                            "cached": stat_result["cached"],
                         }
                     except Exception as e:
                         print(f"[SERVER ERROR] DATA_STAT 处理异常: {e}")
@@ -508,17 +909,52 @@ def handle_client_request(client_socket, client_addr):
                         response_data = {"code": 200 if success else 400, "msg": msg}
 
                 elif cmd_type == "COLLECT_GET":
+                    # 传入 cursor 字段（首页传 "" 或 null）时按 (collected_at, collect_id) 游标分页，否则返回全部收藏
                     user_id = body.get("user_id")
-                    print(f"[SERVER DEBUG] 收到查询收藏请求: user_id={user_id}")
+                    cursor = (body.get("cursor") or "") if "cursor" in body else None
+                    page_size = parse_page_size(body.get("page_size"), COLLECT_PAGE_DEFAULT_SIZE, COLLECT_PAGE_MAX_SIZE)
+                    print(f"[SERVER DEBUG] 收到查询收藏请求: user_id={user_id}, cursor={cursor}")
                     if not user_id:
                         response_data = {"code": 400, "msg": "缺少用户ID"}
+                    elif page_size is None:
+                        response_data = {"code": 400, "msg": "page_size 必须为正整数"}
                     else:
-                        success, msg, collects = db_manager.get_collects(user_id)
+                        success, msg, collects = db_manager.get_collects(user_id, cursor, page_size)
                         if success:
                             response_data = {"code": 200, "msg": msg, "data": collects}
+                            if cursor is not None:
+                                next_cursor = None
+                                if len(collects) >= page_size and collects[-1]["collected_at"]:
+                                    last = collects[-1]
+                                    next_cursor = db_manager.encode_cursor(last["collected_at"], last["collect_id"])
+                                response_data["next_cursor"] = next_cursor
                         else:
                             response_data = {"code": 400, "msg": msg}
 
+                elif cmd_type == "COLLECT_CHECK":
+                    # 批量判断是否已收藏（列表页收藏图标）：由内存中的用户收藏集合回答，不再拉取整个收藏列表
+                    user_id = body.get("user_id")
+                    goods_ids = body.get("goods_ids")
+                    print(f"[SERVER DEBUG] 收到收藏状态查询请求: user_id={user_id}, 商品数={len(goods_ids) if isinstance(goods_ids, list) else 0}")
+                    if not user_id or not isinstance(goods_ids, list):
+                        response_data = {"code": 400, "msg": "缺少用户ID或商品ID列表"}
+                    elif len(goods_ids) > COLLECT_CHECK_MAX_IDS:
+                        response_data = {"code": 400, "msg": f"单次最多查询 {COLLECT_CHECK_MAX_IDS} 个商品"}
+                    else:
+                        try:
+                            user_id = int(user_id)
+                            goods_ids = [int(goods_id) for goods_id in goods_ids]
+                        except (TypeError, ValueError):
+                            response_data = {"code": 400, "msg": "用户ID和商品ID必须为整数"}
+                        else:
+                            success, msg, collected = db_manager.check_collected(user_id, goods_ids)
+                            if success:
+                                # JSON 对象的键为字符串：{"商品ID": true/false}
+                                response_data = {"code": 200, "msg": msg,
+                                                 "data": {str(goods_id): flag for goods_id, flag in collected.items()}}
+                            else:
+                                response_data = {"code": 500, "msg": msg}
+
                 elif cmd_type == "COLLECT_DEL":
                     user_id = body.get("user_id")
                     goods_id = body.get("goods_id")
@@ -540,16 +976,13 @@ def handle_client_request(client_socket, client_addr):
                     if not sender_id or not receiver_id or not content:
                         response_data = {"code": 400, "msg": "缺少发送者ID、接收者ID或消息内容"}
                     else:
-                        # 保存消息到数据库
-                        success, msg, message_id = db_manager.send_chat_message(sender_id, receiver_id, content)
+                        # 保存消息到数据库（组提交），返回的消息详情由写入数据直接构造，无需回查
+                        success, msg, message_data = db_manager.post_chat_message(sender_id, receiver_id, content)
                         if success:
-                            # 查询刚发送的消息详情（包含发送时间等）
-                            message_data = db_manager.get_chat_message_by_id(message_id)
-                            
                             response_data = {
                                 "code": 200,
                                 "msg": msg,
-                                "message_id": message_id,
+                                "message_id": message_data["message_id"],
                                 "message": message_data
                             }
                             
@@ -573,13 +1006,18 @@ def handle_client_request(client_socket, client_addr):
                     other_user_id = body.get("other_user_id")
                     limit = body.get("limit", 50)
                     offset = body.get("offset", 0)
+                    # 传入 before_id（首屏传 null 或 0）或 after_id 时使用游标分页，按新到旧返回
+                    before_id = (body.get("before_id") or 0) if "before_id" in body else None
+                    after_id = body.get("after_id")
                     
-                    print(f"[SERVER DEBUG] 收到获取聊天记录请求: user_id={user_id}, other_user_id={other_user_id}")
+                    print(f"[SERVER DEBUG] 收到获取聊天记录请求: user_id={user_id}, other_user_id={other_user_id}, before_id={before_id}, after_id={after_id}")
                     
                     if not user_id or not other_user_id:
                         response_data = {"code": 400, "msg": "缺少用户ID或对方用户ID"}
                     else:
-                        success, msg, messages = db_manager.get_chat_history(user_id, other_user_id, limit, offset)
+                        success, msg, messages = db_manager.get_chat_history(
+                            user_id, other_user_id, limit, offset, before_id, after_id
+                        )
                         if success:
                             response_data = {
                                 "code": 200,
@@ -587,9 +1025,57 @@ def handle_client_request(client_socket, client_addr):
                                 "data": messages,
                                 "total": len(messages)
                             }
+                            if before_id is not None or after_id is not None:
+                                # 向前翻页游标：本页最早一条的ID，不足一页说明已到最早的消息
+                                response_data["next_before_id"] = (
+                                    messages[-1]["message_id"] if before_id is not None and len(messages) >= limit else None
+                                )
+                                # 拉取新消息游标：本页最新一条的ID
+                                response_data["newest_id"] = messages[0]["message_id"] if messages else after_id
+                        else:
+                            response_data = {"code": 400, "msg": msg}
+
+                elif cmd_type == "CHAT_CONVERSATIONS":
+                    # 会话列表：每个对话的最后一条消息与未读数，来自会话汇总表的一次索引查询
+                    user_id = body.get("user_id")
+                    limit = body.get("limit", 50)
+                    before_message_id = body.get("before_message_id")
+                    
+                    if not user_id:
+                        response_data = {"code": 400, "msg": "缺少用户ID"}
+                    else:
+                        success, msg, conversations = db_manager.get_conversations(user_id, limit, before_message_id)
+                        if success:
+                            response_data = {
+                                "code": 200,
+                                "msg": msg,
+                                "data": conversations,
+                                "unread_total": sum(c["unread_count"] for c in conversations),
+                                "next_before_message_id": (
+                                    conversations[-1]["last_message_id"] if len(conversations) >= limit else None
+                                )
+                            }
                         else:
                             response_data = {"code": 400, "msg": msg}
 
+                elif cmd_type == "CHAT_READ":
+                    # 标记会话已读：已读到 last_message_id，此后收到的消息仍计为未读
+                    user_id = body.get("user_id")
+                    other_user_id = body.get("other_user_id")
+                    last_message_id = body.get("last_message_id")
+                    
+                    if not user_id or not other_user_id:
+                        response_data = {"code": 400, "msg": "缺少用户ID或对方用户ID"}
+                    else:
+                        try:
+                            user_id, other_user_id = int(user_id), int(other_user_id)
+                            last_message_id = int(last_message_id) if last_message_id is not None else None
+                        except (TypeError, ValueError):
+                            response_data = {"code": 400, "msg": "用户ID和消息ID必须为整数"}
+                        else:
+                            success, msg = db_manager.mark_conversation_read(user_id, other_user_id, last_message_id)
+                            response_data = {"code": 200 if success else 400, "msg": msg}
+
                 elif cmd_type == "GOODS_UPDATE_STATUS":
                     # 更新商品状态（不推荐使用，商品状态应由订单流程自动管理）
                     # 此指令主要用于兼容性，建议通过订单流程来管理商品状态
@@ -635,7 +1121,10 @@ def handle_client_request(client_socket, client_addr):
                                 image_chunks[chunk_id] = {
                                     "chunks": [None] * total_chunks,
                                     "total_size": 0,
-                                    "filename": filename or f"image_{chunk_id}.jpg"
+                                    "filename": filename or f"image_{chunk_id}.jpg",
+                                    # 归属只在首个分片时校验，完成时使用这里记录的商品ID，忽略后续分片携带的值
+                                    "goods_id": goods_id,
+                                    "uploader": session["user_id"]
                                 }
                             
                             # 存储分片
@@ -650,37 +1139,27 @@ def handle_client_request(client_socket, client_addr):
                                 print(f"[SERVER DEBUG] 所有分片已接收，开始拼接图片: chunk_id={chunk_id}")
                                 full_image = b"".join(image_chunks[chunk_id]["chunks"])
                                 
-                                # 生成保存路径
-                                timestamp = int(datetime.now().timestamp())
+                                # 按内容哈希分层保存（ab/cd/<hash>.jpg），避免单目录文件过多
                                 safe_filename = os.path.basename(image_chunks[chunk_id]["filename"])
-                                save_filename = f"{timestamp}_{safe_filename}"
-                                save_path = os.path.join(IMAGES_DIR, save_filename)
-                                
-                                # 保存图片
-                                with open(save_path, "wb") as f:
-                                    f.write(full_image)
+                                ext = os.path.splitext(safe_filename)[1] or ".jpg"
+                                shard_path = save_image_sharded(IMAGES_DIR, full_image, ext)
+                                save_path = os.path.join(IMAGES_DIR, *shard_path.split("/"))
                                 
                                 # 相对路径（用于数据库存储）
-                                relative_path = f"{IMAGES_DIR}/{save_filename}"
+                                relative_path = f"{IMAGES_DIR}/{shard_path}"
                                 
                                 # 如果提供了goods_id，自动添加到商品图片表
+                                goods_id = image_chunks[chunk_id]["goods_id"]
                                 if goods_id:
                                     try:
                                         gid_int = int(goods_id)
                                     except Exception:
                                         gid_int = goods_id
+                                    # 主图会同时更新 goods 表的 img_path（兼容旧字段），提交后再失效列表页缓存
                                     db_manager.add_goods_image(gid_int, relative_path, display_order, is_primary)
-                                    # 如果是主图，顺便更新 goods 表的 img_path，便于兼容旧字段
-                                    if is_primary:
-                                        try:
-                                            conn_tmp = db_manager._get_conn()
-                                            if conn_tmp:
-                                                with conn_tmp.cursor() as cur_tmp:
-                                                    cur_tmp.execute("UPDATE goods SET img_path=%s WHERE goods_id=%s", (relative_path, gid_int))
-                                                conn_tmp.close()
-                                        except Exception as e:
-                                            print(f"[SERVER WARN] 更新主图到 goods.img_path 失败: {e}")
-                                
+                                    # 商品图片已变化，清理该商品的热点图片缓存
+                                    image_cache.invalidate_goods(gid_int)
+
                                 # 清理分片数据
                                 del image_chunks[chunk_id]
                                 
@@ -708,19 +1187,83 @@ def handle_client_request(client_socket, client_addr):
                             # 清理失败的分片数据
                             if chunk_id in image_chunks:
                                 del image_chunks[chunk_id]
-                        
+
+                elif cmd_type == "IMAGE_GET":
+                    # 获取图片：按图片路径或商品ID（取主图）读取，热点图片走内存缓存
+                    img_path = body.get("img_path")
+                    goods_id = body.get("goods_id")
+                    thumbnail = bool(body.get("thumbnail", 0))
+
+                    print(f"[SERVER DEBUG] 收到获取图片请求: img_path={img_path}, goods_id={goods_id}, thumbnail={thumbnail}")
+
+                    if not img_path and not goods_id:
+                        response_data = {"code": 400, "msg": "缺少图片路径或商品ID"}
+                    else:
+                        try:
+                            gid_int = int(goods_id) if goods_id else None
+                            variant = "thumb" if thumbnail else "full"
+                            image_data = None
+                            if not img_path:
+                                # 按商品取主图：命中缓存时连主图路径查询也省掉
+                                cached = image_cache.get_primary(gid_int, variant)
+                                if cached:
+                                    img_path, image_data = cached
+                                else:
+                                    img_path = db_manager.get_goods_primary_image(gid_int)
+                                    if img_path:
+                                        image_data = load_image(img_path, thumbnail, gid_int, primary=True)
+                            else:
+                                image_data = load_image(img_path, thumbnail, gid_int)
+
+                            if image_data is None:
+                                response_data = {"code": 404, "msg": "图片不存在"}
+                            else:
+                                response_data = {
+                                    "code": 200,
+                                    "msg": "获取成功",
+                                    "img_path": img_path,
+                                    "thumbnail": thumbnail,
+                                    "size": len(image_data),
+                                    "image_data": base64.b64encode(image_data).decode("ascii")
+                                }
+                        except Exception as e:
+                            print(f"[SERVER ERROR] 读取图片失败: {e}")
+                            response_data = {"code": 500, "msg": f"读取图片失败: {str(e)}"}
+
+                elif cmd_type == "CACHE_STATS":
+                    # 缓存指标：命中率、容量等，便于观察大促期间热点缓存效果
+                    response_data = {
+                        "code": 200,
+                        "msg": "查询成功",
+                        "data": {
+                            "image_cache": image_cache.stats(),
+                            "goods_counts": db_manager.goods_counts.stats(),
+                            "goods_list_cache": db_manager.goods_list_cache.stats(),
+                            "chat_writer": db_manager.chat_writer.stats(),
+                            "stat_global_cache": db_manager.stat_global_cache.stats(),
+                            "stat_user_cache": db_manager.stat_user_cache.stats(),
+                            "usernames": db_manager.usernames.stats(),
+                            "sessions": db_manager.sessions.stats(),
+                            "stock_reservations": db_manager.stock.stats(),
+                            "order_writer": db_manager.order_writer.stats(),
+                            "concurrency": db_manager.concurrency.stats(),
+                            "order_expiry": order_expiry.stats(),
+                            "demand_forecaster": demand_forecaster.stats(),
+                            "collected_cache": db_manager.collected.stats(),
+                            "order_ids": db_manager.order_ids.stats(),
+                        }
+                    }
+
                 else:
                     # 未知指令
                     response_data = {"code": 404, "msg": f"未知指令: {cmd_type}"}
 
-                # 4. 回包同样加长度头（转换 Decimal 和 datetime 类型）
+                # 4. 回包同样加长度头（转换 Decimal 和 datetime 类型）；流式指令已自行分帧发送
+                if response_data is None:
+                    continue
                 try:
-                    response_data = json_serialize(response_data)
-                    response_str = f"{cmd_type}|{json.dumps(response_data, ensure_ascii=False)}"
-                    resp_bytes = response_str.encode("utf-8")
-                    resp_header = len(resp_bytes).to_bytes(HEADER_SIZE, "big")
-                    client_socket.sendall(resp_header + resp_bytes)
-                    print(f"[SERVER DEBUG] 已发送响应: {cmd_type}, 响应长度={len(resp_bytes)}")
+                    resp_len = send_response(client_socket, cmd_type, response_data)
+                    print(f"[SERVER DEBUG] 已发送响应: {cmd_type}, 响应长度={resp_len}")
                 except Exception as e:
                     print(f"[SERVER ERROR] 发送响应失败: {e}")
                     import traceback
@@ -758,6 +1301,9 @@ def handle_client_request(client_socket, client_addr):
         if user_id_to_remove:
             del connected_clients[user_id_to_remove]
             print(f"[连接管理] 用户 {user_id_to_remove} 已断开连接，已清理映射")
+    # 会话随连接结束而撤销
+    if session_token:
+        db_manager.sessions.revoke(session_token)
     
     client_socket.close()
 
@@ -802,6 +1348,9 @@ def start_server():
         print(f"服务器启动失败: {e}")
     finally:
         server.close()
+        db_manager.chat_writer.stop()
+        db_manager.order_writer.stop()
+        db_manager.order_ids.release()
 
 if __name__ == '__main__':
     start_server()
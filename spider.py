@@ -14,7 +14,9 @@ from urllib.parse import urljoin, urlparse
 import pymysql
 from datetime import datetime, timedelta
 import hashlib
+import io
 from PIL import Image, ImageDraw, ImageFont
+from image_storage import save_image_sharded
 
 
 class ProductSpider:
@@ -24,7 +26,7 @@ class ProductSpider:
         """
         初始化爬虫
         :param db_config: 数据库配置字典
-        :param image_dir: 图片存储目录
+        :param image_dir: 图片存储目录（按哈希前缀分层：ab/cd/<hash>.jpg）
         """
         self.db_config = db_config or {
             'host': '127.0.0.1',
@@ -83,16 +85,12 @@ class ProductSpider:
             parsed = urlparse(image_url)
             ext = os.path.splitext(parsed.path)[1] or '.jpg'
             
-            # 生成文件名
-            filename = f"goods_{product_id}_{index}{ext}"
-            filepath = os.path.join(self.image_dir, filename)
-            
-            # 下载图片
+            # 下载图片，按内容哈希分层保存（ab/cd/<hash>.jpg），避免单目录文件过多
             response = self.session.get(image_url, timeout=10)
             if response.status_code == 200:
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
-                print(f"  图片下载成功: {filename}")
+                shard_path = save_image_sharded(self.image_dir, response.content, ext)
+                filepath = os.path.join(self.image_dir, *shard_path.split('/'))
+                print(f"  图片下载成功: {shard_path} (商品 {product_id}, 第 {index} 张)")
                 return filepath
             else:
                 print(f"  图片下载失败: {image_url} (状态码: {response.status_code})")
@@ -480,16 +478,16 @@ class MockSpider(ProductSpider):
             # 绘制文字
             draw.text(position, text, fill=(150, 150, 150), font=font)
             
-            # 保存图片（使用绝对路径保存文件）
-            filename = f"goods_{product_id}_0.jpg"
-            filepath = os.path.join(self.image_dir, filename)
-            img.save(filepath, 'JPEG', quality=85)
+            # 编码为 JPEG 后按内容哈希分层保存（ab/cd/<hash>.jpg）
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=85)
+            shard_path = save_image_sharded(self.image_dir, buffer.getvalue(), '.jpg')
             
             # 返回相对路径（相对于项目根目录），便于前端访问
             # 假设images目录在项目根目录下
-            relative_path = f"images/{filename}"
+            relative_path = f"images/{shard_path}"
             
-            print(f"  生成占位图片: {filename}")
+            print(f"  生成占位图片: {shard_path} (商品 {product_id})")
             return [relative_path]
             
         except Exception as e:
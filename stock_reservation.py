@@ -0,0 +1,194 @@
+"""
+库存预占模块（热点商品秒杀）
+每个商品在内存中维护一个库存计数：下单请求先在内存中原子地预占库存，
+库存不足或商品不在售时直接拒绝，不再进入数据库排队争抢商品行锁；
+只有预占成功的请求才交给订单写入器批量落库，落库后确认或释放预占
+
+其它进程（其它服务器取消订单、超时订单清理、直接修改数据库）对库存的修改不会通知本进程，
+因此拒绝时若内存库存已加载超过 refresh_after 秒，先重新加载再判断，避免长期误拒
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _GoodsStock:
+    """单个商品的库存状态（由 StockReservations 加锁访问）"""
+
+    __slots__ = ("lock", "stock", "on_sale", "pending", "loaded_at", "generation")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stock: Optional[int] = None  # 数据库中的已提交库存，None 表示尚未加载
+        self.on_sale = False
+        self.pending = 0                  # 已预占、尚未落库的数量
+        self.loaded_at = 0.0              # 最近一次从数据库加载的时间
+        self.generation = 0               # 加载代次，每次从数据库加载后加一
+
+
+class StockReservations:
+    """
+    商品库存预占表
+    可用库存 = 已提交库存 - 已预占未落库数量；数据库写入仍带库存条件，内存计数只用于提前拒绝
+    """
+
+    def __init__(self, loader: Callable[[int], Optional[Dict[str, Any]]], refresh_after: float = 3.0,
+                 max_goods: int = 10000):
+        """
+        Args:
+            loader: 按商品ID读取 {status, stock_quantity}，商品不存在返回 None，数据库不可用时抛出异常
+            refresh_after: 内存库存加载超过该秒数后，拒绝前先重新加载
+            max_goods: 最多保留的商品数，超出后淘汰最近最少使用且没有未落库预占的商品
+        """
+        self.loader = loader
+        self.refresh_after = refresh_after
+        self.max_goods = max_goods
+        self._goods: "OrderedDict[int, _GoodsStock]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _entry(self, goods_id: int) -> _GoodsStock:
+        with self._lock:
+            entry = self._goods.get(goods_id)
+            if entry is not None:
+                self._goods.move_to_end(goods_id)
+                return entry
+            entry = self._goods[goods_id] = _GoodsStock()
+            if len(self._goods) > self.max_goods:
+                self._evict()
+            return entry
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的空闲商品（调用方需持有 self._lock）
+        有未落库预占或正被使用的商品不淘汰，被淘汰的商品下次访问时重新加载
+        """
+        for goods_id in list(self._goods)[:-1]:
+            if len(self._goods) <= self.max_goods:
+                break
+            entry = self._goods[goods_id]
+            if entry.pending == 0 and not entry.lock.locked():
+                del self._goods[goods_id]
+                self.evictions += 1
+
+    def _load(self, goods_id: int, entry: _GoodsStock) -> bool:
+        """从数据库加载库存（调用方需持有 entry.lock），商品不存在返回 False"""
+        goods = self.loader(goods_id)
+        with self._stats_lock:
+            self.loads += 1
+        entry.loaded_at = time.monotonic()
+        entry.generation += 1
+        if not goods:
+            entry.stock = None
+            return False
+        entry.stock = int(goods["stock_quantity"])
+        entry.on_sale = goods["status"] == "on_sale"
+        return True
+
+    @staticmethod
+    def _admit(entry: _GoodsStock, quantity: int) -> Optional[str]:
+        """按内存库存判断是否可预占，可预占返回 None，否则返回拒绝原因"""
+        if not entry.on_sale:
+            return "商品不可下单（非在售状态）"
+        available = entry.stock - entry.pending
+        if available < quantity:
+            return f"库存不足，当前库存：{max(0, available)}，需要：{quantity}"
+        return None
+
+    def _count(self, admitted: bool) -> None:
+        with self._stats_lock:
+            if admitted:
+                self.admitted += 1
+            else:
+                self.rejected += 1
+
+    def reserve(self, goods_id: int, quantity: int) -> Tuple[bool, str, int]:
+        """
+        预占库存；同一商品首次预占时从数据库加载库存（其余请求在该商品的锁上等待这一次加载）
+        按内存库存应拒绝、但内存库存已加载超过 refresh_after 秒时，先重新加载再判断
+        Returns:
+            (success, message, generation)：generation 为预占时的加载代次，确认时传回
+        """
+        entry = self._entry(goods_id)
+        with entry.lock:
+            if entry.stock is None and not self._load(goods_id, entry):
+                self._count(False)
+                return False, "商品不存在", entry.generation
+
+            reason = self._admit(entry, quantity)
+            if reason and time.monotonic() - entry.loaded_at >= self.refresh_after:
+                # 库存可能已被其它进程恢复（取消订单、超时清理等），重新加载后再判断
+                if not self._load(goods_id, entry):
+                    self._count(False)
+                    return False, "商品不存在", entry.generation
+                reason = self._admit(entry, quantity)
+            if reason:
+                self._count(False)
+                return False, reason, entry.generation
+            entry.pending += quantity
+            generation = entry.generation
+        self._count(True)
+        return True, "库存预占成功", generation
+
+    def confirm(self, goods_id: int, quantity: int, generation: int) -> None:
+        """
+        订单已落库：预占转为已提交扣减
+        Args:
+            generation: reserve 返回的加载代次；预占之后内存库存已重新加载过时，
+                        无法判断新加载的库存是否已包含本订单，不再扣减而是在下次预占时重新加载
+        """
+        entry = self._entry(goods_id)
+        with entry.lock:
+            entry.pending = max(0, entry.pending - quantity)
+            if entry.stock is None:
+                return
+            if entry.generation != generation:
+                entry.stock = None
+                return
+            entry.stock -= quantity
+            if entry.stock <= 0:
+                entry.on_sale = False  # 库存为 0 时商品置为已售出
+
+    def release(self, goods_id: int, quantity: int, reload: bool = False) -> None:
+        """
+        订单未能落库：释放预占
+        Args:
+            reload: 数据库拒绝了内存已放行的订单（内存状态过期），下次预占时重新加载
+        """
+        entry = self._entry(goods_id)
+        with entry.lock:
+            entry.pending = max(0, entry.pending - quantity)
+            if reload:
+                entry.stock = None
+
+    def restock(self, goods_id: int, quantity: int, goods_status: str) -> None:
+        """订单取消、库存已在数据库中恢复后调用，同步内存库存和在售状态"""
+        entry = self._entry(goods_id)
+        with entry.lock:
+            if entry.stock is not None:
+                entry.stock += quantity
+                entry.on_sale = goods_status == "on_sale"
+
+    def invalidate(self, goods_id: int) -> None:
+        """商品状态在订单之外被修改（审核、上下架）：丢弃内存库存，下次预占时重新加载"""
+        entry = self._entry(goods_id)
+        with entry.lock:
+            entry.stock = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._goods.values())
+        with self._stats_lock:
+            return {
+                "goods": len(entries),
+                "pending": sum(entry.pending for entry in entries),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -42,6 +42,10 @@ CREATE TABLE `goods` (
   PRIMARY KEY (`goods_id`),
   INDEX `idx_category` (`category`),
   INDEX `idx_brand` (`brand`),
+  -- 商品列表：按状态/分类筛选并按发布时间倒序（见 add_access_pattern_indexes.sql）
+  INDEX `idx_status_create` (`status`, `create_time`, `goods_id`),
+  INDEX `idx_category_status_create` (`category`, `status`, `create_time`, `goods_id`),
+  INDEX `idx_create` (`create_time`, `goods_id`),
   -- 关联到 user 表
   FOREIGN KEY (`user_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='商品表';
@@ -72,6 +76,8 @@ CREATE TABLE `collect` (
   PRIMARY KEY (`collect_id`),
   -- 复合唯一索引，防止重复收藏
   UNIQUE KEY `uk_user_goods` (`user_id`, `goods_id`),
+  -- 我的收藏按收藏时间倒序（游标分页）
+  INDEX `idx_user_collected` (`user_id`, `collected_at`),
   -- 关联到 user 表
   FOREIGN KEY (`user_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE,
   -- 关联到 goods 表
@@ -100,6 +106,16 @@ CREATE TABLE `order` (
   INDEX `idx_order_no` (`order_no`),
   INDEX `idx_buyer` (`buyer_id`),
   INDEX `idx_seller` (`seller_id`),
+  -- 我的订单与统计查询（见 add_access_pattern_indexes.sql）
+  INDEX `idx_buyer_status_created` (`buyer_id`, `status`, `created_at`),
+  INDEX `idx_buyer_created` (`buyer_id`, `created_at`),
+  INDEX `idx_status_completed` (`status`, `completed_at`),
+  INDEX `idx_created` (`created_at`),
+  -- 待付款订单超时取消（见 add_order_expiry_index.sql）
+  INDEX `idx_status_created` (`status`, `created_at`, `order_id`),
+  -- 卖家订单查询与计数（见 add_seller_order_indexes.sql）
+  INDEX `idx_seller_status_created` (`seller_id`, `status`, `created_at`),
+  INDEX `idx_seller_created` (`seller_id`, `created_at`),
   -- 关联到 user 表 (买家)
   FOREIGN KEY (`buyer_id`) REFERENCES `user`(`user_id`) ON DELETE RESTRICT,
   -- 关联到 user 表 (卖家)
@@ -114,16 +130,36 @@ CREATE TABLE `chat` (
   `message_id` INT NOT NULL AUTO_INCREMENT COMMENT '消息ID（主键）',
   `sender_id` INT NOT NULL COMMENT '发送者用户ID（外键）',
   `receiver_id` INT NOT NULL COMMENT '接收者用户ID（外键）',
+  `pair_key` BIGINT NOT NULL DEFAULT 0 COMMENT '会话键：(较小用户ID << 32) | 较大用户ID',
   `content` TEXT NOT NULL COMMENT '消息内容',
   `sent_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '发送时间',
   PRIMARY KEY (`message_id`),
   INDEX `idx_sender_receiver` (`sender_id`, `receiver_id`),
+  -- 会话内按消息ID游标分页（见 add_chat_pair_key.sql）
+  INDEX `idx_pair_message` (`pair_key`, `message_id`),
   -- 关联到 user 表 (发送者)
   FOREIGN KEY (`sender_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE,
   -- 关联到 user 表 (接收者)
   FOREIGN KEY (`receiver_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='聊天记录表';
 
+-- 6.1. 聊天会话汇总表 (chat_conversation)
+-- 每个用户的每个会话一行（双方各一行），发送消息时在同一事务中更新，用于会话列表与未读数
+CREATE TABLE `chat_conversation` (
+  `user_id` INT NOT NULL COMMENT '会话所属用户ID',
+  `peer_id` INT NOT NULL COMMENT '对方用户ID',
+  `last_message_id` INT NOT NULL COMMENT '最后一条消息ID',
+  `last_content` VARCHAR(255) NOT NULL DEFAULT '' COMMENT '最后一条消息内容摘要',
+  `last_sender_id` INT NOT NULL COMMENT '最后一条消息的发送者',
+  `last_time` TIMESTAMP NULL DEFAULT NULL COMMENT '最后一条消息时间',
+  `unread_count` INT NOT NULL DEFAULT 0 COMMENT '该用户在此会话中的未读消息数',
+  PRIMARY KEY (`user_id`, `peer_id`),
+  -- 会话列表按最后消息倒序
+  INDEX `idx_user_last_message` (`user_id`, `last_message_id`),
+  FOREIGN KEY (`user_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE,
+  FOREIGN KEY (`peer_id`) REFERENCES `user`(`user_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='聊天会话汇总表';
+
 -- 7. 日志表 (log)
 -- 记录系统关键操作，例如管理员操作、异常记录
 CREATE TABLE `log` (
@@ -137,3 +173,58 @@ CREATE TABLE `log` (
   INDEX `idx_log_time` (`log_time`),
   FOREIGN KEY (`user_id`) REFERENCES `user`(`user_id`) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='系统日志表';
+
+-- 8. 统计汇总表（DATA_STAT）
+-- 由订单写路径在同一事务中增量维护，统计查询只读这些小表（见 add_stat_rollups.sql）
+-- stat_daily_orders 每天分多个分片行（slot），写入随机分片、读取按天求和，避免当天一行成为全局锁热点
+CREATE TABLE `stat_daily_orders` (
+  `stat_date` DATE NOT NULL COMMENT '统计日期',
+  `slot` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '分片号（按天求和）',
+  `orders` INT NOT NULL DEFAULT 0 COMMENT '当天下单数',
+  `completed` INT NOT NULL DEFAULT 0 COMMENT '当天成交数（按完成时间）',
+  PRIMARY KEY (`stat_date`, `slot`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日订单汇总表';
+
+CREATE TABLE `stat_daily_category_completed` (
+  `stat_date` DATE NOT NULL COMMENT '统计日期（完成时间）',
+  `category` VARCHAR(50) NOT NULL COMMENT '商品分类',
+  `completed` INT NOT NULL DEFAULT 0 COMMENT '当天该分类成交数',
+  PRIMARY KEY (`stat_date`, `category`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日分类成交汇总表';
+
+CREATE TABLE `stat_user_category` (
+  `buyer_id` INT NOT NULL COMMENT '买家用户ID',
+  `category` VARCHAR(50) NOT NULL COMMENT '商品分类',
+  `completed_count` INT NOT NULL DEFAULT 0 COMMENT '该买家在该分类的成交订单数',
+  PRIMARY KEY (`buyer_id`, `category`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='用户分类成交汇总表';
+
+-- 9. 订单号节点租约表 (id_node_lease)
+-- 每个服务进程启动后租用一个节点号并定期续约，同时登记已使用的时间戳上界（见 id_generator.NodeLease）
+CREATE TABLE `id_node_lease` (
+  `node_id` SMALLINT UNSIGNED NOT NULL COMMENT '订单号节点号（0~1023）',
+  `owner` VARCHAR(100) NOT NULL COMMENT '持有者（主机名:进程号:随机串）',
+  `reserved_ms` BIGINT NOT NULL DEFAULT 0 COMMENT '该节点已登记可使用的时间戳上界（Unix 毫秒）',
+  `heartbeat_at` DATETIME(3) NOT NULL COMMENT '最近一次续约时间',
+  PRIMARY KEY (`node_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='订单号节点租约表';
+
+-- 10. 迁移版本记录表 (schema_migrations)
+-- 记录已执行的增量迁移脚本；全新建库已包含以下版本的全部结构
+CREATE TABLE `schema_migrations` (
+  `version` VARCHAR(20) NOT NULL COMMENT '迁移版本号',
+  `description` VARCHAR(255) NOT NULL COMMENT '迁移说明',
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间',
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='数据库迁移版本记录表';
+
+INSERT INTO `schema_migrations` (`version`, `description`) VALUES
+  ('002', '按访问模式添加商品、订单复合索引'),
+  ('003', '聊天记录增加会话键 pair_key 及 (pair_key, message_id) 索引'),
+  ('004', '新增聊天会话汇总表 chat_conversation'),
+  ('005', '新增 DATA_STAT 统计汇总表'),
+  ('006', '订单增加 (status, created_at) 索引，用于待付款订单超时取消'),
+  ('007', '订单增加卖家维度 (seller_id, status, created_at) 等索引'),
+  ('008', '收藏表增加 (user_id, collected_at) 索引'),
+  ('009', '每日订单汇总表按 (stat_date, slot) 分片'),
+  ('010', '新增订单号节点租约表 id_node_lease');